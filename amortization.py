@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""住宅ローンの返済予定表（元利均等）
+
+残高は閉形式 B_k = B_0 (1+r)^k - P ((1+r)^k - 1) / r で全期間をまとめて求める。
+金利の変更・繰上返済・借り換えがあれば、その時点で区間を分けて同じ式を使う
+（Python のループは区間の数だけで、期間数・ローン本数には比例しない）。
+元本・金利・年数は配列で渡せ、ローン本数 × 期間 の予定表をまとめて作る。
+"""
+import numpy as np
+import pandas as pd
+
+PREPAY_TYPES = ("shorten", "reduce")  # 期間短縮型 / 返済額軽減型
+_SCHEDULE_KEYS = ("balance", "interest", "principal", "payment", "prepaid")
+
+
+def annuity_payment(principal, annual_rate_pct, years, periods_per_year: int = 1):
+    """元利均等の毎回の返済額（periods_per_year=12 で月額）"""
+    r = np.asarray(annual_rate_pct, dtype=float) / 100.0 / periods_per_year
+    n = np.floor(np.asarray(years, dtype=float)) * periods_per_year
+    return _payment(np.asarray(principal, dtype=float), r, n)
+
+def _payment(principal, r, n):
+    """1 期あたりの利率 r・残り n 期の元利均等返済額"""
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        g = (1 + r) ** n
+        pay = np.where(r == 0, principal / n, principal * (r * g) / (g - 1))
+    return np.where((principal <= 0) | (n <= 0), 0.0, pay)
+
+def remaining_balance(principal, r, payment, k):
+    """1 期あたりの利率 r・返済額 payment で k 回返済した後の残高（閉形式）"""
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        g = (1 + r) ** k
+        return np.where(r == 0, principal - payment * k, principal * g - payment * (g - 1) / r)
+
+def _periods_needed(balance, r, payment):
+    """返済額を据え置いたときに残高を返し切る期数（期間短縮型の繰上返済用）"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = 1 - balance * r / payment
+        n = np.where(r == 0, balance / payment, -np.log(ratio) / np.log1p(r))
+    n = np.where((balance <= 0) | (payment <= 0), 0.0, n)
+    return np.ceil(n - 1e-9)
+
+def schedule(principal, annual_rate_pct, years, periods_per_year: int = 1,
+             rate_steps=(), prepayments=(), refinances=(), prepay_type: str = "shorten") -> dict:
+    """返済予定表を作る
+
+    principal / annual_rate_pct / years : スカラーまたは (ローン本数,) の配列
+    rate_steps  : [(年, 年利%)]           その年の初めから金利が変わり、残り期間で返済額を再計算
+    prepayments : [(年, 金額)]             その年の返済後に繰上返済（prepay_type: shorten / reduce）
+    refinances  : [(年, 年利%, 新しい年数)] その年の返済後に借り換え（残高を新しい条件で組み直す）
+    年は返済開始からの 1 始まり。イベントの金額・金利は (ローン本数,) の配列でもよい。
+
+    戻り値は "balance"（各期の返済後残高）, "interest", "principal", "payment",
+    "prepaid"（繰上返済額）の (ローン本数, 期数) 配列（入力がすべてスカラーなら (期数,)）と "periods_per_year"。
+    """
+    if prepay_type not in PREPAY_TYPES:
+        raise ValueError(f"未対応の繰上返済の種類です: {prepay_type}")
+    ppy = int(periods_per_year)
+    scalar = all(np.ndim(v) == 0 for v in (principal, annual_rate_pct, years))
+    B, rate, yrs = np.broadcast_arrays(np.atleast_1d(np.asarray(principal, dtype=float)),
+                                       np.atleast_1d(np.asarray(annual_rate_pct, dtype=float)),
+                                       np.atleast_1d(np.asarray(years, dtype=float)))
+    B = np.maximum(B, 0.0)
+    r = rate / 100.0 / ppy
+    m = np.floor(yrs) * ppy                      # 残り期数
+    P = _payment(B, r, m)
+
+    # イベントを「何期目の後に起きるか」で並べる（金利変更は前年末の時点として扱う）
+    events = [((int(y) - 1) * ppy, 0, "rate", (v,)) for y, v in rate_steps]
+    events += [(int(y) * ppy, 1, "prepay", (a,)) for y, a in prepayments]
+    events += [(int(y) * ppy, 2, "refinance", (v, n)) for y, v, n in refinances]
+    events.sort(key=lambda e: (e[0], e[1]))
+
+    horizon = int(m.max()) if m.size else 0
+    for t, _, kind, values in events:
+        if kind == "refinance":
+            horizon = max(horizon, t + int(np.max(np.floor(values[1]) * ppy)))
+    S = len(B)
+    out = {key: np.zeros((S, horizon)) for key in _SCHEDULE_KEYS}
+
+    t0 = 0
+    for t1, _, kind, values in events + [(horizon, 9, "end", ())]:
+        t1 = min(max(t1, t0), horizon)
+        L = t1 - t0
+        if L > 0:
+            k = np.arange(1, L + 1)
+            Bk = np.maximum(remaining_balance(B[:, None], r[:, None], P[:, None], k), 0.0)
+            Bk = np.where(k >= m[:, None], 0.0, Bk)          # 最終回の返済後は 0
+            prev = np.concatenate([B[:, None], Bk[:, :-1]], axis=1)
+            interest = prev * r[:, None]
+            payment = np.where(prev > 0, np.minimum(P[:, None], prev + interest), 0.0)
+            out["balance"][:, t0:t1] = Bk
+            out["interest"][:, t0:t1] = interest
+            out["principal"][:, t0:t1] = payment - interest
+            out["payment"][:, t0:t1] = payment
+            B = Bk[:, -1]
+            m = np.maximum(m - L, 0)
+        t0 = t1
+        if kind == "rate":
+            r = np.broadcast_to(np.asarray(values[0], dtype=float) / 100.0 / ppy, B.shape)
+            P = _payment(B, r, m)
+        elif kind == "prepay":
+            paid = np.minimum(B, np.asarray(values[0], dtype=float))
+            B = B - paid
+            if t0 > 0:
+                out["balance"][:, t0 - 1] = B
+                out["prepaid"][:, t0 - 1] += paid
+            if prepay_type == "reduce":
+                P = _payment(B, r, m)
+            else:
+                m = np.minimum(m, _periods_needed(B, r, P))
+        elif kind == "refinance":
+            r = np.broadcast_to(np.asarray(values[0], dtype=float) / 100.0 / ppy, B.shape)
+            m = np.broadcast_to(np.floor(np.asarray(values[1], dtype=float)) * ppy, B.shape).astype(float)
+            P = _payment(B, r, m)
+
+    if scalar:
+        out = {key: v[0] for key, v in out.items()}
+    out["periods_per_year"] = ppy
+    return out
+
+def to_annual(sched: dict) -> dict:
+    """月次などの予定表を年単位に集計（残高は年末、その他は合計）"""
+    ppy = sched["periods_per_year"]
+    if ppy == 1:
+        return dict(sched)
+    n = sched["balance"].shape[-1]
+    pad = (-n) % ppy
+    out = {"periods_per_year": 1}
+    for key in _SCHEDULE_KEYS:
+        v = sched[key]
+        if pad:
+            v = np.concatenate([v, np.zeros(v.shape[:-1] + (pad,))], axis=-1)
+        v = v.reshape(v.shape[:-1] + (-1, ppy))
+        out[key] = v[..., -1] if key == "balance" else v.sum(axis=-1)
+    return out
+
+def schedule_frame(sched: dict) -> pd.DataFrame:
+    """1 本分の予定表を表示用の DataFrame にする"""
+    unit = "年" if sched["periods_per_year"] == 1 else "回"
+    return pd.DataFrame({
+        f"返済{unit}": np.arange(1, len(sched["balance"]) + 1),
+        "返済額（万円）": sched["payment"],
+        "うち利息（万円）": sched["interest"],
+        "うち元金（万円）": sched["principal"],
+        "繰上返済（万円）": sched["prepaid"],
+        "残高（万円）": sched["balance"],
+    })
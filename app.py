@@ -1,11 +1,29 @@
 
+import io
+
 import numpy as np
 import pandas as pd
 import streamlit as st
 import altair as alt
 
+from amortization import schedule as amortization_schedule, schedule_frame
+from charts import chart_data, long_table, series_spec
+from engine import (COLUMNS, DEFAULT_PARAMS, MODE_RATE, MODE_AMOUNT, PARAM_LABELS, PARAM_RANGES, aggregate_annual,
+                    params_key, simulate_arrays, to_dataframe)
+from export import ExportCache, ExportJobs, result_table, table_bytes, write_mc_paths
+from montecarlo import DISTRIBUTIONS, STOCHASTIC_RATES, bands_to_frame, simulate_mc
+from profiling import QUERY_PARAM as PROFILE_QUERY_PARAM, ProfileHistory, Profiler, settings as profile_settings
+from scenarios import BASE_SCENARIO, ScenarioCache, metrics_frame, scenario_long, scenario_params
+from simcache import SimulationCache
+from sensitivity import sensitivity_params, tornado, tornado_long
+from sweep import SWEEP_METRICS, GridCache
+from solver import SOLVER_VARIABLES, goal_seek
+
 st.set_page_config(page_title="人生資産シミュレーション", layout="wide")
 
+# ?profile=1（または環境変数 ASSET_PROFILE=1）のときだけ、再実行の各段の時間を測って一番下に表示する
+profiler = Profiler(*profile_settings(st.query_params.get(PROFILE_QUERY_PARAM)))
+
 # --------- ちょいCSS（入力ボックスの高さ・レイアウト微調整） ----------
 st.markdown("""
 <style>
@@ -28,6 +46,8 @@ section[data-testid="stSidebar"] h3, section[data-testid="stSidebar"] h2 {
 st.title("🏠💹 人生資産シミュレーション（UTF-8）")
 st.caption("※ 本ツールは簡易モデルです。税・社保・控除・資産評価は概算。必要に応じて調整してください。")
 
+profiler.lap("ページ設定・ヘッダー")
+
 # =========================
 # サイドバー（すべての設定パラメータ）
 # =========================
@@ -38,310 +58,177 @@ with st.sidebar:
     st.subheader("期間・初期資産")
     colA, colB = st.columns(2)
     with colA:
-        current_age = st.number_input("現在年齢", 20, 80, 30, 1)
-        target_age  = st.number_input("目標年齢（終了）", 40, 90, 60, 1)
+        current_age = st.number_input("現在年齢", *PARAM_RANGES["current_age"], 30, 1)
+        target_age  = st.number_input("目標年齢（終了）", *PARAM_RANGES["target_age"], 60, 1)
     with colB:
-        initial_assets = st.number_input("現在の金融資産（万円）", 0, 999999, 100, 10)
+        initial_assets = st.number_input("現在の金融資産（万円）", *PARAM_RANGES["initial_assets"], 100, 10)
 
     # 本人の年収（額面）
     st.subheader("本人：年収（額面）推移")
     col1, col2, col3 = st.columns(3)
     with col1:
-        income_now = st.number_input("現在年収（万円）", 0, 99999, 800, 10)
+        income_now = st.number_input("現在年収（万円）", *PARAM_RANGES["income_now"], 800, 10)
     with col2:
-        years_to_raise = st.number_input("何年後に年収UP", 0, 20, 3, 1)
-        income_after   = st.number_input("UP後の年収（万円）", 0, 99999, 1000, 10)
+        years_to_raise = st.number_input("何年後に年収UP", *PARAM_RANGES["years_to_raise"], 3, 1)
+        income_after   = st.number_input("UP後の年収（万円）", *PARAM_RANGES["income_after"], 1000, 10)
     with col3:
-        raise_until_age = st.number_input("年収の年率上昇 適用上限年齢", 30, 70, 40, 1)
-        raise_rate      = st.number_input("年率上昇（%）", 0.0, 10.0, 1.0, 0.1)
+        raise_until_age = st.number_input("年収の年率上昇 適用上限年齢", *PARAM_RANGES["raise_until_age"], 40, 1)
+        raise_rate      = st.number_input("年率上昇（%）", *PARAM_RANGES["raise_rate"], 1.0, 0.1)
 
     # 妻の年収（額面）
     st.subheader("妻：年収（額面）")
     colw1, colw2 = st.columns(2)
     with colw1:
-        spouse_start_age = st.number_input("開始年齢（妻の就労開始）", 20, 80, 32, 1)
+        spouse_start_age = st.number_input("開始年齢（妻の就労開始）", *PARAM_RANGES["spouse_start_age"], 32, 1)
     with colw2:
-        spouse_income = st.number_input("妻の年収（万円）", 0, 99999, 300, 10)
+        spouse_income = st.number_input("妻の年収（万円）", *PARAM_RANGES["spouse_income"], 300, 10)
 
     # 税・社会保険（概算）
     st.subheader("税・社会保険（概算パラメータ）")
     colt1, colt2, colt3 = st.columns(3)
     with colt1:
-        salary_deduction_rate = st.number_input("給与所得控除率（%/額面）", 0.0, 50.0, 20.0, 0.5)
-        salary_deduction_min  = st.number_input("給与所得控除の下限（万円）", 0, 1000, 55, 5)
+        salary_deduction_rate = st.number_input("給与所得控除率（%/額面）", *PARAM_RANGES["salary_deduction_rate"], 20.0, 0.5)
+        salary_deduction_min  = st.number_input("給与所得控除の下限（万円）", *PARAM_RANGES["salary_deduction_min"], 55, 5)
     with colt2:
-        basic_deduction       = st.number_input("基礎控除（万円）", 0, 200, 48, 1)
-        resident_tax_rate     = st.number_input("住民税率（%・一律）", 0.0, 20.0, 10.0, 0.5)
+        basic_deduction       = st.number_input("基礎控除（万円）", *PARAM_RANGES["basic_deduction"], 48, 1)
+        resident_tax_rate     = st.number_input("住民税率（%・一律）", *PARAM_RANGES["resident_tax_rate"], 10.0, 0.5)
     with colt3:
-        income_tax_eff_rate   = st.number_input("所得税 実効率（%）", 0.0, 40.0, 8.0, 0.5)
-        social_ins_rate       = st.number_input("社会保険料率（%）", 0.0, 30.0, 15.0, 0.5)
+        income_tax_eff_rate   = st.number_input("所得税 実効率（%）", *PARAM_RANGES["income_tax_eff_rate"], 8.0, 0.5)
+        social_ins_rate       = st.number_input("社会保険料率（%）", *PARAM_RANGES["social_ins_rate"], 15.0, 0.5)
 
     # 住宅（資産・負債・維持費）
     st.subheader("住宅（総資産に土地・建物を計上、ローンは負債）")
     colh1, colh2, colh3 = st.columns(3)
     with colh1:
-        house_age   = st.number_input("購入年齢", 25, 70, 37, 1)
-        house_price = st.number_input("購入価格（万円）", 0, 999999, 5000, 50)  # 5000万円
-        down_payment = st.number_input("頭金（万円）", 0, 999999, 500, 50)
+        house_age   = st.number_input("購入年齢", *PARAM_RANGES["house_age"], 37, 1)
+        house_price = st.number_input("購入価格（万円）", *PARAM_RANGES["house_price"], 5000, 50)  # 5000万円
+        down_payment = st.number_input("頭金（万円）", *PARAM_RANGES["down_payment"], 500, 50)
     with colh2:
-        mortgage_rate  = st.number_input("住宅ローン金利（年%）", 0.0, 5.0, 1.0, 0.1)
-        mortgage_years = st.number_input("ローン年数", 5, 45, 35, 1)
-        prop_tax_annual = st.number_input("固定資産税/年（万円）", 0, 300, 20, 5)
+        mortgage_rate  = st.number_input("住宅ローン金利（年%）", *PARAM_RANGES["mortgage_rate"], 1.0, 0.1)
+        mortgage_years = st.number_input("ローン年数", *PARAM_RANGES["mortgage_years"], 35, 1)
+        prop_tax_annual = st.number_input("固定資産税/年（万円）", *PARAM_RANGES["prop_tax_annual"], 20, 5)
     with colh3:
-        land_ratio = st.number_input("土地比率（%/購入額）", 0.0, 100.0, 40.0, 1.0)
-        land_appreciation = st.number_input("土地 年率変動（%）", -5.0, 10.0, 0.0, 0.1)
-        bldg_decline = st.number_input("建物 年率変動（%・マイナス推奨）", -10.0, 10.0, -2.0, 0.1)
+        land_ratio = st.number_input("土地比率（%/購入額）", *PARAM_RANGES["land_ratio"], 40.0, 1.0)
+        land_appreciation = st.number_input("土地 年率変動（%）", *PARAM_RANGES["land_appreciation"], 0.0, 0.1)
+        bldg_decline = st.number_input("建物 年率変動（%・マイナス推奨）", *PARAM_RANGES["bldg_decline"], -2.0, 0.1)
 
     colm = st.columns(2)
     with colm[0]:
-        maintain_30yr_total = st.number_input("30年維持費 合計（万円）", 0, 100000, 800, 10)
+        maintain_30yr_total = st.number_input("30年維持費 合計（万円）", *PARAM_RANGES["maintain_30yr_total"], 800, 10)
     with colm[1]:
-        misc_house_annual = st.number_input("その他 住宅維持費/年（万円）", 0, 1000, 10, 5)
+        misc_house_annual = st.number_input("その他 住宅維持費/年（万円）", *PARAM_RANGES["misc_house_annual"], 10, 5)
 
     # 教育費（1人あたり/年）
     st.subheader("教育費（1人あたり・万円/年）")
     colc1, colc2 = st.columns(2)
     with colc1:
-        child1_birth_age = st.number_input("第一子 出産（親の年齢）", 20, 60, 30, 1)
-        child2_birth_age = st.number_input("第二子 出産（親の年齢）", 20, 60, 33, 1)
-        kg_cost   = st.number_input("幼稚園（3〜6歳）", 0, 500, 10, 5)
-        elem_cost = st.number_input("小学校（7〜12歳）", 0, 500, 30, 5)
+        child1_birth_age = st.number_input("第一子 出産（親の年齢）", *PARAM_RANGES["child1_birth_age"], 30, 1)
+        child2_birth_age = st.number_input("第二子 出産（親の年齢）", *PARAM_RANGES["child2_birth_age"], 33, 1)
+        kg_cost   = st.number_input("幼稚園（3〜6歳）", *PARAM_RANGES["kg_cost"], 10, 5)
+        elem_cost = st.number_input("小学校（7〜12歳）", *PARAM_RANGES["elem_cost"], 30, 5)
     with colc2:
-        jhs_cost  = st.number_input("中学（13〜15歳）", 0, 500, 50, 5)
-        hs_cost   = st.number_input("高校（16〜18歳）", 0, 500, 30, 5)
-        univ_cost = st.number_input("大学（19〜22歳）", 0, 800, 80, 10)
-        living_add = st.number_input("大学 仕送り等 追加", 0, 800, 60, 10)
+        jhs_cost  = st.number_input("中学（13〜15歳）", *PARAM_RANGES["jhs_cost"], 50, 5)
+        hs_cost   = st.number_input("高校（16〜18歳）", *PARAM_RANGES["hs_cost"], 30, 5)
+        univ_cost = st.number_input("大学（19〜22歳）", *PARAM_RANGES["univ_cost"], 80, 10)
+        living_add = st.number_input("大学 仕送り等 追加", *PARAM_RANGES["living_add"], 60, 10)
 
-    peak_threshold = st.number_input("“教育費ピーク”判定（合計/年）", 0, 2000, 300, 10)
+    peak_threshold = st.number_input("“教育費ピーク”判定（合計/年）", *PARAM_RANGES["peak_threshold"], 300, 10)
 
     # 車
     st.subheader("車の購入")
     colv1, colv2 = st.columns(2)
     with colv1:
-        car_buy_age = st.number_input("購入年齢（車）", 20, 80, 38, 1)
+        car_buy_age = st.number_input("購入年齢（車）", *PARAM_RANGES["car_buy_age"], 38, 1)
     with colv2:
-        car_price   = st.number_input("購入価格（万円）", 0, 99999, 400, 10)
+        car_price   = st.number_input("購入価格（万円）", *PARAM_RANGES["car_price"], 400, 10)
 
     # 貯蓄と投資
     st.subheader("貯蓄と投資")
-    mode = st.radio("貯蓄方法", ["割合で指定", "固定額で指定"], horizontal=True, index=1)
-    if mode == "割合で指定":
+    mode = st.radio("貯蓄方法", [MODE_RATE, MODE_AMOUNT], horizontal=True, index=1)
+    if mode == MODE_RATE:
         colp1, colp2, colp3 = st.columns(3)
         with colp1:
-            save_rate_pre  = st.number_input("購入前の貯蓄率（%）", 0.0, 90.0, 25.0, 1.0)
+            save_rate_pre  = st.number_input("購入前の貯蓄率（%）", *PARAM_RANGES["save_rate_pre"], 25.0, 1.0)
         with colp2:
-            save_rate_post = st.number_input("購入後の貯蓄率（%）", 0.0, 90.0, 20.0, 1.0)
+            save_rate_post = st.number_input("購入後の貯蓄率（%）", *PARAM_RANGES["save_rate_post"], 20.0, 1.0)
         with colp3:
-            save_rate_peak = st.number_input("教育費ピーク時の貯蓄率（%）", 0.0, 90.0, 15.0, 1.0)
+            save_rate_peak = st.number_input("教育費ピーク時の貯蓄率（%）", *PARAM_RANGES["save_rate_peak"], 15.0, 1.0)
         save_amt_pre = save_amt_post = save_amt_peak = None
     else:
         colp1, colp2, colp3 = st.columns(3)
         with colp1:
-            save_amt_pre  = st.number_input("購入前の貯蓄額（万円/年）", 0, 100000, 150, 10)
+            save_amt_pre  = st.number_input("購入前の貯蓄額（万円/年）", *PARAM_RANGES["save_amt_pre"], 150, 10)
         with colp2:
-            save_amt_post = st.number_input("購入後の貯蓄額（万円/年）", 0, 100000, 150, 10)
+            save_amt_post = st.number_input("購入後の貯蓄額（万円/年）", *PARAM_RANGES["save_amt_post"], 150, 10)
         with colp3:
-            save_amt_peak = st.number_input("教育費ピーク時の貯蓄額（万円/年）", 0, 100000, 100, 10)
+            save_amt_peak = st.number_input("教育費ピーク時の貯蓄額（万円/年）", *PARAM_RANGES["save_amt_peak"], 100, 10)
         save_rate_pre = save_rate_post = save_rate_peak = None
 
-    invest_return = st.number_input("投資年率（税引後, %）", 0.0, 20.0, 4.0, 0.1)
-
-# =========================
-# 補助関数
-# =========================
-def annuity_payment(principal, annual_rate_pct, years):
-    r = annual_rate_pct / 100.0
-    n = int(years)
-    if principal <= 0 or n <= 0:
-        return 0.0
-    if r == 0:
-        return principal / n
-    return principal * (r * (1 + r) ** n) / ((1 + r) ** n - 1)
-
-def income_at_age(age, start_age, inc0, inc_after, years_to_after, raise_until, raise_pct):
-    years_from_now = age - start_age
-    if years_from_now < years_to_after:
-        return inc0
-    extra = max(0, min(age, raise_until) - (start_age + years_to_after))
-    return inc_after * ((1 + raise_pct/100.0) ** extra)
-
-def taxes_and_net(gross, salary_deduction_rate, salary_deduction_min, basic_deduction,
-                  income_tax_eff_rate, resident_tax_rate, social_ins_rate):
-    si = gross * (social_ins_rate/100.0)
-    salary_ded = max(salary_deduction_min, gross * (salary_deduction_rate/100.0))
-    taxable_base = max(0.0, gross - si - salary_ded - basic_deduction)
-    itax = taxable_base * (income_tax_eff_rate/100.0)
-    rtax = max(0.0, (gross - si - salary_ded) * (resident_tax_rate/100.0))
-    net = gross - (si + itax + rtax)
-    return si, itax, rtax, net
-
-def child_cost_by_age(child_age, kg, elem, jhs, hs, univ, live_add):
-    if child_age < 3:
-        return 0
-    if 3 <= child_age <= 6:
-        return kg
-    if 7 <= child_age <= 12:
-        return elem
-    if 13 <= child_age <= 15:
-        return jhs
-    if 16 <= child_age <= 18:
-        return hs
-    if 19 <= child_age <= 22:
-        return univ + live_add
-    return 0
+    invest_return = st.number_input("投資年率（税引後, %）", *PARAM_RANGES["invest_return"], 4.0, 0.1)
+    monthly_calc = st.toggle("月次で計算（ローン・運用を月単位、表は年単位に集計）", value=False)
+
+    # モンテカルロ（投資利回り・土地/建物の変動を確率的に）
+    st.subheader("モンテカルロ（リスク幅）")
+    mc_enabled = st.checkbox("確率シミュレーションを表示", value=False)
+    if mc_enabled:
+        mc_dist = st.radio("年率の分布", DISTRIBUTIONS, horizontal=True,
+                           format_func={"normal": "正規", "lognormal": "対数正規", "bootstrap": "過去データ"}.get)
+        colmc1, colmc2 = st.columns(2)
+        with colmc1:
+            mc_paths = st.number_input("パス数", 100, 100000, 10000, 1000)
+            mc_seed  = st.number_input("乱数シード", 0, 2**31 - 1, 0, 1)
+        with colmc2:
+            mc_invest_vol = st.number_input("投資 ボラティリティ（%）", 0.0, 50.0, STOCHASTIC_RATES["invest_return"], 0.5)
+            mc_land_vol   = st.number_input("土地 ボラティリティ（%）", 0.0, 30.0, STOCHASTIC_RATES["land_appreciation"], 0.5)
+            mc_bldg_vol   = st.number_input("建物 ボラティリティ（%）", 0.0, 30.0, STOCHASTIC_RATES["bldg_decline"], 0.5)
+        mc_history = {}
+        if mc_dist == "bootstrap":
+            hist_file = st.file_uploader("投資の年率履歴CSV（1列目＝年率%）", type=["csv"])
+            if hist_file is not None:
+                mc_history["invest_return"] = pd.read_csv(hist_file).iloc[:, 0].dropna().to_numpy(dtype=float)
+            if not len(mc_history.get("invest_return", ())):
+                st.warning("年率履歴CSVをアップロードするまで、投資も正規分布（上のボラティリティ）で計算します。")
+            st.caption("土地・建物の変動率は履歴がないため、常に正規分布（上のボラティリティ）で計算します。")
+        mc_float32 = st.checkbox("float32 で計算（省メモリ）", value=True)
+
+profiler.lap("ウィジェット（サイドバー）")
 
 # =========================
 # シミュレーション
 # =========================
-years = list(range(current_age, target_age + 1))
-
-# 初期状態
-fin_asset = float(initial_assets)     # 金融資産
-loan_balance = 0.0                    # 住宅ローン残
-annual_payment = 0.0                  # 年返済
-land_value = 0.0
-bldg_value = 0.0
-land_value0 = house_price * (land_ratio/100.0)
-bldg_value0 = house_price - land_value0
-maint_per_year = (maintain_30yr_total / 30.0) if maintain_30yr_total > 0 else 0.0
-
-# 記録
-gross_incomes, net_incomes = [], []
-income_taxes, resident_taxes, social_ins = [], [], []
-gross_incomes_sp, net_incomes_sp = [], []
-income_taxes_sp, resident_taxes_sp, social_ins_sp = [], [], []
-
-edu_costs, house_costs, contribs = [], [], []
-fin_assets, total_assets, loan_balances = [], [], []
-land_values, bldg_values = [], []
-discretionary_month = []  # 月々の自由に使える金額（万円/月）
-
-for age in years:
-    # 本人の額面年収
-    gross_self = income_at_age(age, current_age, income_now, income_after, years_to_raise, raise_until_age, raise_rate)
-
-    # 妻の額面年収
-    gross_spouse = spouse_income if age >= spouse_start_age else 0.0
-
-    # 税・社会保険（個人別に計算）
-    si_s, itx_s, rtx_s, net_s = taxes_and_net(
-        gross_self, salary_deduction_rate, salary_deduction_min, basic_deduction,
-        income_tax_eff_rate, resident_tax_rate, social_ins_rate
-    )
-    si_p, itx_p, rtx_p, net_p = taxes_and_net(
-        gross_spouse, salary_deduction_rate, salary_deduction_min, basic_deduction,
-        income_tax_eff_rate, resident_tax_rate, social_ins_rate
-    )
-
-    gross_total = gross_self + gross_spouse
-    net_total   = net_s + net_p
-
-    # 教育費
-    c1_age = age - child1_birth_age
-    c2_age = age - child2_birth_age
-    edu1 = child_cost_by_age(c1_age, kg_cost, elem_cost, jhs_cost, hs_cost, univ_cost, living_add) if c1_age >= 0 else 0
-    edu2 = child_cost_by_age(c2_age, kg_cost, elem_cost, jhs_cost, hs_cost, univ_cost, living_add) if c2_age >= 0 else 0
-    edu_total = edu1 + edu2
-
-    # 住宅：購入処理
-    if age == house_age and house_price > 0:
-        fin_asset -= down_payment
-        loan_balance = max(0.0, house_price - down_payment)
-        annual_payment = annuity_payment(loan_balance, mortgage_rate, mortgage_years)
-        land_value = land_value0
-        bldg_value = bldg_value0
-
-    # 住宅費（返済＋税＋維持）
-    housing_cost = 0.0
-    if house_age <= age < house_age + mortgage_years and loan_balance > 0:
-        interest = loan_balance * (mortgage_rate/100.0)
-        principal_pay = max(0.0, min(annual_payment - interest, loan_balance))
-        loan_balance -= principal_pay
-        housing_cost += annual_payment
-    if age >= house_age and house_price > 0:
-        housing_cost += prop_tax_annual + misc_house_annual + maint_per_year
-        # 資産価値の変動
-        if land_value > 0:
-            land_value *= (1 + land_appreciation/100.0)
-        if bldg_value > 0:
-            bldg_value *= (1 + bldg_decline/100.0)
-
-    # 車購入（支出扱い）
-    if age == car_buy_age and car_price > 0:
-        fin_asset -= car_price  # 単純に支出として計上
-
-    # 拠出（貯蓄）
-    if mode == "割合で指定":
-        if age < house_age:
-            srate = save_rate_pre
-        else:
-            srate = save_rate_peak if edu_total >= peak_threshold else save_rate_post
-        contrib = gross_total * (srate/100.0)
-    else:
-        if age < house_age:
-            contrib = float(save_amt_pre)
-        else:
-            contrib = float(save_amt_peak) if edu_total >= peak_threshold else float(save_amt_post)
-
-    # 金融資産の運用（年次複利）
-    r = invest_return / 100.0
-    fin_asset = fin_asset * (1 + r) + contrib
-
-    # 総資産（= 金融資産 + 不動産価値 - ローン残高）
-    real_estate_value = land_value + bldg_value
-    net_worth = fin_asset + real_estate_value - loan_balance
-
-    # 月の自由に使える金額（万円/月）
-    free_month = max(0.0, (net_total - edu_total - housing_cost - contrib) / 12.0)
-
-    # 記録
-    gross_incomes.append(round(gross_self, 1))
-    income_taxes.append(round(itx_s, 1))
-    resident_taxes.append(round(rtx_s, 1))
-    social_ins.append(round(si_s, 1))
-    net_incomes.append(round(net_s, 1))
-
-    gross_incomes_sp.append(round(gross_spouse, 1))
-    income_taxes_sp.append(round(itx_p, 1))
-    resident_taxes_sp.append(round(rtx_p, 1))
-    social_ins_sp.append(round(si_p, 1))
-    net_incomes_sp.append(round(net_p, 1))
-
-    edu_costs.append(round(edu_total, 1))
-    house_costs.append(round(housing_cost, 1))
-    contribs.append(round(contrib, 1))
-    fin_assets.append(round(fin_asset, 1))
-    total_assets.append(round(net_worth, 1))
-    loan_balances.append(round(loan_balance, 1))
-    land_values.append(round(land_value, 1))
-    bldg_values.append(round(bldg_value, 1))
-    discretionary_month.append(round(free_month, 2))
-
-# 結果テーブル
-df = pd.DataFrame({
-    "年齢": years,
-    "本人 年収（額面・万円）": gross_incomes,
-    "本人 所得税（万円）": income_taxes,
-    "本人 住民税（万円）": resident_taxes,
-    "本人 社会保険（万円）": social_ins,
-    "本人 手取り（万円）": net_incomes,
-
-    "妻 年収（額面・万円）": gross_incomes_sp,
-    "妻 所得税（万円）": income_taxes_sp,
-    "妻 住民税（万円）": resident_taxes_sp,
-    "妻 社会保険（万円）": social_ins_sp,
-    "妻 手取り（万円）": net_incomes_sp,
-
-    "教育費（万円）": edu_costs,
-    "住宅費（万円/年）": house_costs,
-    "投資拠出（万円）": contribs,
-    "金融資産（万円）": fin_assets,
-    "土地価値（万円）": land_values,
-    "建物価値（万円）": bldg_values,
-    "住宅ローン残高（万円）": loan_balances,
-    "総資産（万円）": total_assets,
-    "自由に使える金額（万円/月）": discretionary_month,
-})
+params = dict(
+    current_age=current_age, target_age=target_age, initial_assets=initial_assets,
+    income_now=income_now, years_to_raise=years_to_raise, income_after=income_after,
+    raise_until_age=raise_until_age, raise_rate=raise_rate,
+    spouse_start_age=spouse_start_age, spouse_income=spouse_income,
+    salary_deduction_rate=salary_deduction_rate, salary_deduction_min=salary_deduction_min,
+    basic_deduction=basic_deduction, resident_tax_rate=resident_tax_rate,
+    income_tax_eff_rate=income_tax_eff_rate, social_ins_rate=social_ins_rate,
+    house_age=house_age, house_price=house_price, down_payment=down_payment,
+    mortgage_rate=mortgage_rate, mortgage_years=mortgage_years, prop_tax_annual=prop_tax_annual,
+    land_ratio=land_ratio, land_appreciation=land_appreciation, bldg_decline=bldg_decline,
+    maintain_30yr_total=maintain_30yr_total, misc_house_annual=misc_house_annual,
+    child1_birth_age=child1_birth_age, child2_birth_age=child2_birth_age,
+    kg_cost=kg_cost, elem_cost=elem_cost, jhs_cost=jhs_cost, hs_cost=hs_cost,
+    univ_cost=univ_cost, living_add=living_add, peak_threshold=peak_threshold,
+    car_buy_age=car_buy_age, car_price=car_price,
+    mode=mode,
+    save_rate_pre=save_rate_pre, save_rate_post=save_rate_post, save_rate_peak=save_rate_peak,
+    save_amt_pre=save_amt_pre, save_amt_post=save_amt_post, save_amt_peak=save_amt_peak,
+    invest_return=invest_return,
+)
+
+# 結果テーブル（同じパラメータなら計算・DataFrame 構築を省く）
+@st.cache_resource
+def get_sim_cache():
+    return SimulationCache(maxsize=256, ttl=3600)
+
+sim_cache = get_sim_cache()
+steps_per_year = 12 if monthly_calc else 1
+# 直前のパラメータからの変更なら、影響が始まる年齢から続きだけを計算する
+df = sim_cache.simulate(params, steps_per_year, previous=st.session_state.get("last_params"))
+st.session_state["last_params"] = params
+profiler.lap("シミュレーション")
 
 # =========================
 # サマリー＆右側のメトリクス
@@ -364,67 +251,377 @@ with right:
 # =========================
 c1, c2 = st.columns(2, gap="large")
 
-def line_chart_altair(df_long, x, y, color, title):
-    return (alt.Chart(df_long)
-            .mark_line()
-            .encode(
-                x=alt.X(x, title="年齢"),
-                y=alt.Y(y, title=None),
-                color=alt.Color(color, title=None, legend=alt.Legend(orient='bottom')),
-                tooltip=[x, color, y]
-            )
-            .properties(title=title, height=280)
-            .interactive())
-
-def area_chart_altair(df_long, x, y, color, title, stack=True):
-    return (alt.Chart(df_long)
-            .mark_area(opacity=0.7)
-            .encode(
-                x=alt.X(x, title="年齢"),
-                y=alt.Y(y, stack=stack, title=None),
-                color=alt.Color(color, title=None, legend=alt.Legend(orient='bottom')),
-                tooltip=[x, color, y]
-            )
-            .properties(title=title, height=280)
-            .interactive())
+# データは結果ごとに 1 回だけ作ったロング形式を系列で絞り込み、スペックは使い回す
+# （ズーム・パンはブラウザ内で済み再実行しないので fragment にはしない）
+def chart_panel(long, label, expanded, chart, series_title, value_title, title, area=False, stack=True):
+    with st.expander(label, expanded=expanded):
+        st.vega_lite_chart(chart_data(long, chart), series_spec(title, series_title, value_title, area, stack),
+                           width="stretch")
 
-# データ整形（ロング）
-def to_long(df, value_cols, var_name="系列", value_name="値"):
-    d = df[["年齢"] + value_cols].melt("年齢", var_name=var_name, value_name=value_name)
-    return d
+profiler.lap("サマリー")
+chart_long = sim_cache.get_or_compute(params_key(params, steps_per_year=steps_per_year, view="chart_long"),
+                                      lambda: long_table(df))
+profiler.lap("グラフ用のロング形式（melt）")
 
 with c1:
-    with st.expander("📈 年齢 × 資産（金融資産・不動産・総資産・ローン残）", expanded=True):
-        cols = ["金融資産（万円）", "土地価値（万円）", "建物価値（万円）", "住宅ローン残高（万円）", "総資産（万円）"]
-        d = to_long(df, cols, "資産項目", "金額（万円）")
-        st.altair_chart(line_chart_altair(d, "年齢", "金額（万円）", "資産項目", "資産の推移"), use_container_width=True)
-
-    with st.expander("💼 年齢 × 年収（額面）と手取り（本人・妻）", expanded=False):
-        cols = ["本人 年収（額面・万円）", "本人 手取り（万円）", "妻 年収（額面・万円）", "妻 手取り（万円）"]
-        d = to_long(df, cols, "年収項目", "金額（万円）")
-        st.altair_chart(line_chart_altair(d, "年齢", "金額（万円）", "年収項目", "年収と手取りの推移"), use_container_width=True)
+    chart_panel(chart_long, "📈 年齢 × 資産（金融資産・不動産・総資産・ローン残）", True,
+                "assets", "資産項目", "金額（万円）", "資産の推移")
+    chart_panel(chart_long, "💼 年齢 × 年収（額面）と手取り（本人・妻）", False,
+                "income", "年収項目", "金額（万円）", "年収と手取りの推移")
 
 with c2:
-    with st.expander("📊 年齢 × 費用（教育費・住宅費・投資拠出）", expanded=True):
-        cols = ["教育費（万円）", "住宅費（万円/年）", "投資拠出（万円）"]
-        d = to_long(df, cols, "費用項目", "金額（万円/年）")
-        st.altair_chart(area_chart_altair(d, "年齢", "金額（万円/年）", "費用項目", "費用の推移"), use_container_width=True)
+    chart_panel(chart_long, "📊 年齢 × 費用（教育費・住宅費・投資拠出）", True,
+                "costs", "費用項目", "金額（万円/年）", "費用の推移", area=True)
+    chart_panel(chart_long, "🧾 年齢 × 税金推移（本人・妻）", False,
+                "taxes", "税項目", "金額（万円/年）", "税金の推移", area=True, stack=False)
+profiler.lap("グラフ（Vega-Lite）")
 
-    with st.expander("🧾 年齢 × 税金推移（本人・妻）", expanded=False):
-        cols = ["本人 所得税（万円）", "本人 住民税（万円）", "本人 社会保険（万円）",
-                "妻 所得税（万円）", "妻 住民税（万円）", "妻 社会保険（万円）"]
-        d = to_long(df, cols, "税項目", "金額（万円/年）")
-        st.altair_chart(area_chart_altair(d, "年齢", "金額（万円/年）", "税項目", "税金の推移", stack=False), use_container_width=True)
+# =========================
+# シナリオ比較（名前付きシナリオを保存して重ね描き）
+# =========================
+@st.cache_resource
+def get_scenario_cache():
+    return ScenarioCache(maxsize=64)
+
+SCENARIO_KEYS = [k for k in DEFAULT_PARAMS if k != "mode"]
+SCENARIO_ITEMS = ["net_worth", "fin_asset", "land_value", "bldg_value", "loan_balance"]
+
+def scenario_table(overrides: dict) -> pd.DataFrame:
+    """シナリオの上書き値の編集表（行 = パラメータ、列 = シナリオ、空欄 = 現在の設定のまま）"""
+    return pd.DataFrame({name: [ov.get(k, np.nan) for k in SCENARIO_KEYS] for name, ov in overrides.items()},
+                        index=[PARAM_LABELS[k] for k in SCENARIO_KEYS], dtype=float)
+
+def add_scenario():
+    name = st.session_state.scenario_name.strip()
+    if name and name != BASE_SCENARIO and name not in st.session_state.scenarios:
+        st.session_state.scenarios[name] = {}
+        st.session_state.scenario_name = ""
+
+def delete_scenario():
+    st.session_state.scenarios.pop(st.session_state.scenario_to_delete, None)
+
+def scenario_panel(params):
+    with st.expander("🧪 シナリオ比較：複数の計画を保存して重ねて比べる", expanded=False):
+        scenarios = st.session_state.setdefault("scenarios", {})
+        cols1, cols2 = st.columns([3, 1], vertical_alignment="bottom")
+        with cols1:
+            st.text_input("シナリオ名", key="scenario_name", placeholder="例: 37歳で購入 / 賃貸 / 子ども1人")
+        with cols2:
+            st.button("シナリオを追加", on_click=add_scenario, width="stretch")
+        if not scenarios:
+            st.caption("シナリオを追加すると、現在の設定から変える値を表で入力して比較できます。")
+            return
+
+        st.caption("表の空欄は現在の設定（サイドバー）の値のまま。サイドバーを変えると全シナリオをまとめて再計算します。")
+        # 編集表はシナリオの追加・削除のたびに作り直す（キーにシナリオ名を含める）
+        edited = st.data_editor(scenario_table(scenarios), width="stretch",
+                                key="scenario_editor_" + "|".join(scenarios))
+        for name in scenarios:
+            values = edited[name].to_numpy()
+            scenarios[name] = {k: float(v) for k, v in zip(SCENARIO_KEYS, values) if not np.isnan(v)}
+
+        cold1, cold2 = st.columns([3, 1], vertical_alignment="bottom")
+        with cold1:
+            st.selectbox("削除するシナリオ", list(scenarios), key="scenario_to_delete")
+        with cold2:
+            st.button("削除", on_click=delete_scenario, width="stretch")
+
+        params_by_name = {BASE_SCENARIO: scenario_params(params, {}),
+                          **{name: scenario_params(params, ov) for name, ov in scenarios.items()}}
+        scenario_cache = get_scenario_cache()
+        results = scenario_cache.results(params_by_name)
+
+        item = st.radio("重ねる項目", SCENARIO_ITEMS, horizontal=True, format_func=lambda k: COLUMNS[k][0])
+        label = COLUMNS[item][0]
+        st.vega_lite_chart(scenario_long(results, item),
+                           series_spec(f"{label.split('（')[0]}の推移（シナリオ比較）", "シナリオ", label,
+                                       series_field="シナリオ"),
+                           width="stretch")
+        st.dataframe(metrics_frame(results).round(1), width="stretch")
+        st.caption(f"累計 計算 {scenario_cache.computed:,}・再利用 {scenario_cache.reused:,} シナリオ")
+
+scenario_panel(params)
+profiler.lap("シナリオ比較")
+
+# =========================
+# 目標逆算（ゴールシーク）
+# =========================
+@st.fragment
+def goal_seek_panel(params):
+    target_age, mode = params["target_age"], params["mode"]
+    with st.expander("🎯 目標逆算：目標を満たす貯蓄額・購入価格を求める", expanded=False):
+        solver_labels = [label for label, (keys, *_) in SOLVER_VARIABLES.items()
+                         if not (mode == MODE_RATE and keys[0].startswith("save_amt"))
+                         and not (mode == MODE_AMOUNT and keys[0].startswith("save_rate"))]
+        colg1, colg2 = st.columns(2)
+        with colg1:
+            solver_label = st.selectbox("動かす変数", solver_labels)
+            solve_on = st.toggle("逆算する", value=False)
+        with colg2:
+            goal_net_worth = st.number_input(f"{target_age}歳時点の総資産 目標（万円・0で条件なし）", 0, 999999, 10000, 500)
+            goal_fin_nonneg = st.checkbox("金融資産が一度もマイナスにならない", value=True)
+            goal_free_month = st.number_input("自由に使える金額の下限（万円/月・0で条件なし）", 0.0, 500.0, 0.0, 1.0)
+        if solve_on:
+            keys, lo, hi, maximize = SOLVER_VARIABLES[solver_label]
+            sol = goal_seek(
+                params, keys, lo, hi, maximize,
+                min_net_worth=goal_net_worth or None,
+                fin_nonnegative=goal_fin_nonneg,
+                min_free_month=goal_free_month or None,
+            )
+            if sol["value"] is None:
+                st.warning(f"探索範囲（{lo:,.0f}〜{hi:,.0f}）内に目標を満たす値がありません。")
+            else:
+                word = "最大" if maximize else "最小"
+                st.metric(f"{word}の {solver_label}", f"{sol['value']:,.1f}")
+                st.caption(f"そのときの {target_age}歳時点の総資産: {sol['net_worth']:,.1f} 万円"
+                           f"（{sol['evaluations']} シナリオを一括計算）")
+
+goal_seek_panel(params)
+profiler.lap("目標逆算")
+
+# =========================
+# 感度分析（トルネード図）
+# =========================
+@st.fragment
+def sensitivity_panel(params):
+    with st.expander("🌪️ 感度分析：各パラメータを ±X% 動かしたときの影響", expanded=False):
+        cols1, cols2, cols3 = st.columns(3)
+        with cols1:
+            sens_pct = st.number_input("変化幅（±%）", 1.0, 100.0, 10.0, 1.0)
+        with cols2:
+            sens_metric = st.radio("指標", ["最終総資産", "最低金融資産"], horizontal=True)
+        with cols3:
+            sens_top = st.number_input("表示する項目数", 5, 50, 15, 1)
+        sens_on = st.toggle("感度分析を実行", value=False)
+        if sens_on:
+            sens = tornado(params, sens_pct)
+            n_scenarios = 2 * len(sens) + 1
+            sens = sens.sort_values(f"{sens_metric} 振れ幅", ascending=False).head(int(sens_top))
+            d = tornado_long(sens, sens_metric)
+            chart = (alt.Chart(d)
+                     .mark_bar()
+                     .encode(
+                         y=alt.Y("項目", sort=alt.EncodingSortField("振れ幅", order="descending"), title=None),
+                         x=alt.X("差分（万円）", title=f"{sens_metric}の基準値からの差（万円）"),
+                         color=alt.Color("方向", title=None, legend=alt.Legend(orient='bottom')),
+                         tooltip=["項目", "方向", alt.Tooltip("差分（万円）", format=",.1f")],
+                     )
+                     .properties(title=f"{sens_metric}の感度（±{sens_pct:g}%）", height=24 * len(sens) + 60))
+            st.altair_chart(chart, width="stretch")
+            st.caption(f"基準値: {sens.attrs['base'][sens_metric]:,.1f} 万円（{n_scenarios} シナリオを一括計算）")
+
+sensitivity_panel(params)
+profiler.lap("感度分析")
+
+# =========================
+# ヒートマップ（2 パラメータの掃引）
+# =========================
+@st.cache_resource
+def get_grid_cache():
+    return GridCache(maxsize=16)
+
+def axis_inputs(params, axis, key, container):
+    """軸の範囲入力（最小・最大・刻み）。既定は現在値の ±50%（入力欄の範囲内）、現在値が 0 以下なら入力欄の範囲"""
+    w_lo, w_hi = (float(v) for v in PARAM_RANGES[key])
+    base = float(params[key] or 0.0)
+    lo, hi = (max(base * 0.5, w_lo), min(base * 1.5, w_hi)) if base > 0 else (w_lo, w_hi)
+    with container:
+        a_min = st.number_input(f"{axis} 最小", value=lo, key=f"hm_{axis}_min_{key}")
+        a_max = st.number_input(f"{axis} 最大", value=hi, key=f"hm_{axis}_max_{key}")
+        a_step = st.number_input(f"{axis} 刻み", min_value=1e-6, value=(hi - lo) / 49 or 1.0,
+                                 format="%.4g", key=f"hm_{axis}_step_{key}")
+    return np.arange(a_min, a_max + a_step / 2, a_step)
+
+@st.fragment
+def heatmap_panel(params):
+    with st.expander("🗺️ ヒートマップ：2 つのパラメータの組み合わせを一括比較", expanded=False):
+        hm_keys = sensitivity_params(params)
+        colh1, colh2, colh3 = st.columns(3)
+        with colh1:
+            hm_x = st.selectbox("横軸", hm_keys, index=hm_keys.index("house_price"), format_func=PARAM_LABELS.get)
+        with colh2:
+            hm_y = st.selectbox("縦軸", hm_keys, index=hm_keys.index("mortgage_rate"), format_func=PARAM_LABELS.get)
+        with colh3:
+            hm_metric = st.radio("指標", list(SWEEP_METRICS), format_func=SWEEP_METRICS.get)
+        colh4, colh5 = st.columns(2)
+        hm_xs = axis_inputs(params, "横軸", hm_x, colh4)
+        hm_ys = axis_inputs(params, "縦軸", hm_y, colh5)
+        hm_on = st.toggle("ヒートマップを計算", value=False)
+        if hm_on:
+            if hm_x == hm_y:
+                st.warning("横軸と縦軸には別のパラメータを選んでください。")
+            elif len(hm_xs) * len(hm_ys) > 40000:
+                st.warning(f"セル数が多すぎます（{len(hm_xs) * len(hm_ys):,}）。40,000 以下になるよう刻みを調整してください。")
+            else:
+                grid_cache = get_grid_cache()
+                hm = grid_cache.sweep(params, hm_x, hm_xs, hm_y, hm_ys)
+                x_label, y_label, m_label = PARAM_LABELS[hm_x], PARAM_LABELS[hm_y], SWEEP_METRICS[hm_metric]
+                chart = (alt.Chart(hm)
+                         .mark_rect()
+                         .encode(
+                             x=alt.X(x_label, type="ordinal", axis=alt.Axis(format=",.4~g", labelOverlap=True)),
+                             y=alt.Y(y_label, type="ordinal", sort="descending",
+                                     axis=alt.Axis(format=",.4~g", labelOverlap=True)),
+                             color=alt.Color(m_label, type="quantitative", scale=alt.Scale(scheme="viridis"),
+                                             legend=alt.Legend(orient='bottom')),
+                             tooltip=[x_label, y_label, alt.Tooltip(m_label, format=",.1f")],
+                         )
+                         .properties(title=m_label, height=420))
+                st.altair_chart(chart, width="stretch")
+                st.caption(f"{len(hm):,} セル（累計 計算 {grid_cache.computed_cells:,}・再利用 {grid_cache.reused_cells:,}）")
+
+heatmap_panel(params)
+profiler.lap("ヒートマップ")
+
+# =========================
+# モンテカルロ（パーセンタイル帯）
+# =========================
+@st.cache_resource
+def get_export_jobs():
+    return ExportJobs(max_workers=2)
+
+def job_status(key: str, file_name: str):
+    """バックグラウンドの書き出しの進捗。終わるまでこの部分だけを 0.5 秒ごとに再実行する"""
+    job = get_export_jobs().get(key)
+    polling = not job.done()
+
+    @st.fragment(run_every=0.5 if polling else None)
+    def show():
+        job = get_export_jobs().get(key)
+        if job is None:
+            return
+        if not job.done():
+            st.progress(job.progress, text=f"書き出し中… {job.progress:.0%}")
+        elif polling:
+            st.rerun()   # 終わったらページ全体を再実行して定期実行を止める
+        elif job.error() is not None:
+            st.error(f"書き出しに失敗しました: {job.error()}")
+        else:
+            st.download_button(f"📥 {file_name}", data=job.result(), file_name=file_name,
+                               mime="application/vnd.apache.parquet")
+    show()
+
+if mc_enabled:
+    mc_settings = dict(
+        n_paths=int(mc_paths), dist=mc_dist, seed=int(mc_seed), history=mc_history,
+        vols={"invest_return": mc_invest_vol, "land_appreciation": mc_land_vol, "bldg_decline": mc_bldg_vol},
+        dtype=np.float32 if mc_float32 else np.float64,
+    )
+    mc_key = params_key(params, mc={**mc_settings, "dtype": np.dtype(mc_settings["dtype"]).name})
+    mc = sim_cache.get_or_compute(mc_key, lambda: simulate_mc(params, **mc_settings))
+
+    def band_chart_altair(df_band, title):
+        base = alt.Chart(df_band).encode(x=alt.X("年齢", title="年齢"),
+                                         color=alt.Color("系列", title=None, legend=alt.Legend(orient='bottom')))
+        outer = base.mark_area(opacity=0.15).encode(y=alt.Y("p5", title=None), y2="p95")
+        inner = base.mark_area(opacity=0.3).encode(y="p25", y2="p75")
+        median = base.mark_line().encode(y="p50", tooltip=["年齢", "系列", "p5", "p25", "p50", "p75", "p95"])
+        return (outer + inner + median).properties(title=title, height=320).interactive()
+
+    st.divider()
+    st.subheader(f"🎲 モンテカルロ（{mc['n_paths']:,} パス・5〜95%帯）")
+    colr1, colr2, colr3 = st.columns(3)
+    colr1.metric("金融資産がマイナスになる確率（期間中）", f"{mc['prob_ever_negative']:.1%}")
+    colr2.metric(f"{target_age}歳時点の総資産 中央値（万円）", f"{mc['bands']['net_worth'][2, -1]:,.1f}")
+    colr3.metric(f"{target_age}歳時点の総資産 5%点（万円）", f"{mc['bands']['net_worth'][0, -1]:,.1f}")
+    st.altair_chart(band_chart_altair(bands_to_frame(mc), "金融資産・総資産のばらつき"), width="stretch")
+
+    # 全パスの書き出しは大きいので、ボタンを押したらバックグラウンドで作る
+    def build_mc_paths(progress):
+        res = simulate_mc(params, **mc_settings, keep_paths=True, progress=lambda f: progress(0.5 * f))
+        buf = io.BytesIO()
+        write_mc_paths(buf, res, params, progress=lambda f: progress(0.5 + 0.5 * f))
+        return buf.getvalue()
+
+    mc_export_key = mc_key + ":paths"
+    if get_export_jobs().get(mc_export_key) is None:
+        if st.button("🗂️ 全パスを Parquet で書き出す"):
+            get_export_jobs().submit(mc_export_key, build_mc_paths)
+    if get_export_jobs().get(mc_export_key) is not None:
+        job_status(mc_export_key, "montecarlo_paths.parquet")
+profiler.lap("モンテカルロ")
+
+# 住宅ローン返済予定表
+@st.fragment
+def loan_panel(principal, rate, years):
+    with st.expander("🏦 住宅ローン返済予定表", expanded=False):
+        monthly = st.toggle("月次で表示", value=False)
+        sched = amortization_schedule(principal, rate, years, periods_per_year=12 if monthly else 1)
+        st.dataframe(schedule_frame(sched).round(1), width="stretch", hide_index=True)
+
+if house_price > 0 and house_price > down_payment:
+    loan_panel(house_price - down_payment, mortgage_rate, mortgage_years)
+profiler.lap("ローン返済予定表")
 
 # 明細テーブル
 st.divider()
 st.subheader("年次明細（万円）")
-st.dataframe(df, use_container_width=True)
-
-# 一番下：CSVダウンロード（UTF-8）
-st.download_button(
-    "📥 結果CSVダウンロード（UTF-8）",
-    data=df.to_csv(index=False).encode("utf-8"),
-    file_name="simulation.csv",
-    mime="text/csv",
-)
\ No newline at end of file
+st.dataframe(df, width="stretch")
+if monthly_calc:
+    with st.expander("月次明細（万円）", expanded=False):
+        monthly_df = sim_cache.get_or_compute(
+            params_key(params, steps_per_year=12, view="monthly"),
+            lambda: to_dataframe(simulate_arrays(params, 12, dtype=np.float32)))
+        st.dataframe(monthly_df, width="stretch")
+profiler.lap("明細テーブル（st.dataframe）")
+
+# 一番下：CSVダウンロード（UTF-8）と Parquet / Arrow IPC（丸めなし・float32・パラメータ付き）
+# バイト列はボタンを押したときに（別スレッドで）作り、結果のハッシュごとにサイズ上限付きでキャッシュする
+@st.cache_resource
+def get_export_cache():
+    return ExportCache(max_bytes=64 * 2**20)
+
+def export_bytes(fmt: str):
+    """download_button に渡す、押されたときにバイト列を返す関数"""
+    key = params_key(params, steps_per_year=steps_per_year, export=fmt)
+    result_df, result_params, spy = df, params, steps_per_year
+
+    def build():
+        if fmt == "csv":
+            return result_df.to_csv(index=False).encode("utf-8")
+        result = sim_cache.arrays(result_params, spy)
+        if spy > 1:
+            result = aggregate_annual(result, spy)
+        return table_bytes(result_table(result, result_params, steps_per_year=spy), fmt)
+    return lambda: get_export_cache().get_or_build(key, build)
+
+cold1, cold2, cold3 = st.columns(3)
+with cold1:
+    st.download_button(
+        "📥 結果CSVダウンロード（UTF-8）",
+        data=export_bytes("csv"),
+        file_name="simulation.csv",
+        mime="text/csv",
+    )
+with cold2:
+    st.download_button("📥 Parquet", data=export_bytes("parquet"),
+                       file_name="simulation.parquet", mime="application/vnd.apache.parquet")
+with cold3:
+    st.download_button("📥 Arrow IPC（Feather）", data=export_bytes("feather"),
+                       file_name="simulation.arrow", mime="application/vnd.apache.arrow.file")
+cache_stats = sim_cache.stats()
+st.caption(f"計算キャッシュ: ヒット {cache_stats['hits']} / ミス {cache_stats['misses']}"
+           f"（ヒット率 {cache_stats['hit_rate']:.0%}・保持 {cache_stats['size']}/{cache_stats['maxsize']} 件・"
+           f"途中から再計算 {cache_stats['resumed']} 回）")
+profiler.lap("ダウンロード")
+
+# 区間計測（セッションごとに直近の再実行を保持。fragment だけの再実行は含まない）
+if profiler.enabled:
+    profile_history = st.session_state.setdefault("profile_history", ProfileHistory())
+    profile_history.add(profiler.finish())
+    with st.expander("⏱️ 再実行の区間計測", expanded=True):
+        st.caption("st.dataframe / st.vega_lite_chart はサーバー側の Arrow 変換までを含み、ブラウザへの転送は含まない")
+        colp1, colp2 = st.columns(2)
+        with colp1:
+            st.markdown("**直近の再実行（ミリ秒）**")
+            st.dataframe(profile_history.breakdown().style.format({"ミリ秒": "{:.1f}", "割合": "{:.0%}"}),
+                         width="stretch")
+        with colp2:
+            st.markdown(f"**直近 {len(profile_history.runs)} 回のパーセンタイル（ミリ秒）**")
+            st.dataframe(profile_history.percentiles().round(1), width="stretch")
+        if profile_history.profiles:
+            st.download_button(f"📥 cProfile（直近 {len(profile_history.profiles)} 回分・.prof）",
+                               data=profile_history.pstats_bytes(), file_name="asset.prof",
+                               mime="application/octet-stream")
+            st.code(profile_history.pstats_text(), language=None)
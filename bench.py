@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""計算エンジンと描画・書き出しのベンチマーク
+
+    python bench.py -o bench.json                      # 全ケースを計測して JSON に保存
+    python bench.py -k batch -k mc                     # 名前に batch / mc を含むケースだけ
+    python bench.py --compare baseline.json            # 基準の結果より遅くなったケースがあれば終了コード 1
+    python bench.py -k batch --budget                  # BUDGETS の秒数を超えたケースがあれば終了コード 1
+
+各ケースは 1 回の実行時間を min_time 秒以上になるまで繰り返し測り、中央値・最小値などを記録する。
+比較は中央値で行い、基準の (1 + tolerance) 倍を超えたら遅くなったとみなす。
+
+BUDGETS は README などで示している目安（中央値の上限・秒）。1 CPU の環境で batch_100k（2 項目）は
+0.6 秒前後、batch_100k_all（全項目）は 0.9〜1.2 秒ほどかかる。
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import charts
+from engine import DEFAULT_PARAMS, simulate, simulate_arrays, simulate_batch, to_dataframe
+from export import result_table, table_bytes
+from montecarlo import simulate_mc
+
+
+def _single(years: int):
+    params = dict(DEFAULT_PARAMS, target_age=DEFAULT_PARAMS["current_age"] + years)
+    return lambda: simulate(params)
+
+def _batch(n: int, fields=("fin_asset", "net_worth")):
+    rng = np.random.default_rng(0)
+    table = pd.DataFrame({
+        "house_price": rng.uniform(0, 9000, n),
+        "invest_return": rng.uniform(0, 8, n),
+        "target_age": rng.integers(60, 91, n),
+    })
+    return lambda: simulate_batch(table, fields=None if fields is None else list(fields))
+
+def _mc(n_paths: int):
+    return lambda: simulate_mc(DEFAULT_PARAMS, n_paths=n_paths, seed=0, dtype=np.float32)
+
+def _charts():
+    df = simulate(dict(DEFAULT_PARAMS, target_age=90))
+    def run():
+        long = charts.long_table(df)
+        for chart in charts.CHART_SERIES:
+            charts.chart_data(long, chart)
+            charts._series_spec.__wrapped__(chart, "系列", "金額（万円）", False, True, charts.SERIES_FIELD)   # キャッシュを通さずに組み立てる
+    return run
+
+def _export(fmt: str):
+    result = simulate_arrays(dict(DEFAULT_PARAMS, target_age=90))
+    if fmt == "csv":
+        return lambda: to_dataframe(result).to_csv(index=False).encode("utf-8")
+    return lambda: table_bytes(result_table(result, DEFAULT_PARAMS), fmt)
+
+# ケース名 → 計測する関数を返す準備関数（準備の時間は計測しない）
+CASES = {
+    "single_30y": lambda: _single(30),
+    "single_60y": lambda: _single(60),
+    "single_70y": lambda: _single(70),
+    "batch_1k": lambda: _batch(1_000),
+    "batch_100k": lambda: _batch(100_000),
+    "batch_100k_all": lambda: _batch(100_000, fields=None),
+    "mc_10k": lambda: _mc(10_000),
+    "charts_long_spec": _charts,
+    "export_csv": lambda: _export("csv"),
+    "export_parquet": lambda: _export("parquet"),
+}
+
+# ケース名 → 中央値の上限（秒）。--budget で確かめる
+BUDGETS = {
+    "batch_100k": 0.8,
+    "batch_100k_all": 2.0,
+}
+
+
+def measure(func, min_time: float = 1.0, min_runs: int = 5, max_runs: int = 1000) -> dict:
+    """func を min_time 秒以上・min_runs 回以上（max_runs 回まで）実行し、1 回あたりの秒数をまとめる"""
+    func()   # 初回（import やキャッシュの準備）は除く
+    times = []
+    start = time.perf_counter()
+    while len(times) < max_runs and (len(times) < min_runs or time.perf_counter() - start < min_time):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "mean": statistics.fmean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "runs": len(times),
+    }
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """基準より中央値が (1 + tolerance) 倍を超えて遅いケースの (名前, 基準, 今回) 一覧"""
+    slower = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if base is not None and res["median"] > base["median"] * (1 + tolerance):
+            slower.append((name, base["median"], res["median"]))
+    return slower
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="シミュレーションのベンチマーク")
+    parser.add_argument("-k", "--filter", action="append", default=[],
+                        help="名前にこの文字列を含むケースだけ実行（複数指定可）")
+    parser.add_argument("-o", "--out", help="結果の JSON の保存先")
+    parser.add_argument("--compare", help="比較する基準の結果の JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="許容する遅れ（既定: 0.25 = 25%%）")
+    parser.add_argument("--min-time", type=float, default=1.0, help="1 ケースあたりの最低計測時間（秒）")
+    parser.add_argument("--budget", action="store_true", help="BUDGETS の上限を超えたら終了コード 1")
+    args = parser.parse_args(argv)
+
+    names = [n for n in CASES if not args.filter or any(f in n for f in args.filter)]
+    if not names:
+        parser.error("該当するケースがありません")
+    results = {}
+    for name in names:
+        results[name] = measure(CASES[name](), min_time=args.min_time)
+        r = results[name]
+        print(f"{name:20s} median {r['median'] * 1e3:10.3f} ms  min {r['min'] * 1e3:10.3f} ms  ({r['runs']} 回)")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results}, f, ensure_ascii=False, indent=1)
+
+    failed = False
+    if args.budget:
+        for name, r in results.items():
+            limit = BUDGETS.get(name)
+            if limit is not None and r["median"] > limit:
+                print(f"{name}: 上限 {limit:.3f} s を超えました（{r['median']:.3f} s）", file=sys.stderr)
+                failed = True
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        slower = compare(results, baseline, args.tolerance)
+        for name, base, now in slower:
+            print(f"{name}: 遅くなりました {base * 1e3:.3f} ms -> {now * 1e3:.3f} ms "
+                  f"（+{now / base - 1:.0%}）", file=sys.stderr)
+        failed = failed or bool(slower)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""グラフ用のデータと Vega-Lite スペック
+
+結果テーブルは long_table で 1 回だけロング形式（年齢・系列・値）にし、各グラフは
+系列の絞り込みで同じ表を使う。スペックはデータを含まない dict として 1 回だけ作って
+使い回し（渡すのは毎回そのコピー）、データは st.vega_lite_chart に別に渡す（Streamlit が Arrow で送る）。
+"""
+import copy
+from functools import lru_cache
+
+import altair as alt
+import pandas as pd
+
+# グラフごとの系列（結果テーブルの列名）
+CHART_SERIES = {
+    "assets": ["金融資産（万円）", "土地価値（万円）", "建物価値（万円）", "住宅ローン残高（万円）", "総資産（万円）"],
+    "income": ["本人 年収（額面・万円）", "本人 手取り（万円）", "妻 年収（額面・万円）", "妻 手取り（万円）"],
+    "costs": ["教育費（万円）", "住宅費（万円/年）", "投資拠出（万円）"],
+    "taxes": ["本人 所得税（万円）", "本人 住民税（万円）", "本人 社会保険（万円）",
+              "妻 所得税（万円）", "妻 住民税（万円）", "妻 社会保険（万円）"],
+}
+X_FIELD, SERIES_FIELD, VALUE_FIELD = "年齢", "系列", "値"
+
+
+def long_table(df: pd.DataFrame) -> pd.DataFrame:
+    """全グラフの系列をまとめたロング形式（系列はカテゴリ型）"""
+    cols = [c for series in CHART_SERIES.values() for c in series]
+    d = df[[X_FIELD] + cols].melt(X_FIELD, var_name=SERIES_FIELD, value_name=VALUE_FIELD)
+    d[SERIES_FIELD] = pd.Categorical(d[SERIES_FIELD], categories=cols)
+    return d
+
+def chart_data(long: pd.DataFrame, chart: str) -> pd.DataFrame:
+    """ロング形式の表から 1 つのグラフの系列だけを取り出す"""
+    return long[long[SERIES_FIELD].isin(CHART_SERIES[chart])].reset_index(drop=True)
+
+def series_spec(title: str, series_title: str, value_title: str, area: bool = False, stack: bool = True,
+                series_field: str = SERIES_FIELD) -> dict:
+    """年齢 × 値を系列（series_field 列）ごとに描く折れ線/面グラフのスペック（データなし）
+
+    組み立てたスペックはキャッシュし、呼び出し側には深いコピーを返す
+    （st.vega_lite_chart は入れ子の dict を書き換えるので、キャッシュしたものは渡さない）。
+    """
+    return copy.deepcopy(_series_spec(title, series_title, value_title, area, stack, series_field))
+
+@lru_cache(maxsize=None)
+def _series_spec(title, series_title, value_title, area, stack, series_field) -> dict:
+    chart = alt.Chart().mark_area(opacity=0.7) if area else alt.Chart().mark_line()
+    return _without_data(chart
+            .encode(
+                x=alt.X(f"{X_FIELD}:Q", title="年齢"),
+                y=alt.Y(f"{VALUE_FIELD}:Q", stack=stack if area else alt.Undefined, title=None),
+                color=alt.Color(f"{series_field}:N", title=None, legend=alt.Legend(orient='bottom')),
+                tooltip=[alt.Tooltip(f"{X_FIELD}:Q"), alt.Tooltip(f"{series_field}:N", title=series_title),
+                         alt.Tooltip(f"{VALUE_FIELD}:Q", title=value_title)],
+            )
+            .properties(title=title, height=280)
+            .interactive())
+
+def _without_data(chart) -> dict:
+    """Altair のチャートをデータ抜きのスペック dict にする"""
+    spec = chart.to_dict()
+    spec.pop("data", None)
+    spec.pop("datasets", None)
+    return spec
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""人生資産シミュレーションのコマンドライン実行（Streamlit なし）
+
+    python cli.py params.json -o out/
+    python cli.py households/ -o out/ --format parquet --jobs 8
+    python cli.py scenarios.csv -o out/
+
+パラメータファイルは app.py のサイドバーの変数名をキーにした JSON / TOML。
+未指定のキーはサイドバーの初期値になる。
+CSV は 1 行 = 1 シナリオのパラメータ表として扱い、全シナリオの結果を
+1 つの Parquet に行グループごとに書き出す（--format によらない）。
+parquet / feather は丸めなしの float32 で、パラメータをメタデータに入れる。
+出力ファイル名は入力ファイル名の拡張子を替えたもので、同じ名前になる入力があれば何も書き出さずに終了する。
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+try:
+    from tomllib import loads as toml_loads
+except ModuleNotFoundError:  # Python < 3.11 は requirements の toml を使う
+    from toml import loads as toml_loads
+
+from engine import DEFAULT_PARAMS, simulate, simulate_arrays
+from export import EXPORT_FORMATS, result_table, write_batch_parquet, write_table
+
+PARAM_SUFFIXES = (".json", ".toml")
+TABLE_SUFFIX = ".csv"
+FORMATS = ("csv", "json", *EXPORT_FORMATS)
+
+
+def load_params(path: str) -> dict:
+    """JSON / TOML のパラメータファイルを読み込む（未知のキーはエラー）"""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    data = toml_loads(text) if path.endswith(".toml") else json.loads(text)
+    unknown = set(data) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"{path}: 未知のパラメータ {sorted(unknown)}")
+    return data
+
+def collect_inputs(paths) -> list:
+    """ファイル・ディレクトリの並びから、パラメータファイルのパス一覧を作る"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.endswith(PARAM_SUFFIXES))
+        else:
+            files.append(path)
+    return files
+
+def output_path(path: str, out_dir: str, fmt: str) -> str:
+    """入力ファイルの出力先（out_dir/<拡張子を除いた名前>.<形式>、シナリオ表は常に .parquet）"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(out_dir, f"{stem}.{'parquet' if path.endswith(TABLE_SUFFIX) else fmt}")
+
+def output_collisions(files, out_dir: str, fmt: str) -> list:
+    """出力先が同じになる入力の組（a/x.json と b/x.toml、x.json と x.csv など）の一覧"""
+    inputs = {}
+    for path in files:
+        inputs.setdefault(os.path.normcase(output_path(path, out_dir, fmt)), []).append(path)
+    return [paths for paths in inputs.values() if len(paths) > 1]
+
+def load_table(path: str) -> pd.DataFrame:
+    """シナリオのパラメータ表（CSV、1 行 = 1 シナリオ）を読み込む（未知の列はエラー）"""
+    table = pd.read_csv(path, encoding="utf-8")
+    unknown = set(table.columns) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"{path}: 未知のパラメータ {sorted(unknown)}")
+    return table
+
+def write_result(params: dict, out_path: str, fmt: str):
+    if fmt in EXPORT_FORMATS:
+        write_table(result_table(simulate_arrays(params), params), out_path, fmt)
+        return
+    df = simulate(params)
+    if fmt == "csv":
+        df.to_csv(out_path, index=False, encoding="utf-8")
+    else:
+        df.to_json(out_path, orient="records", force_ascii=False, indent=1)
+
+def run_one(path: str, out_dir: str, fmt: str):
+    """1 ファイル分を計算して書き出す（プロセスプールから呼ばれる）
+
+    戻り値は (入力パス, 出力パス, エラーメッセージ)。失敗しても他のファイルは続行する。
+    """
+    try:
+        out_path = output_path(path, out_dir, fmt)
+        if path.endswith(TABLE_SUFFIX):
+            write_batch_parquet(out_path, load_table(path))
+        else:
+            write_result(load_params(path), out_path, fmt)
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+    return path, out_path, None
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="人生資産シミュレーションをパラメータファイルから一括実行")
+    parser.add_argument("inputs", nargs="+",
+                        help="パラメータファイル（.json/.toml）・そのディレクトリ・シナリオ表（.csv）")
+    parser.add_argument("-o", "--out-dir", default=".", help="出力先ディレクトリ（既定: カレント）")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="csv", help="出力形式（既定: csv）")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="並列プロセス数（既定: CPU 数、1 で直列）")
+    args = parser.parse_args(argv)
+
+    files = collect_inputs(args.inputs)
+    if not files:
+        parser.error("パラメータファイルが見つかりません")
+    collisions = output_collisions(files, args.out_dir, args.format)
+    if collisions:   # 黙って上書きしないよう、何も書き出す前に止める
+        parser.error("出力ファイル名が同じになる入力があります（ファイル名を変えてください）: "
+                     + "; ".join(", ".join(paths) for paths in collisions))
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    tasks = (files, [args.out_dir] * len(files), [args.format] * len(files))
+    if args.jobs <= 1 or len(files) == 1:
+        results = list(map(run_one, *tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            results = list(pool.map(run_one, *tasks, chunksize=max(1, len(files) // (args.jobs * 4))))
+
+    failed = 0
+    for path, out_path, err in results:
+        if err is None:
+            print(f"{path} -> {out_path}")
+        else:
+            failed += 1
+            print(f"{path}: 失敗しました: {err}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
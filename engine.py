@@ -0,0 +1,681 @@
+# -*- coding: utf-8 -*-
+"""人生資産シミュレーションの計算エンジン（Streamlit 非依存）
+
+app.py のサイドバー入力と同じ名前のキーを持つ dict を受け取り、
+年齢ごとの推移を NumPy 配列でまとめて計算する。
+"""
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+from amortization import annuity_payment, remaining_balance
+
+# =========================
+# パラメータ
+# =========================
+MODE_RATE = "割合で指定"
+MODE_AMOUNT = "固定額で指定"
+
+# サイドバーの初期値と同じ
+DEFAULT_PARAMS = {
+    "current_age": 30,
+    "target_age": 60,
+    "initial_assets": 100,
+    "income_now": 800,
+    "years_to_raise": 3,
+    "income_after": 1000,
+    "raise_until_age": 40,
+    "raise_rate": 1.0,
+    "spouse_start_age": 32,
+    "spouse_income": 300,
+    "salary_deduction_rate": 20.0,
+    "salary_deduction_min": 55,
+    "basic_deduction": 48,
+    "resident_tax_rate": 10.0,
+    "income_tax_eff_rate": 8.0,
+    "social_ins_rate": 15.0,
+    "house_age": 37,
+    "house_price": 5000,
+    "down_payment": 500,
+    "mortgage_rate": 1.0,
+    "mortgage_years": 35,
+    "prop_tax_annual": 20,
+    "land_ratio": 40.0,
+    "land_appreciation": 0.0,
+    "bldg_decline": -2.0,
+    "maintain_30yr_total": 800,
+    "misc_house_annual": 10,
+    "child1_birth_age": 30,
+    "child2_birth_age": 33,
+    "kg_cost": 10,
+    "elem_cost": 30,
+    "jhs_cost": 50,
+    "hs_cost": 30,
+    "univ_cost": 80,
+    "living_add": 60,
+    "peak_threshold": 300,
+    "car_buy_age": 38,
+    "car_price": 400,
+    "mode": MODE_AMOUNT,
+    "save_rate_pre": 25.0,
+    "save_rate_post": 20.0,
+    "save_rate_peak": 15.0,
+    "save_amt_pre": 150,
+    "save_amt_post": 150,
+    "save_amt_peak": 100,
+    "invest_return": 4.0,
+}
+
+# パラメータの表示名（感度分析・ヒートマップの軸などで使う）
+PARAM_LABELS = {
+    "current_age": "現在年齢",
+    "target_age": "目標年齢",
+    "initial_assets": "現在の金融資産（万円）",
+    "income_now": "現在年収（万円）",
+    "years_to_raise": "何年後に年収UP",
+    "income_after": "UP後の年収（万円）",
+    "raise_until_age": "年収の年率上昇 適用上限年齢",
+    "raise_rate": "年率上昇（%）",
+    "spouse_start_age": "妻の就労開始年齢",
+    "spouse_income": "妻の年収（万円）",
+    "salary_deduction_rate": "給与所得控除率（%）",
+    "salary_deduction_min": "給与所得控除の下限（万円）",
+    "basic_deduction": "基礎控除（万円）",
+    "resident_tax_rate": "住民税率（%）",
+    "income_tax_eff_rate": "所得税 実効率（%）",
+    "social_ins_rate": "社会保険料率（%）",
+    "house_age": "住宅 購入年齢",
+    "house_price": "住宅 購入価格（万円）",
+    "down_payment": "頭金（万円）",
+    "mortgage_rate": "住宅ローン金利（年%）",
+    "mortgage_years": "ローン年数",
+    "prop_tax_annual": "固定資産税/年（万円）",
+    "land_ratio": "土地比率（%）",
+    "land_appreciation": "土地 年率変動（%）",
+    "bldg_decline": "建物 年率変動（%）",
+    "maintain_30yr_total": "30年維持費 合計（万円）",
+    "misc_house_annual": "その他 住宅維持費/年（万円）",
+    "child1_birth_age": "第一子 出産年齢",
+    "child2_birth_age": "第二子 出産年齢",
+    "kg_cost": "幼稚園（万円/年）",
+    "elem_cost": "小学校（万円/年）",
+    "jhs_cost": "中学（万円/年）",
+    "hs_cost": "高校（万円/年）",
+    "univ_cost": "大学（万円/年）",
+    "living_add": "大学 仕送り等（万円/年）",
+    "peak_threshold": "教育費ピーク判定（万円/年）",
+    "car_buy_age": "車 購入年齢",
+    "car_price": "車 購入価格（万円）",
+    "mode": "貯蓄方法",
+    "save_rate_pre": "購入前の貯蓄率（%）",
+    "save_rate_post": "購入後の貯蓄率（%）",
+    "save_rate_peak": "教育費ピーク時の貯蓄率（%）",
+    "save_amt_pre": "購入前の貯蓄額（万円/年）",
+    "save_amt_post": "購入後の貯蓄額（万円/年）",
+    "save_amt_peak": "教育費ピーク時の貯蓄額（万円/年）",
+    "invest_return": "投資年率（%）",
+}
+
+# サイドバーの入力範囲（内部キー → (最小, 最大)）。app.py の number_input の min/max もここから読む
+PARAM_RANGES = {
+    "current_age": (20, 80),
+    "target_age": (40, 90),
+    "initial_assets": (0, 999999),
+    "income_now": (0, 99999),
+    "years_to_raise": (0, 20),
+    "income_after": (0, 99999),
+    "raise_until_age": (30, 70),
+    "raise_rate": (0.0, 10.0),
+    "spouse_start_age": (20, 80),
+    "spouse_income": (0, 99999),
+    "salary_deduction_rate": (0.0, 50.0),
+    "salary_deduction_min": (0, 1000),
+    "basic_deduction": (0, 200),
+    "resident_tax_rate": (0.0, 20.0),
+    "income_tax_eff_rate": (0.0, 40.0),
+    "social_ins_rate": (0.0, 30.0),
+    "house_age": (25, 70),
+    "house_price": (0, 999999),
+    "down_payment": (0, 999999),
+    "mortgage_rate": (0.0, 5.0),
+    "mortgage_years": (5, 45),
+    "prop_tax_annual": (0, 300),
+    "land_ratio": (0.0, 100.0),
+    "land_appreciation": (-5.0, 10.0),
+    "bldg_decline": (-10.0, 10.0),
+    "maintain_30yr_total": (0, 100000),
+    "misc_house_annual": (0, 1000),
+    "child1_birth_age": (20, 60),
+    "child2_birth_age": (20, 60),
+    "kg_cost": (0, 500),
+    "elem_cost": (0, 500),
+    "jhs_cost": (0, 500),
+    "hs_cost": (0, 500),
+    "univ_cost": (0, 800),
+    "living_add": (0, 800),
+    "peak_threshold": (0, 2000),
+    "car_buy_age": (20, 80),
+    "car_price": (0, 99999),
+    "save_rate_pre": (0.0, 90.0),
+    "save_rate_post": (0.0, 90.0),
+    "save_rate_peak": (0.0, 90.0),
+    "save_amt_pre": (0, 100000),
+    "save_amt_post": (0, 100000),
+    "save_amt_peak": (0, 100000),
+    "invest_return": (0.0, 20.0),
+}
+
+# 年齢・年数のパラメータ（整数で動かす）
+INTEGER_PARAMS = {k for k in DEFAULT_PARAMS if k.endswith("_age")} | {"years_to_raise", "mortgage_years"}
+
+# 結果テーブルの列（内部キー → 表示名, 丸め桁）
+COLUMNS = {
+    "age":          ("年齢", None),
+    "gross_self":   ("本人 年収（額面・万円）", 1),
+    "itax_self":    ("本人 所得税（万円）", 1),
+    "rtax_self":    ("本人 住民税（万円）", 1),
+    "si_self":      ("本人 社会保険（万円）", 1),
+    "net_self":     ("本人 手取り（万円）", 1),
+    "gross_spouse": ("妻 年収（額面・万円）", 1),
+    "itax_spouse":  ("妻 所得税（万円）", 1),
+    "rtax_spouse":  ("妻 住民税（万円）", 1),
+    "si_spouse":    ("妻 社会保険（万円）", 1),
+    "net_spouse":   ("妻 手取り（万円）", 1),
+    "edu":          ("教育費（万円）", 1),
+    "housing":      ("住宅費（万円/年）", 1),
+    "contrib":      ("投資拠出（万円）", 1),
+    "fin_asset":    ("金融資産（万円）", 1),
+    "land_value":   ("土地価値（万円）", 1),
+    "bldg_value":   ("建物価値（万円）", 1),
+    "loan_balance": ("住宅ローン残高（万円）", 1),
+    "net_worth":    ("総資産（万円）", 1),
+    "free_month":   ("自由に使える金額（万円/月）", 2),
+}
+
+
+MONTH_LABEL = "月"   # 月次計算の結果の月（1〜12）の列名
+SCENARIO_KEY, SCENARIO_LABEL = "scenario", "シナリオ"   # 複数シナリオの結果のロング形式のシナリオ番号の列
+
+def resolve_params(params: dict) -> dict:
+    """未指定のキーを既定値で埋める（割合/固定額の非アクティブ側が None でも可）"""
+    p = dict(DEFAULT_PARAMS)
+    p.update({k: v for k, v in params.items() if v is not None})
+    return p
+
+# 貯蓄方法ごとに使われないパラメータ（ハッシュから除外する）
+_INACTIVE_KEYS = {
+    MODE_RATE: ("save_amt_pre", "save_amt_post", "save_amt_peak"),
+    MODE_AMOUNT: ("save_rate_pre", "save_rate_post", "save_rate_peak"),
+}
+
+def params_key(params: dict, **extra) -> str:
+    """パラメータの正規化ハッシュ（既定値の補完・数値型の統一・非アクティブ側の除外）
+
+    extra には結果に影響する追加設定（例: モンテカルロの設定）を渡す。
+    """
+    p = resolve_params(params)
+    for key in _INACTIVE_KEYS.get(p["mode"], ()):
+        p.pop(key)
+    p.update(extra)
+
+    def canon(v):
+        if isinstance(v, (bool, np.bool_, str)) or v is None:
+            return v
+        if isinstance(v, (int, float, np.integer, np.floating)):
+            return float(v)
+        if isinstance(v, dict):
+            return {str(k): canon(x) for k, x in v.items()}
+        return [canon(x) for x in np.asarray(v).ravel().tolist()]
+
+    blob = json.dumps({k: canon(v) for k, v in p.items()}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+# =========================
+# 補助関数（スカラー・配列どちらでも可）
+# =========================
+def income_at_age(age, start_age, inc0, inc_after, years_to_after, raise_until, raise_pct):
+    years_from_now = age - start_age
+    extra = np.maximum(0, np.minimum(age, raise_until) - (start_age + years_to_after))
+    raised = inc_after * ((1 + raise_pct/100.0) ** extra)
+    return np.where(years_from_now < years_to_after, inc0, raised).astype(float)
+
+def taxes_and_net(gross, salary_deduction_rate, salary_deduction_min, basic_deduction,
+                  income_tax_eff_rate, resident_tax_rate, social_ins_rate):
+    si = gross * (social_ins_rate/100.0)
+    salary_ded = np.maximum(salary_deduction_min, gross * (salary_deduction_rate/100.0))
+    taxable_base = np.maximum(0.0, gross - si - salary_ded - basic_deduction)
+    itax = taxable_base * (income_tax_eff_rate/100.0)
+    rtax = np.maximum(0.0, (gross - si - salary_ded) * (resident_tax_rate/100.0))
+    net = gross - (si + itax + rtax)
+    return si, itax, rtax, net
+
+# 教育費の区分（3〜6, 7〜12, 13〜15, 16〜18, 19〜22歳）の境界
+_EDU_EDGES = np.array([3, 7, 13, 16, 19, 23])
+
+def child_cost_by_age(child_age, kg, elem, jhs, hs, univ, live_add):
+    band = np.searchsorted(_EDU_EDGES, child_age, side="right")
+    table = np.stack(np.broadcast_arrays(0.0, kg, elem, jhs, hs, univ + live_add, 0.0), axis=-1)
+    if table.ndim == 1:
+        return table[band]
+    # (シナリオ数, 1, 区分) → シナリオごとに区分を引く
+    table = table[..., 0, :]
+    band = np.broadcast_to(band, (len(table), np.shape(band)[-1]))
+    return np.take_along_axis(table, band, axis=-1)
+
+def compound(start, flows, growth):
+    """x_t = x_{t-1} * growth_t + flows_t を累積積で一括計算（最終軸が時間）
+
+    start は flows の時間軸を長さ 1 にした形（またはスカラー）で渡す。
+    """
+    G = np.cumprod(np.broadcast_to(growth, np.shape(flows)), axis=-1)
+    return G * (start + np.cumsum(flows / G, axis=-1))
+
+def value_factor(rate_pct, k, owned, path=None, steps_per_year: int = 1):
+    """購入年（k = 1）からの資産価値の累積変動倍率（k は年単位）
+
+    path に期ごとの変動率（年率 %、最終軸が時間）を渡すと累積積で求める。
+    """
+    if path is None:
+        return (1 + rate_pct/100.0) ** k * owned
+    step = 1 + path/100.0
+    if steps_per_year > 1:
+        step = step ** (1.0 / steps_per_year)
+    return np.cumprod(np.where(owned, step, 1.0), axis=-1) * owned
+
+# =========================
+# 結果の列
+# =========================
+class SimulationResult:
+    """シミュレーション結果（内部キー → 配列、丸めなし）
+
+    列は dict と同じく result["fin_asset"] で参照でき、計算していない列は持たない。
+    1 シナリオなら各列は年齢ごとの 1 次元配列、simulate_batch / simulate_mc のパスでは
+    (シナリオ × 年齢) の 2 次元配列で、to_pandas / to_arrow ではシナリオ列付きのロング形式になる
+    （各シナリオの年齢範囲の外側の NaN の行は除く）。
+    丸めは表示・CSV 用の to_dataframe でだけ行い、1 シナリオの to_pandas / to_arrow は列をコピーせずに渡す。
+    """
+    __slots__ = (*COLUMNS, "month")
+
+    def __init__(self, columns: dict):
+        for key, values in columns.items():
+            setattr(self, key, values)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def keys(self) -> list:
+        return [k for k in self.__slots__ if hasattr(self, k)]
+
+    def items(self) -> list:
+        return [(k, getattr(self, k)) for k in self.keys()]
+
+    @property
+    def n_scenarios(self):
+        """シナリオ（パス）の数。1 シナリオの結果なら None"""
+        values = [v for k, v in self.items() if k not in ("age", "month")]
+        return np.shape(values[0])[0] if values and np.ndim(values[0]) == 2 else None
+
+    @staticmethod
+    def _label(key: str, labels: bool) -> str:
+        if not labels:
+            return key
+        return {SCENARIO_KEY: SCENARIO_LABEL, "month": MONTH_LABEL}.get(key) or COLUMNS[key][0]
+
+    def to_pandas(self, labels: bool = True) -> pd.DataFrame:
+        """列を DataFrame にする（丸めなし、labels=True で日本語列名）"""
+        return pd.DataFrame({self._label(k, labels): v for k, v in _flat_columns(self).items()}, copy=False)
+
+    def to_arrow(self, labels: bool = True):
+        """列を pyarrow.Table にする（1 シナリオなら数値列はコピーなし・丸めなし）"""
+        import pyarrow as pa
+        return pa.table({self._label(k, labels): pa.array(v) for k, v in _flat_columns(self).items()})
+
+
+def _flat_columns(arrays) -> dict:
+    """結果の列を 1 次元の列の dict にする（2 次元の結果はシナリオ列付きのロング形式）"""
+    values = {k: v for k, v in arrays.items() if k not in ("age", "month")}
+    first = next(iter(values.values()), None)
+    if first is None or np.ndim(first) < 2:
+        return dict(arrays.items())
+    n, m = np.shape(first)
+    inside = ~np.isnan(np.asarray(first, dtype=float)).ravel()
+    out = {SCENARIO_KEY: np.repeat(np.arange(n), m)[inside], "age": np.tile(np.asarray(arrays["age"]), n)[inside]}
+    out.update({k: np.asarray(v).ravel()[inside] for k, v in values.items()})
+    return out
+
+# =========================
+# シミュレーション本体
+# =========================
+def simulate_arrays(params: dict, steps_per_year: int = 1, dtype=None, resume=None) -> SimulationResult:
+    """年齢ごとの推移を SimulationResult（内部キー → 配列、丸めなし）で返す
+
+    steps_per_year=12 で月次計算（各列は 1 か月分の値・月末残高、"month" 列付き）。
+    dtype=np.float32 で結果の列を float32 にする（計算自体は float64）。
+    resume=(前回の結果, 年齢) を渡すと、その年齢より前は前回の結果をそのまま使い、
+    前年末の金融資産をチェックポイントにしてその年齢以降だけを計算する。
+    年齢は earliest_effect_age で求め、前回の結果は同じ steps_per_year・float64 で計算したものを渡す。
+    """
+    p = resolve_params(params)
+    p["by_rate"] = p["mode"] == MODE_RATE
+    first = int(p["current_age"])
+    if resume is not None:
+        prev = resume[0]
+        first = min(max(int(resume[1]), first), first + len(prev["age"]) // steps_per_year)
+    keep = (first - int(p["current_age"])) * steps_per_year   # 前回の結果から引き継ぐ期数
+    if keep > 0:
+        # 住宅ローン残高・土地/建物の価値は年齢の閉形式なので、引き継ぐ状態は金融資産だけ
+        p["initial_assets"] = prev["fin_asset"][keep - 1]
+
+    ages = np.arange(first, int(p["target_age"]) + 1)
+    if steps_per_year == 1:
+        out = _kernel(p, ages.astype(float))
+        out["age"] = ages
+    else:
+        month = np.tile(np.arange(steps_per_year), len(ages))
+        ages = np.repeat(ages, steps_per_year)
+        out = _kernel(p, ages.astype(float), steps_per_year=steps_per_year, month=month)
+        out["age"] = ages
+        out["month"] = month + 1
+    if keep > 0:
+        out = {k: np.concatenate([prev[k][:keep], v]) for k, v in out.items()}
+    if dtype is not None:
+        out.update({k: v.astype(dtype, copy=False) for k, v in out.items() if k in COLUMNS and k != "age"})
+    return SimulationResult(out)
+
+# 変更したときに影響が始まる年齢が決まるパラメータ: キー → (基準の年齢のキー, 加える年数)
+# 基準が複数あるものは早い方を使う。ここに無いパラメータは current_age から影響する
+_EFFECT_START = {
+    "car_price": (("car_buy_age",), 0),
+    "house_price": (("house_age",), 0), "down_payment": (("house_age",), 0),
+    "mortgage_rate": (("house_age",), 0), "mortgage_years": (("house_age",), 0),
+    "prop_tax_annual": (("house_age",), 0), "land_ratio": (("house_age",), 0),
+    "land_appreciation": (("house_age",), 0), "bldg_decline": (("house_age",), 0),
+    "maintain_30yr_total": (("house_age",), 0), "misc_house_annual": (("house_age",), 0),
+    "save_rate_post": (("house_age",), 0), "save_amt_post": (("house_age",), 0),
+    "spouse_income": (("spouse_start_age",), 0),
+    "kg_cost": (("child1_birth_age", "child2_birth_age"), _EDU_EDGES[0]),
+    "elem_cost": (("child1_birth_age", "child2_birth_age"), _EDU_EDGES[1]),
+    "jhs_cost": (("child1_birth_age", "child2_birth_age"), _EDU_EDGES[2]),
+    "hs_cost": (("child1_birth_age", "child2_birth_age"), _EDU_EDGES[3]),
+    "univ_cost": (("child1_birth_age", "child2_birth_age"), _EDU_EDGES[4]),
+    "living_add": (("child1_birth_age", "child2_birth_age"), _EDU_EDGES[4]),
+    # 教育費が 0 の年はピーク判定が変わらない（判定額が 0 以下なら current_age から）
+    "peak_threshold": (("child1_birth_age", "child2_birth_age"), _EDU_EDGES[0]),
+    "save_rate_peak": (("child1_birth_age", "child2_birth_age"), _EDU_EDGES[0]),
+    "save_amt_peak": (("child1_birth_age", "child2_birth_age"), _EDU_EDGES[0]),
+}
+_PEAK_PARAMS = ("peak_threshold", "save_rate_peak", "save_amt_peak")
+# 年齢そのものを表すパラメータは、変更前後の早い方の年齢から影響する
+_AGE_PARAMS = ("car_buy_age", "house_age", "spouse_start_age", "child1_birth_age", "child2_birth_age",
+               "raise_until_age")
+
+def earliest_effect_age(old: dict, new: dict):
+    """old から new への変更で結果が変わりうる最初の年齢（変更がなければ None）
+
+    これより前の年齢の結果は変わらないので、simulate_arrays(new, resume=(old の結果, 年齢)) で
+    続きだけを計算できる。判定できない変更は current_age を返す（全期間を再計算）。
+    """
+    a, b = resolve_params(old), resolve_params(new)
+    changed = [k for k in DEFAULT_PARAMS if a[k] != b[k]]
+    if not changed:
+        return None
+    current = b["current_age"]
+    if a["current_age"] != current or a["mode"] != b["mode"]:
+        return current
+    ages = []
+    for key in changed:
+        if key == "target_age":
+            ages.append(min(a[key], b[key]) + 1)
+        elif key in _AGE_PARAMS:
+            base = min(a[key], b[key])
+            ages.append(base + _EDU_EDGES[0] if key.startswith("child") else base)
+        elif key in ("income_after", "raise_rate"):
+            ages.append(current + min(a["years_to_raise"], b["years_to_raise"]))
+        elif key == "years_to_raise":
+            ages.append(current + min(a[key], b[key]))
+        elif key in _EFFECT_START and not (key in _PEAK_PARAMS and min(a["peak_threshold"], b["peak_threshold"]) <= 0):
+            refs, offset = _EFFECT_START[key]
+            ages.append(min(min(a[r], b[r]) for r in refs) + offset)
+        else:
+            return current
+    return max(current, min(ages))
+
+# 年単位に集計するとき、年末の値を使う列（残高・資産）と平均する列。その他は合計する
+_STOCK_KEYS = {"fin_asset", "land_value", "bldg_value", "loan_balance", "net_worth"}
+_MEAN_KEYS = {"free_month"}
+
+def aggregate_annual(arrays, steps_per_year: int = 12) -> SimulationResult:
+    """月次などの結果を年単位に集計（reshape して年ごとに合計・年末値・平均）"""
+    out = {"age": np.asarray(arrays["age"])[::steps_per_year]}
+    for key in COLUMNS:
+        if key == "age":
+            continue
+        v = np.asarray(arrays[key])
+        v = v.reshape(v.shape[:-1] + (-1, steps_per_year))
+        if key in _STOCK_KEYS:
+            out[key] = v[..., -1]
+        elif key in _MEAN_KEYS:
+            out[key] = v.mean(axis=-1)
+        else:
+            out[key] = v.sum(axis=-1)
+    return SimulationResult(out)
+
+# 税・手取りを使う列（不要なら計算を省く）
+_TAX_KEYS = {"itax_self", "rtax_self", "si_self", "net_self",
+             "itax_spouse", "rtax_spouse", "si_spouse", "net_spouse", "free_month"}
+
+def _kernel(p: dict, age: np.ndarray, fields=None, paths=None, steps_per_year: int = 1, month=None) -> dict:
+    """モデル本体。p の各値はスカラーか (シナリオ数, 1) の列、age は年齢の 1 次元配列
+
+    current_age より前の年は運用・拠出なし（状態を据え置き）として扱う。
+    fields を指定した場合、それに不要な税・手取りの計算は省く。
+    paths には invest_return / land_appreciation / bldg_decline の年ごとの率
+    （(パス数, 年齢) 配列）を渡せ、その項目は p の一定率の代わりに使う。
+    steps_per_year > 1 のとき age は各年齢を steps_per_year 回繰り返した配列、
+    month はその年の何期目か（0 始まり）。収支は 1 期分、ローンは期ごとの元利均等になる。
+    """
+    spy = steps_per_year
+    paths = paths or {}
+    # 本人・妻の額面年収
+    gross_self = income_at_age(age, p["current_age"], p["income_now"], p["income_after"],
+                               p["years_to_raise"], p["raise_until_age"], p["raise_rate"])
+    gross_spouse = np.where(age >= p["spouse_start_age"], p["spouse_income"], 0.0).astype(float)
+    out = {"gross_self": gross_self, "gross_spouse": gross_spouse}
+
+    # 教育費
+    edu_args = (p["kg_cost"], p["elem_cost"], p["jhs_cost"], p["hs_cost"], p["univ_cost"], p["living_add"])
+    edu_total = (child_cost_by_age(age - p["child1_birth_age"], *edu_args)
+                 + child_cost_by_age(age - p["child2_birth_age"], *edu_args))
+
+    # 住宅：購入は house_age が期間内のときのみ発生（開始年齢より前なら未購入扱い）
+    house_age = p["house_age"]
+    house_price = np.asarray(p["house_price"], dtype=float)
+    bought = (house_price > 0) & (house_age >= p["current_age"])
+    owned = bought & (age >= house_age)
+    # 購入から数えた経過期数（購入年の最初の期 = 1）。購入していない行・年も含めた式のまま持ち、
+    # 使うところで owned を掛ける（house_age 等がスカラーなら年齢軸だけの 1 次元で済む）
+    k = np.maximum(age - house_age + 1 if spy == 1 else (age - house_age) * spy + month + 1, 0.0)
+
+    # ローン残高（元利均等の閉形式）
+    loan0 = np.maximum(0.0, house_price - p["down_payment"])
+    n_years = np.floor(np.asarray(p["mortgage_years"], dtype=float))
+    n_steps = n_years * spy
+    payment = annuity_payment(loan0, p["mortgage_rate"], n_years, spy)
+    r_m = np.asarray(p["mortgage_rate"], dtype=float) / 100.0 / spy
+    balance = remaining_balance(loan0, r_m, payment, np.minimum(k, n_steps))
+    loan_balance = np.where(k < n_steps, np.maximum(balance, 0.0), 0.0) * owned
+    paying = owned & (k <= n_steps) & (loan0 > 0)
+
+    # 住宅費（返済＋税＋維持）。維持費は購入の有無に関わらず house_age 以降に計上
+    maint_per_year = np.maximum(p["maintain_30yr_total"], 0) / 30.0
+    upkeep = np.where(house_price > 0, p["prop_tax_annual"] + p["misc_house_annual"] + maint_per_year, 0.0)
+    housing_cost = payment * paying + upkeep / spy * (age >= house_age)
+
+    # 資産価値の変動（購入年から適用）
+    land_value0 = house_price * (p["land_ratio"]/100.0)
+    bldg_value0 = house_price - land_value0
+    land_value = land_value0 * value_factor(p["land_appreciation"], k / spy, owned,
+                                            paths.get("land_appreciation"), spy)
+    bldg_value = bldg_value0 * value_factor(p["bldg_decline"], k / spy, owned, paths.get("bldg_decline"), spy)
+
+    # 拠出（貯蓄）。割合・固定額は使われている側だけ計算する
+    before_house = age < house_age
+    peak = edu_total >= p["peak_threshold"]
+    by_rate = np.asarray(p["by_rate"])
+    contrib = 0.0
+    if by_rate.any():
+        srate = np.where(before_house, p["save_rate_pre"],
+                         np.where(peak, p["save_rate_peak"], p["save_rate_post"]))
+        contrib = contrib + (gross_self + gross_spouse) * (srate/100.0) * by_rate
+    if not by_rate.all():
+        samt = np.where(before_house, p["save_amt_pre"],
+                        np.where(peak, p["save_amt_peak"], p["save_amt_post"]))
+        contrib = contrib + samt * ~by_rate
+    contrib = np.asarray(contrib, dtype=float) / spy
+
+    # 一時支出（頭金・車）は運用前に差し引く（月次ではその年の最初の期）
+    first = True if spy == 1 else month == 0
+    outflow = (np.where(bought, p["down_payment"], 0.0) * ((age == house_age) & first)
+               + np.where((age == p["car_buy_age"]) & (p["car_price"] > 0) & first, p["car_price"], 0.0))
+
+    # 金融資産の運用（複利、月次は年率と同じ実効利回りの月率）: f_t = (f_{t-1} - out_t)(1+r) + c_t
+    growth = 1 + np.asarray(paths.get("invest_return", p["invest_return"]), dtype=float) / 100.0
+    if spy > 1:
+        growth = growth ** (1.0 / spy)
+    flows = contrib - outflow * growth
+    if np.any(p["current_age"] > age[:1]):
+        started = age >= p["current_age"]
+        growth = np.where(started, growth, 1.0)
+        flows = flows * started
+    fin_asset = compound(np.asarray(p["initial_assets"], dtype=float), flows, growth)
+
+    # 総資産（= 金融資産 + 不動産価値 - ローン残高）
+    net_worth = fin_asset + land_value + bldg_value - loan_balance
+    out.update({
+        "edu": edu_total, "housing": housing_cost, "contrib": contrib,
+        "fin_asset": fin_asset, "land_value": land_value, "bldg_value": bldg_value,
+        "loan_balance": loan_balance, "net_worth": net_worth,
+    })
+
+    # 税・社会保険（個人別に計算）と月の自由に使える金額
+    if fields is None or _TAX_KEYS.intersection(fields):
+        tax_args = (p["salary_deduction_rate"], p["salary_deduction_min"], p["basic_deduction"],
+                    p["income_tax_eff_rate"], p["resident_tax_rate"], p["social_ins_rate"])
+        si_s, itx_s, rtx_s, net_s = taxes_and_net(gross_self, *tax_args)
+        si_p, itx_p, rtx_p, net_p = taxes_and_net(gross_spouse, *tax_args)
+        free_month = np.maximum(0.0, ((net_s + net_p - edu_total) / spy - housing_cost - contrib) / (12.0 / spy))
+        out.update({
+            "itax_self": itx_s, "rtax_self": rtx_s, "si_self": si_s, "net_self": net_s,
+            "itax_spouse": itx_p, "rtax_spouse": rtx_p, "si_spouse": si_p, "net_spouse": net_p,
+            "free_month": free_month,
+        })
+    if spy > 1:
+        for key in ("gross_self", "gross_spouse", "edu", *(_TAX_KEYS - {"free_month"})):
+            if key in out:
+                out[key] = out[key] / spy
+    return out
+
+def round_values(x, digits: int):
+    """組み込み round() と同じ結果になる配列の丸め
+
+    np.round は x * 10**digits の丸め誤差で .5 ちょうどに見える値を偶数側へ寄せるため、
+    積の誤差（Dekker の分割）から真の値が .5 の上下どちらにあるかを判定する。
+    """
+    x = np.asarray(x, dtype=float)
+    scale = 10.0 ** digits
+    y = x * scale
+    c = 134217729.0 * x
+    hi = c - (c - x)
+    err = (hi * scale - y) + (x - hi) * scale
+    tie = np.abs(y - np.trunc(y)) == 0.5
+    r = np.where(tie & (err > 0), np.floor(y) + 1,
+                 np.where(tie & (err < 0), np.floor(y), np.rint(y)))
+    return r / scale + 0.0
+
+def _param_columns(frame: pd.DataFrame) -> dict:
+    """パラメータ表を、キーごとの (シナリオ数, 1) 配列の dict に変換
+
+    欠けた列は既定値、全シナリオで同じ値の列はスカラーにして、
+    その項目に関する計算を年齢軸の 1 次元だけで済ませる。
+    """
+    cols = {}
+    for key, default in DEFAULT_PARAMS.items():
+        if key not in frame:
+            cols[key] = default
+            continue
+        values = frame[key].fillna(default).to_numpy(dtype=object if key == "mode" else float)
+        if len(values) and (values == values[0]).all():
+            cols[key] = values[0]
+        else:
+            cols[key] = values[:, None]
+    cols["by_rate"] = np.asarray(cols["mode"] == MODE_RATE)
+    return cols
+
+def simulate_batch(table, fields=None, chunk_size: int = 8192) -> SimulationResult:
+    """パラメータ表（1行 = 1シナリオ、列名はサイドバーの変数名）をまとめて計算する
+
+    戻り値は "age"（全シナリオ共通の年齢軸）と、fields に指定した内部キーごとの
+    (シナリオ × 年齢) 配列を持つ SimulationResult。各シナリオの current_age〜target_age の外側は NaN。
+    結果の配列は先に確保しておき、シナリオ軸を chunk_size 行ずつ計算して書き込む。
+    """
+    frame = pd.DataFrame(table)
+    n = len(frame)
+    cols = _param_columns(frame)
+    fields = [k for k in COLUMNS if k != "age"] if fields is None else list(fields)
+    cur = np.broadcast_to(cols["current_age"], (n, 1))
+    tgt = np.broadcast_to(cols["target_age"], (n, 1))
+    if n == 0:
+        return SimulationResult({"age": np.arange(0), **{k: np.empty((0, 0)) for k in fields}})
+    ages = np.arange(int(cur.min()), int(tgt.max()) + 1)
+    age = ages.astype(float)
+
+    out = {k: np.empty((n, len(ages))) for k in fields}
+    for lo in range(0, n, chunk_size):
+        hi = min(lo + chunk_size, n)
+        p = {k: v[lo:hi] if np.ndim(v) else v for k, v in cols.items()}
+        res = _kernel(p, age, fields)
+        outside = (age < cur[lo:hi]) | (age > tgt[lo:hi])
+        has_outside = outside.any()
+        for k in fields:
+            dst = out[k][lo:hi]
+            dst[...] = res[k]
+            if has_outside:
+                dst[outside] = np.nan
+    out["age"] = ages
+    return SimulationResult(out)
+
+def to_dataframe(arrays) -> pd.DataFrame:
+    """SimulationResult（または内部キーの配列 dict）を表示・CSV 用（日本語列名・丸め済み）の DataFrame に変換"""
+    arrays = _flat_columns(arrays)
+    keys = [k for k, (_, digits) in COLUMNS.items() if digits is not None and k in arrays]
+    block = np.empty((len(np.asarray(arrays["age"])), len(keys)))
+    for j, k in enumerate(keys):   # np.stack + broadcast_to より速い
+        block[:, j] = arrays[k]
+    block = round_values(block, np.array([COLUMNS[k][1] for k in keys]))
+    data = {SCENARIO_LABEL: arrays[SCENARIO_KEY]} if SCENARIO_KEY in arrays else {}
+    data[COLUMNS["age"][0]] = arrays["age"]
+    if "month" in arrays:
+        data[MONTH_LABEL] = arrays["month"]
+    data.update({COLUMNS[k][0]: block[:, j] for j, k in enumerate(keys)})
+    return pd.DataFrame(data)
+
+def simulate(params: dict, steps_per_year: int = 1) -> pd.DataFrame:
+    """app.py と同じ結果テーブルを返す（月次計算でも表は年単位に集計）
+
+    丸めと DataFrame 作りで simulate_arrays の 2〜3 倍かかる。数値だけ使うなら simulate_arrays。
+    """
+    arrays = simulate_arrays(params, steps_per_year)
+    if steps_per_year > 1:
+        arrays = aggregate_annual(arrays, steps_per_year)
+    return to_dataframe(arrays)
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""結果のファイル出力（Parquet / Arrow IPC）
+
+金額の列は float32、年齢・月は整数にし、計算に使ったパラメータと 1 年の期数（steps_per_year）を
+JSON にしてスキーマのメタデータ（PARAMS_METADATA_KEY）に入れる。
+大量シナリオは write_batch_parquet でシナリオのチャンクごとに 1 行グループずつ書き出し、
+全体を 1 つの表や CSV 文字列としてメモリに載せない。
+時間のかかる書き出し（モンテカルロの全パスなど）は ExportJobs でバックグラウンドのスレッドで作る。
+作ったバイト列は ExportCache に合計サイズの上限付きで保持する。
+"""
+import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from cachetools import LRUCache
+
+from engine import (COLUMNS, DEFAULT_PARAMS, MONTH_LABEL, SCENARIO_LABEL, _param_columns, resolve_params,
+                    simulate_batch)
+
+EXPORT_FORMATS = ("parquet", "feather")
+PARAMS_METADATA_KEY = b"asset.params"
+SCENARIO_FIELD = SCENARIO_LABEL
+PATH_FIELD = "パス"
+
+
+def _label(key: str) -> str:
+    return MONTH_LABEL if key == "month" else COLUMNS[key][0]
+
+def _params_metadata(params: dict, scenarios: dict = None, steps_per_year: int = 1) -> dict:
+    """{"params": 全シナリオ共通のパラメータ, "steps_per_year": 1 年の期数,
+    "scenarios": シナリオごとに違うパラメータの列}"""
+    meta = {"params": params, "steps_per_year": int(steps_per_year)}
+    if scenarios:
+        meta["scenarios"] = scenarios
+    return {PARAMS_METADATA_KEY: json.dumps(meta, ensure_ascii=False, sort_keys=True)}
+
+def result_table(result, params: dict = None, dtype=np.float32, steps_per_year: int = 1) -> pa.Table:
+    """1 シナリオ分の結果（SimulationResult）を Arrow の表にする（丸めなし）
+
+    steps_per_year は結果を計算したときの値（月次で計算して年次に集計した結果なら 12）。
+    """
+    columns = {}
+    for key, values in result.items():
+        values = np.asarray(values)
+        columns[_label(key)] = values.astype(np.int16 if key in ("age", "month") else dtype, copy=False)
+    table = pa.table(columns)
+    if params is not None:
+        table = table.replace_schema_metadata(_params_metadata(resolve_params(params),
+                                                               steps_per_year=steps_per_year))
+    return table
+
+def table_bytes(table: pa.Table, fmt: str) -> bytes:
+    """Arrow の表を Parquet / Arrow IPC（Feather v2）のバイト列にする"""
+    buf = io.BytesIO()
+    write_table(table, buf, fmt)
+    return buf.getvalue()
+
+def write_table(table: pa.Table, where, fmt: str):
+    if fmt == "parquet":
+        pq.write_table(table, where, compression="zstd")
+    elif fmt == "feather":
+        feather.write_feather(table, where, compression="zstd")
+    else:
+        raise ValueError(f"未対応の出力形式です: {fmt}")
+
+def read_params(schema: pa.Schema) -> dict:
+    """result_table / write_batch_parquet が書いたメタデータからパラメータを取り出す"""
+    return json.loads((schema.metadata or {})[PARAMS_METADATA_KEY])
+
+def write_batch_parquet(where, table, fields=None, chunk_size: int = 4096, dtype=np.float32) -> int:
+    """パラメータ表（1 行 = 1 シナリオ）の全シナリオを計算しながら Parquet に書き出す
+
+    列は シナリオ（表の行番号）・年齢・fields の各項目で、各シナリオの年齢範囲の行だけを持つ。
+    chunk_size シナリオごとに simulate_batch を呼び、その結果を 1 つの行グループとして書く。
+    行のない表（ヘッダーだけの CSV など）はスキーマとメタデータだけの空のファイルにする。
+    戻り値は書き出した行数。
+    """
+    frame = pd.DataFrame(table).reset_index(drop=True)
+    fields = [k for k in COLUMNS if k != "age"] if fields is None else list(fields)
+
+    # 全シナリオで同じパラメータは 1 つの値、違うものは列としてメタデータに入れる
+    constant, varying = {}, {}
+    for key, default in DEFAULT_PARAMS.items():
+        if key not in frame or len(frame) == 0:
+            constant[key] = default
+            continue
+        values = frame[key].where(frame[key].notna(), default).tolist()
+        if all(v == values[0] for v in values):
+            constant[key] = values[0]
+        else:
+            varying[key] = values
+    schema = pa.schema(
+        [(SCENARIO_FIELD, pa.int32()), (COLUMNS["age"][0], pa.int16())]
+        + [(COLUMNS[k][0], pa.from_numpy_dtype(np.dtype(dtype))) for k in fields],
+        metadata=_params_metadata(constant, varying, steps_per_year=1),   # simulate_batch は年次
+    )
+
+    rows = 0
+    with pq.ParquetWriter(where, schema, compression="zstd") as writer:
+        for lo in range(0, len(frame), chunk_size):
+            chunk = frame.iloc[lo:lo + chunk_size]
+            res = simulate_batch(chunk, fields)
+            ages = _param_columns(chunk[[k for k in ("current_age", "target_age") if k in chunk]])
+            inside = (res["age"] >= ages["current_age"]) & (res["age"] <= ages["target_age"])
+            scenario, col = np.nonzero(np.broadcast_to(inside, (len(chunk), len(res["age"]))))
+            data = [pa.array((scenario + lo).astype(np.int32)), pa.array(res["age"][col].astype(np.int16))]
+            data += [pa.array(res[k][scenario, col].astype(dtype, copy=False)) for k in fields]
+            writer.write_table(pa.Table.from_arrays(data, schema=schema))
+            rows += len(scenario)
+    return rows
+
+def write_mc_paths(where, result: dict, params: dict = None, rows_per_group: int = 2048, progress=None) -> int:
+    """simulate_mc(keep_paths=True) の全パスを Parquet に書き出す（パス・年齢・各項目の列）
+
+    rows_per_group パスごとに 1 行グループとして書き、書いた割合を progress に渡す。戻り値は行数。
+    """
+    paths = {k: v for k, v in result["paths"].items() if k != "age"}
+    ages = np.asarray(result["age"])
+    n_paths = result["n_paths"]
+    schema = pa.schema(
+        [(PATH_FIELD, pa.int32()), (COLUMNS["age"][0], pa.int16())]
+        + [(COLUMNS[k][0], pa.from_numpy_dtype(v.dtype)) for k, v in paths.items()],
+        metadata=_params_metadata(resolve_params(params)) if params is not None else None,
+    )
+    with pq.ParquetWriter(where, schema, compression="zstd") as writer:
+        for lo in range(0, n_paths, rows_per_group):
+            hi = min(lo + rows_per_group, n_paths)
+            data = [pa.array(np.repeat(np.arange(lo, hi, dtype=np.int32), len(ages))),
+                    pa.array(np.tile(ages.astype(np.int16), hi - lo))]
+            data += [pa.array(v[lo:hi].ravel()) for v in paths.values()]
+            writer.write_table(pa.Table.from_arrays(data, schema=schema))
+            if progress is not None:
+                progress(hi / n_paths)
+    return n_paths * len(ages)
+
+
+class ExportJob:
+    """バックグラウンドで作っている書き出し 1 件（progress は 0〜1）"""
+
+    __slots__ = ("progress", "future")
+
+    def __init__(self):
+        self.progress = 0.0
+        self.future = None
+
+    def set_progress(self, fraction: float):
+        self.progress = min(max(float(fraction), 0.0), 1.0)
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def error(self):
+        return self.future.exception() if self.future.done() else None
+
+    def result(self) -> bytes:
+        return self.future.result()
+
+
+class ExportJobs:
+    """書き出しのバイト列をスレッドプールで作り、キー（結果のハッシュ）ごとに maxsize 件まで保持する
+
+    同じキーの書き出しは 1 回だけ作る。描画スレッドは job.progress を見て進捗を表示できる。
+    """
+
+    def __init__(self, max_workers: int = 2, maxsize: int = 8):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="export")
+        self._jobs = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def submit(self, key: str, build) -> ExportJob:
+        """build(progress) -> bytes をバックグラウンドで実行する（同じキーが既にあればそれを返す）"""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or (job.done() and job.error() is not None):
+                job = ExportJob()
+                job.future = self._pool.submit(build, job.set_progress)
+                self._jobs[key] = job
+            return job
+
+
+class ExportCache:
+    """書き出しのバイト列をキー（結果のハッシュ）ごとに保持する（合計 max_bytes まで・LRU）"""
+
+    def __init__(self, max_bytes: int = 64 * 2**20):
+        self._cache = LRUCache(maxsize=max_bytes, getsizeof=len)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key: str, build) -> bytes:
+        """キャッシュになければ build() で作る（max_bytes より大きいものは保持しない）"""
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self.hits += 1
+                return data
+            self.misses += 1
+        data = build()
+        with self._lock:
+            if len(data) <= self._cache.maxsize:
+                self._cache[key] = data
+        return data
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""各バージョンのモデルの出力を比べる回帰チェック（Streamlit なし）
+
+    python golden.py                                   # version/app_v*.py と現在のエンジンを v1.0.2 と比較
+    python golden.py -n 10000 -j 8 -o report.json      # 10000 ケースを 8 プロセスで
+    python golden.py --models app --reference version/app_v1.0.2.py
+
+version/ の各スナップショットはスクリプトの先頭から結果テーブル（df = ...）までを取り出し、
+サイドバーのウィジェット呼び出しをパラメータの参照に置き換えて実行する。
+記録時の round() も外し、丸める前の値で比べる。
+"app" は engine.simulate_arrays（app.py の表の丸める前の値）。
+ランダムなパラメータはお手本（--reference）のウィジェットの範囲から作り、
+お手本と列ごとに比べて食い違ったケースを報告する。既定の許容差は浮動小数点の誤差程度（相対 1e-9）。
+バージョン間で名前の変わったパラメータは PARAM_NAMES で対応させる。
+対応先のないパラメータは「未対応のパラメータ」として食い違いと同じく失敗にする。
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from engine import DEFAULT_PARAMS, simulate_arrays
+
+APP_MODEL = "app"
+DEFAULT_REFERENCE = os.path.join("version", "app_v1.0.2.py")
+NUMBER_WIDGETS = ("number_input", "slider")
+CHOICE_WIDGETS = ("radio", "selectbox")
+FLAG_WIDGETS = ("checkbox", "toggle")
+# 表示にしか使わないライブラリ（df より前の import は読み飛ばす）
+DISPLAY_MODULES = ("streamlit", "plotly", "altair")
+DEFAULT_TOL = 1e-9
+
+# お手本ごとの、モデルへのパラメータ名の対応（お手本の名前 → モデルの名前、None は対応先なし）
+# 名前が同じパラメータは書かなくてよい
+PARAM_NAMES = {
+    "app_v1.0.2": {
+        "app_v1.0.1": {
+            "maintain_30yr_total": "maint_30yr_total",
+            "car_buy_age": "car1_age",
+            "car_price": "car1_cost",
+            "misc_house_annual": None,
+        },
+        "app_v1.0.0": {
+            "maintain_30yr_total": None,
+            "misc_house_annual": None,
+            "car_buy_age": None,
+            "car_price": None,
+            "spouse_income": None,
+            "spouse_start_age": None,
+        },
+    },
+}
+# お手本にないモデルだけのパラメータは、お手本と同じ計算になる値に固定する
+PARAM_PINS = {
+    "app_v1.0.2": {
+        "app_v1.0.1": {"spouse_growth": 0.0, "car2_age": 18, "car2_cost": 0, "car_running_cost": 0},
+    },
+}
+
+
+class _NullStreamlit:
+    """st の代わり。ウィジェット以外の呼び出し（見出し・レイアウト等）はすべて何もしない"""
+
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def columns(self, spec, *args, **kwargs):
+        return [self] * (spec if isinstance(spec, int) else len(spec))
+
+    def tabs(self, labels, *args, **kwargs):
+        return [self] * len(labels)
+
+
+def _arg(call: ast.Call, index: int, name: str):
+    """ウィジェット呼び出しの位置引数 index / キーワード引数 name の式（無ければ None）"""
+    for kw in call.keywords:
+        if kw.arg == name:
+            return kw.value
+    return call.args[index] if len(call.args) > index else None
+
+def _widget(node):
+    """st.<ウィジェット>(...) の呼び出しならウィジェット名"""
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and isinstance(node.func.value, ast.Name) and node.func.value.id == "st"
+            and node.func.attr in NUMBER_WIDGETS + CHOICE_WIDGETS + FLAG_WIDGETS):
+        return node.func.attr
+    return None
+
+def _literal(node):
+    try:
+        return ast.literal_eval(node) if node is not None else None
+    except ValueError:
+        return None
+
+
+class _WidgetsToParams(ast.NodeTransformer):
+    """`x = st.number_input(...)` を `x = __param__("x", 既定値)` に置き換えて範囲を記録し、
+    `round(x, n)` を `x` に置き換える（丸める前の値で比べるため）"""
+
+    def __init__(self):
+        self.widgets = {}
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and node.func.id == "round" and node.args:
+            return node.args[0]
+        return node
+
+    def visit_Assign(self, node):
+        kind = _widget(node.value)
+        if kind is None or len(node.targets) != 1 or not isinstance(node.targets[0], ast.Name):
+            return self.generic_visit(node)
+        name, call = node.targets[0].id, node.value
+        if kind in CHOICE_WIDGETS:
+            options = _arg(call, 1, "options")
+            index = _arg(call, 2, "index") or ast.Constant(0)
+            self.widgets[name] = {"kind": "choice", "options": _literal(options)}
+            node.value = ast.Call(ast.Name("__choice__", ast.Load()), [ast.Constant(name), options, index], [])
+        else:
+            if kind in NUMBER_WIDGETS:
+                lo, hi = _arg(call, 1, "min_value"), _arg(call, 2, "max_value")
+                default = _arg(call, 3, "value") or lo
+                self.widgets[name] = {"kind": "number", "min": _literal(lo), "max": _literal(hi),
+                                      "value": _literal(default)}
+            else:
+                default = _arg(call, 1, "value") or ast.Constant(False)
+                self.widgets[name] = {"kind": "flag"}
+            node.value = ast.Call(ast.Name("__param__", ast.Load()), [ast.Constant(name), default], [])
+        return ast.fix_missing_locations(node)
+
+
+class ScriptModel:
+    """app_v*.py のスナップショットから取り出したモデル（params → 結果の DataFrame）"""
+
+    def __init__(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename=path)
+        body = []
+        for stmt in tree.body:
+            if isinstance(stmt, (ast.Import, ast.ImportFrom)) and any(
+                    (getattr(stmt, "module", None) or alias.name).split(".")[0] in DISPLAY_MODULES
+                    for alias in stmt.names):
+                continue
+            body.append(stmt)
+            if (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1
+                    and isinstance(stmt.targets[0], ast.Name) and stmt.targets[0].id == "df"):
+                break
+        else:
+            raise ValueError(f"{path}: 結果テーブル（df = ...）が見つかりません")
+        transformer = _WidgetsToParams()
+        module = transformer.visit(ast.Module(body=body, type_ignores=[]))
+        self.path = path
+        self.widgets = transformer.widgets
+        self._code = compile(module, path, "exec")
+
+    def __call__(self, params: dict):
+        def param(name, default):
+            value = params.get(name)
+            return default if value is None else value
+
+        def choice(name, options, index):
+            i = params.get(name)
+            return options[i if i is not None and 0 <= i < len(options) else index]
+
+        ns = {"st": _NullStreamlit(), "__param__": param, "__choice__": choice, "__name__": "__golden__"}
+        exec(self._code, ns)
+        return ns["df"]
+
+
+def _app_model(widgets: dict):
+    """現在のエンジン（丸める前の値）。選択肢のパラメータ（お手本の選択肢の番号）は値に直して渡す"""
+    def run(params: dict):
+        p = {}
+        for name, value in params.items():
+            spec = widgets.get(name)
+            p[name] = spec["options"][value] if spec and spec["kind"] == "choice" else value
+        return simulate_arrays(p).to_pandas()
+    return run
+
+def param_mapping(reference: str, name: str, ref_widgets: dict, model_params) -> tuple:
+    """お手本のパラメータとモデル name のパラメータの対応 → (名前の対応, 固定する値, 未対応のパラメータ)
+
+    未対応のパラメータは、お手本にあってモデルに対応先のないものと、
+    モデルにだけあって PARAM_PINS で固定していないもの（「（モデルのみ）」を付ける）。
+    """
+    ref_key = os.path.splitext(os.path.basename(reference))[0]
+    renames = PARAM_NAMES.get(ref_key, {}).get(name, {})
+    pins = dict(PARAM_PINS.get(ref_key, {}).get(name, {}))
+    names, unmapped = {}, []
+    for p in ref_widgets:
+        target = renames.get(p, p)
+        if target is not None and target in model_params:
+            names[p] = target
+        else:
+            unmapped.append(p)
+    used = set(names.values()) | set(pins)
+    unmapped += [f"{p}（モデルのみ）" for p in model_params if p not in used]
+    return names, pins, unmapped
+
+def random_corpus(widgets: dict, n: int, seed: int = 0, edge_prob: float = 0.1) -> list:
+    """ウィジェットの範囲からランダムなパラメータを n 組作る（ときどき範囲の端の値を使う）
+
+    選択肢のパラメータは選択肢の番号で持つ（バージョンごとに表示名が違っても同じ番号を選ぶ）。
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        p = {}
+        for name, spec in widgets.items():
+            if spec["kind"] == "choice":
+                p[name] = rng.randrange(len(spec["options"] or [None]))
+            elif spec["kind"] == "number" and spec["min"] is not None and spec["max"] is not None:
+                lo, hi = spec["min"], spec["max"]
+                if rng.random() < edge_prob:
+                    p[name] = rng.choice((lo, hi))
+                elif isinstance(lo, int) and isinstance(hi, int):
+                    p[name] = rng.randint(lo, min(hi, max(lo, 10 * (spec["value"] or 0), 100)))
+                else:
+                    p[name] = round(rng.uniform(lo, hi), 2)
+        corpus.append(p)
+    return corpus
+
+def compare_frames(ref, out, rtol: float, atol: float) -> dict:
+    """共通の列ごとの最大の差（食い違った列だけ）。行数が違えば {"行数": (お手本, 対象)}
+
+    atol はその列のお手本の最大の絶対値（1 未満なら 1）に対する比。
+    ローン完済時の残高のように、大きな値どうしの引き算で 0 の近くに残る誤差を許すため。
+    """
+    if len(ref) != len(out):
+        return {"行数": (len(ref), len(out))}
+    diffs = {}
+    for col in ref.columns.intersection(out.columns):
+        a = ref[col].to_numpy(dtype=float)
+        b = out[col].to_numpy(dtype=float)
+        scale = max(np.nanmax(np.abs(a), initial=0.0), 1.0)
+        bad = ~np.isclose(b, a, rtol=rtol, atol=atol * scale, equal_nan=True)
+        if bad.any():
+            diffs[col] = float(np.nanmax(np.abs(b - a)[bad]))
+    return diffs
+
+
+# プロセスごとに 1 回だけモデルを読み込む（モデル名 → (モデル, 名前の対応, 固定する値)）
+_models = {}
+
+def _load_models(reference: str, model_paths: dict) -> dict:
+    """モデルを読み込み、モデル名 → 未対応のパラメータを返す"""
+    global _models
+    ref = ScriptModel(reference)
+    _models = {"__reference__": (ref, None, None)}
+    unmapped = {}
+    for name, path in model_paths.items():
+        if path is None:
+            names, pins, unmapped[name] = param_mapping(reference, name, ref.widgets, DEFAULT_PARAMS)
+            model = _app_model({names[k]: spec for k, spec in ref.widgets.items() if k in names})
+        else:
+            model = ScriptModel(path)
+            names, pins, unmapped[name] = param_mapping(reference, name, ref.widgets, model.widgets)
+        _models[name] = (model, names, pins)
+    return unmapped
+
+def _run_chunk(cases, rtol, atol):
+    """ケースの塊をお手本と各モデルで計算し、[(ケース番号, {モデル名: 差分 or エラー})] を返す"""
+    ref = _models["__reference__"][0]
+    out = []
+    for i, params in cases:
+        expected = ref(params)
+        result = {}
+        for name, (model, names, pins) in _models.items():
+            if name == "__reference__":
+                continue
+            mapped = {names[k]: v for k, v in params.items() if k in names}
+            mapped.update(pins)
+            try:
+                diffs = compare_frames(expected, model(mapped), rtol, atol)
+            except Exception as e:
+                diffs = {"エラー": f"{type(e).__name__}: {e}"}
+            if diffs:
+                result[name] = diffs
+        out.append((i, result))
+    return out
+
+def run(reference: str, model_paths: dict, n: int, seed: int = 0, jobs: int = 1,
+        rtol: float = DEFAULT_TOL, atol: float = DEFAULT_TOL, chunk: int = 200) -> dict:
+    """お手本と各モデルを n ケースで比べ、モデルごとの食い違いと未対応のパラメータをまとめる"""
+    corpus = random_corpus(ScriptModel(reference).widgets, n, seed)
+    chunks = [list(enumerate(corpus))[lo:lo + chunk] for lo in range(0, n, chunk)]
+    unmapped = _load_models(reference, model_paths)
+    if jobs <= 1:
+        results = [r for c in chunks for r in _run_chunk(c, rtol, atol)]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_load_models,
+                                 initargs=(reference, model_paths)) as pool:
+            results = [r for rs in pool.map(_run_chunk, chunks, [rtol] * len(chunks), [atol] * len(chunks))
+                       for r in rs]
+
+    report = {name: {"cases": n, "diverged": 0, "unmapped": unmapped[name], "columns": {}, "examples": []}
+              for name in model_paths}
+    for i, result in results:
+        for name, diffs in result.items():
+            rep = report[name]
+            rep["diverged"] += 1
+            for col, d in diffs.items():
+                c = rep["columns"].setdefault(col, {"cases": 0, "max_abs": 0.0})
+                c["cases"] += 1
+                if isinstance(d, float):
+                    c["max_abs"] = max(c["max_abs"], d)
+            if len(rep["examples"]) < 5:
+                rep["examples"].append({"case": i, "params": corpus[i], "diffs": diffs})
+    return report
+
+def failed(rep: dict) -> bool:
+    """食い違ったケースか未対応のパラメータがあれば失敗"""
+    return bool(rep["diverged"] or rep["unmapped"])
+
+def default_models() -> dict:
+    """version/app_v*.py と現在のエンジン（モデル名 → パス、エンジンは None）"""
+    paths = sorted(glob.glob(os.path.join("version", "app_v*.py")))
+    return {**{os.path.splitext(os.path.basename(p))[0]: p for p in paths}, APP_MODEL: None}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="各バージョンのモデルの出力をお手本と比較")
+    parser.add_argument("-n", "--cases", type=int, default=2000, help="ランダムなケース数（既定: 2000）")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="並列プロセス数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reference", default=DEFAULT_REFERENCE, help=f"お手本（既定: {DEFAULT_REFERENCE}）")
+    parser.add_argument("--models", nargs="+", help="比べるモデル名（既定: すべて）")
+    parser.add_argument("--atol", type=float, default=DEFAULT_TOL, help=f"許容する差（既定: {DEFAULT_TOL}）")
+    parser.add_argument("--rtol", type=float, default=DEFAULT_TOL, help=f"許容する相対差（既定: {DEFAULT_TOL}）")
+    parser.add_argument("--require", nargs="*", default=[APP_MODEL],
+                        help="食い違い・未対応のパラメータがあれば終了コード 1 にするモデル（既定: app）")
+    parser.add_argument("-o", "--out", help="結果の JSON の保存先")
+    args = parser.parse_args(argv)
+
+    models = default_models()
+    if args.models:
+        unknown = set(args.models) - set(models)
+        if unknown:
+            parser.error(f"未知のモデル: {sorted(unknown)}（候補: {sorted(models)}）")
+        models = {k: v for k, v in models.items() if k in args.models}
+
+    report = run(args.reference, models, args.cases, args.seed, args.jobs, args.rtol, args.atol)
+    for name, rep in report.items():
+        print(f"{name:12s} 食い違い {rep['diverged']:6d} / {rep['cases']} ケース"
+              + ("" if failed(rep) else "  OK"))
+        if rep["unmapped"]:
+            print(f"    未対応のパラメータ: {', '.join(rep['unmapped'])}")
+        for col, c in sorted(rep["columns"].items(), key=lambda kv: -kv[1]["cases"]):
+            print(f"    {col}: {c['cases']} ケース（最大の差 {c['max_abs']:.6g}）")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"reference": args.reference, "seed": args.seed, "models": report},
+                      f, ensure_ascii=False, indent=1)
+    return 1 if any(failed(report[m]) for m in args.require if m in report) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,393 @@
+# karuta_app.py (UTF-8)
+import os
+import time
+import base64
+import random
+import streamlit as st
+from streamlit.components.v1 import html
+
+from karuta_media import AudioServer
+from karuta_tts import PRIORITY_NEXT, AudioCache, SynthesisPool, audio_key, backend_from_config
+
+st.set_page_config(page_title="カルタ読み上げ", page_icon="🗣️", layout="centered")
+
+# ======== 読み上げ元テキスト（パスはここで指定）========
+SOURCE_FILES = {
+    "テキスト１": "karuta_v0.txt",
+    "テキスト２": "karuta.txt",
+}
+TMP_FILE = "tmp.txt"
+
+# =====（任意）ボタンスタイル =====
+st.markdown("""
+<style>
+div.stButton > button {
+  font-size: 1.10rem; font-weight: 700; padding: 0.6rem 1rem;
+  border-radius: 12px; border: 2px solid #16a34a; background: #bbf7d0;
+}
+div[data-testid="column"]:last-child div.stButton > button {
+  border-color: #dc2626; background: #fecaca;
+}
+</style>
+""", unsafe_allow_html=True)
+
+# ===== ユーティリティ =====
+def load_lines(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [ln.rstrip("\n") for ln in f]
+    # 空行除去
+    return [ln.strip() for ln in lines if ln.strip()]
+
+def tmp_exists() -> bool:
+    return os.path.exists(TMP_FILE)
+
+def clear_tmp():
+    with open(TMP_FILE, "w", encoding="utf-8") as f:
+        f.write("")
+
+def append_tmp(index: int, text: str):
+    """tmp.txt に 'index<TAB>text' 形式で追記（重複防止）"""
+    if index < 0 or not text:
+        return
+    seen = load_tmp_indices()
+    if index in seen:
+        return
+    with open(TMP_FILE, "a", encoding="utf-8") as f:
+        f.write(f"{index}\t{text}\n")
+
+def load_tmp_indices() -> set:
+    """tmp.txt から既読 index を読み出し（'idx\\ttext' 形式）"""
+    if not tmp_exists():
+        return set()
+    s = set()
+    with open(TMP_FILE, "r", encoding="utf-8") as f:
+        for ln in f:
+            ln = ln.strip()
+            if not ln:
+                continue
+            # フォーマット移行対策: 旧形式（textのみ）があれば無視
+            parts = ln.split("\t", 1)
+            try:
+                idx = int(parts[0])
+                s.add(idx)
+            except Exception:
+                # 旧形式は index 不明なので既読にしない（全札読了を優先）
+                pass
+    return s
+
+def ensure_state():
+    ss = st.session_state
+    # --- セッション初回（ブラウザ再読込やRerunでリセットされる） ---
+    if "initialized" not in ss:
+        ss.initialized = True
+        # ◆要件: rerun（初期化）時は tmp.txt を空に
+        clear_tmp()
+
+    ss.setdefault("source_label", list(SOURCE_FILES.keys())[0])
+    ss.setdefault("source_path", SOURCE_FILES[ss["source_label"]])
+    ss.setdefault("lines", [])
+    ss.setdefault("order", [])            # シャッフル順（indexの列）
+    ss.setdefault("pos", 0)               # 0-based
+    ss.setdefault("started", False)       # 1枚目は押されるまで再生しない
+    ss.setdefault("audio", None)          # 再生中の音声（karuta_tts.Audio）
+    ss.setdefault("audio_key", "")        # 再生中の音声のキャッシュのキー（配信 URL に使う）
+    ss.setdefault("audio_token", 0)
+    ss.setdefault("last_play_ts", 0.0)
+    ss.setdefault("await_next", False)
+    ss.setdefault("lang", "ja")
+    ss.setdefault("slow", False)
+    ss.setdefault("repeat_sec", 1.0)      # 要件: 1秒
+    ss.setdefault("read_set", set())      # 既読 index（tmp反映後）
+    ss.setdefault("read_history", [])     # 表示用（text）
+    ss.setdefault("warmup", None)         # セットの先行合成（DeckWarmup）
+    ss.setdefault("warm_all", True)       # 読込時にセット全体を合成するか
+    ss.setdefault("prefetch_n", 3)        # 次に読む何枚を先に合成するか
+
+def shuffle_order():
+    ss = st.session_state
+    ss.order = list(range(len(ss.lines)))
+    random.shuffle(ss.order)
+    ss.pos = 0
+    ss.started = False
+    apply_tmp_as_read()  # tmp反映 → 未読先頭へ
+    warm_deck()
+
+def apply_tmp_as_read():
+    """tmp の既読 index を反映し、pos を未読先頭に合わせる"""
+    ss = st.session_state
+    ss.read_set = load_tmp_indices()
+    # 表示用履歴も更新（index順ではなく、追記順に近くならないので簡易再構築）
+    ss.read_history = [ss.lines[i] for i in ss.read_set if 0 <= i < len(ss.lines)]
+    # 未読先頭へ
+    n = len(ss.order)
+    i = ss.pos
+    while i < n and ss.order[i] in ss.read_set:
+        i += 1
+    ss.pos = i
+
+def current_index() -> int:
+    ss = st.session_state
+    if not ss.lines:
+        return -1
+    n = len(ss.order)
+    i = ss.pos
+    while i < n and ss.order[i] in ss.read_set:
+        i += 1
+    ss.pos = i
+    return ss.order[i] if i < n else -1
+
+def current_text() -> str:
+    idx = current_index()
+    if idx < 0:
+        return ""
+    return st.session_state.lines[idx]
+
+def mark_read(idx: int, text: str):
+    ss = st.session_state
+    if idx >= 0 and idx not in ss.read_set:
+        ss.read_set.add(idx)
+        ss.read_history.append(text)
+        append_tmp(idx, text)  # ◆indexで永続化（同文面でも別札扱い）
+
+@st.cache_resource
+def get_audio_cache():
+    """音声のディスクキャッシュ（全セッション共通。保存先は環境変数 KARUTA_TTS_CACHE で変更可）"""
+    return AudioCache()
+
+@st.cache_resource
+def get_tts_backend():
+    """読み上げエンジン（環境変数 KARUTA_TTS_BACKEND: gtts / espeak / dir:<フォルダ> / stub）"""
+    return backend_from_config()
+
+@st.cache_resource
+def get_synthesis_pool():
+    """合成用のスレッドプール（全セッション共通・同じ札の合成は 1 回だけ）"""
+    return SynthesisPool(get_audio_cache(), get_tts_backend(), max_workers=4)
+
+def warm_deck():
+    """未読の札をシャッフル順（pos から）にバックグラウンドで合成しておく（済んでいる札はキャッシュから）
+
+    シャッフルし直し・リセットのたびに呼び、まだ合成を待っている札を新しい順に並べ直す。
+    """
+    ss = st.session_state
+    if ss.warm_all:
+        texts = [ss.lines[i] for i in upcoming_indices(len(ss.order))]
+        ss.warmup = get_synthesis_pool().warm(texts, ss.lang, ss.slow)
+    else:
+        ss.warmup = None
+    prefetch_next()
+
+def upcoming_indices(n: int) -> list:
+    """シャッフル順で pos 以降の未読の札 n 枚（読み上げ済みの現在の札は既読なので入らない）"""
+    ss = st.session_state
+    out = []
+    for idx in ss.order[ss.pos:]:
+        if len(out) >= n:
+            break
+        if idx not in ss.read_set:
+            out.append(idx)
+    return out
+
+def prefetch_next():
+    """次に読む prefetch_n 枚を、セット全体の先行合成より先にバックグラウンドで合成しておく"""
+    ss = st.session_state
+    texts = [ss.lines[i] for i in upcoming_indices(ss.prefetch_n)]
+    if texts:
+        get_synthesis_pool().warm(texts, ss.lang, ss.slow, PRIORITY_NEXT)
+
+@st.cache_resource
+def get_audio_server():
+    """音声を URL で配信するサーバー（全セッション共通。ポートは KARUTA_MEDIA_PORT、起動できなければ None）"""
+    try:
+        return AudioServer(get_audio_cache())
+    except OSError:
+        return None
+
+def synth_say(text: str):
+    """合成（先行合成・キャッシュ済みならそれを使う）→プレイヤー更新→既読登録"""
+    ss = st.session_state
+    ss.audio = get_synthesis_pool().get(text, ss.lang, ss.slow)
+    ss.audio_key = audio_key(text, ss.lang, ss.slow, get_tts_backend().name)
+    st.session_state.audio_token += 1
+    st.session_state.last_play_ts = time.time()
+    st.session_state.await_next = True
+    idx = current_index()
+    mark_read(idx, text)
+    prefetch_next()  # 再生中に次の札を合成しておく
+
+def go_next() -> bool:
+    """次の未読へ。無ければ False"""
+    ss = st.session_state
+    if not ss.lines:
+        return False
+    ss.pos += 1
+    n = len(ss.order)
+    while ss.pos < n and ss.order[ss.pos] in ss.read_set:
+        ss.pos += 1
+    return ss.pos < n
+
+def js_autorefresh(ms: int = 1050):
+    html(f"""
+    <script>
+      setTimeout(function(){{
+        const u = new URL(window.location);
+        u.searchParams.set('_t', Date.now().toString());
+        window.location.href = u.toString();
+      }}, {ms});
+    </script>
+    """, height=0)
+
+def audio_src(audio, key: str) -> str:
+    """音声の URL（配信サーバーがない・プロキシ越しや https で公開 URL がなければ従来どおり base64 の data URL）"""
+    server = get_audio_server()
+    src = server.url(key, st.context.headers, st.context.url) if server is not None else None
+    if src is None:
+        return f"data:{audio.mime};base64," + base64.b64encode(audio.data).decode("ascii")
+    return src
+
+def render_audio(audio, key: str, token: int):
+    """再生のトークンが変わるたびに先頭から再生する（音声は URL で取り、2 回目以降はブラウザのキャッシュ）"""
+    html(f"""
+    <audio id="player-{token}" controls autoplay>
+      <source src="{audio_src(audio, key)}" type="{audio.mime}">
+      Your browser does not support the audio element.
+    </audio>
+    <script>
+      const others = document.querySelectorAll('audio[id^="player-"]');
+      others.forEach(a => {{
+        if (a.id !== "player-{token}") {{
+          try {{ a.pause(); a.currentTime = 0; }} catch(e) {{}}
+        }}
+      }});
+      const p = document.getElementById("player-{token}");
+      if (p) {{
+        const pr = p.play();
+        if (pr !== undefined) pr.catch(_=>{{}});
+      }}
+    </script>
+    """, height=80)
+
+# ===== 初期化 =====
+ensure_state()
+
+# ===== サイドバー：読み上げセット選択（丸ボタン） =====
+st.sidebar.header("読み上げセット")
+labels = list(SOURCE_FILES.keys())
+new_label = st.sidebar.radio("使用するテキストを選択", labels, index=labels.index(st.session_state.source_label))
+st.sidebar.checkbox("読み込み時にセット全体の音声を準備", key="warm_all")
+st.sidebar.number_input("先に準備する枚数（次に読む札）", 0, 20, key="prefetch_n")
+
+# セット切替時：◆tmp をリセット → 読込 → シャッフル → tmp反映（空）
+if new_label != st.session_state.source_label:
+    st.session_state.source_label = new_label
+    st.session_state.source_path = SOURCE_FILES[new_label]
+    clear_tmp()  # ◆要件：切替時に tmp リセット
+    try:
+        st.session_state.lines = load_lines(st.session_state.source_path)
+        shuffle_order()
+        st.success(f"「{new_label}」を読み込みました（{len(st.session_state.lines)} 行）。")
+    except Exception as e:
+        st.error(f"読み込みに失敗しました: {e}")
+
+# 起動時自動読み込み（未読み込み時）
+if not st.session_state.lines:
+    path = st.session_state.source_path
+    if os.path.exists(path):
+        try:
+            st.session_state.lines = load_lines(path)
+            shuffle_order()
+        except Exception as e:
+            st.error(f"起動時の読み込みに失敗しました: {e}")
+    else:
+        st.info(f"同じフォルダに `{path}`（UTF-8／1行=1札）を置いてください。")
+        st.stop()
+
+# ===== 画面ヘッダ =====
+st.title("🗣️ カルタ読み上げアプリ")
+st.caption(f"現在のセット：**{st.session_state.source_label}**（{st.session_state.source_path}）")
+
+# ===== ボタン行 =====
+col_next, col_reset = st.columns(2)
+with col_next:
+    next_clicked = st.button("⏭ 次のカード", width="stretch")
+with col_reset:
+    reset_clicked = st.button("🧹 最初から", width="stretch")
+
+# ===== ボタン処理 =====
+if reset_clicked:
+    clear_tmp()     # ◆要件：手動リセットで tmp クリア
+    shuffle_order() # 並び再シャッフル & tmp反映（空）
+    st.success("初期化しました（並びシャッフル・既読クリア）。")
+
+if next_clicked:
+    if not st.session_state.started:
+        st.session_state.started = True
+        synth_say(current_text())              # 現在表示中の未読を読み上げ & 既読化
+    else:
+        has_next = go_next()
+        if has_next:
+            synth_say(current_text())          # 進めた未読を読み上げ
+        else:
+            # ここに来るのは「全札読了時」。案内だけ出して音声は止める。
+            st.session_state.audio = None
+            st.session_state.await_next = False
+            st.info("すべて読み終えました。「最初から」でリセットしてください。")
+
+# ===== 自動リピート（1秒） =====
+now = time.time()
+if st.session_state.started and st.session_state.await_next and st.session_state.audio:
+    elapsed = now - st.session_state.last_play_ts
+    if elapsed >= st.session_state.repeat_sec:
+        st.session_state.audio_token += 1
+        st.session_state.last_play_ts = now
+    else:
+        ms = int((st.session_state.repeat_sec - elapsed) * 1000) + 100
+        js_autorefresh(max(ms, 350))
+
+# ===== 表示（ボタン処理後に再取得して必ず更新） =====
+cur_text = current_text()
+
+# 進捗（既読枚数 / 合計）
+read_count = len(st.session_state.read_set)
+total = len(st.session_state.lines)
+st.caption(f"進捗: {read_count} / {total}")
+
+# 先行合成の進み具合
+def warmup_status():
+    """先行合成の進捗。終わるまでこの部分だけを 0.5 秒ごとに再実行する"""
+    warmup = st.session_state.warmup
+    if warmup is None:
+        return
+    polling = not warmup.done()
+
+    @st.fragment(run_every=0.5 if polling else None)
+    def show():
+        if not warmup.done():
+            st.progress(warmup.progress, text=f"音声を準備中… {warmup.completed} / {warmup.total}")
+        elif polling:
+            st.rerun()   # 終わったらページ全体を再実行して定期実行を止める
+        elif warmup.errors():
+            st.warning(f"{len(warmup.errors())} 枚の音声を準備できませんでした（読み上げ時にもう一度試します）: "
+                       f"{warmup.errors()[0]}")
+    show()
+
+warmup_status()
+
+# 音声の描画
+if st.session_state.audio:
+    render_audio(st.session_state.audio, st.session_state.audio_key, st.session_state.audio_token)
+
+# 既読一覧
+st.markdown("### すでに読んだ札")
+if st.session_state.read_history:
+    for t in reversed(st.session_state.read_history):
+        st.markdown(f"- {t}")
+else:
+    st.write("（まだありません）")
+
+# 先読みの効果（全セッション合計）
+pool_stats = get_synthesis_pool().stats()
+st.sidebar.caption(f"読み上げエンジン: {get_tts_backend().name}")
+st.sidebar.caption(f"先読みの当たり率 {pool_stats['hit_rate']:.0%}（準備済み {pool_stats['ready']} 回・"
+                   f"待ち {pool_stats['waited']} 回、待ち時間 中央値 {pool_stats['wait_p50_ms']:.0f} ms・"
+                   f"最大 {pool_stats['wait_max_ms']:.0f} ms）")
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""カルタの音声を URL で配信する小さな HTTP サーバー
+
+    GET /audio/<キー>   AudioCache の音声（キーは karuta_tts.audio_key）
+
+キーは内容（エンジン・言語・速度・テキスト）のハッシュなので、同じ URL の中身は変わらない。
+そのため Cache-Control: immutable を付け、2 回目以降の再生はブラウザのキャッシュから読ませる。
+ページには音声の URL と再生のトークンだけを載せ、音声のバイト列は毎回送らない。
+
+サーバーは Streamlit の横のポートで http だけを話す。リバースプロキシ越し（X-Forwarded-* / Forwarded があるとき）は
+ブラウザからそのポートに届くとは限らず、https のページ（Streamlit 自身が TLS で配信しているときなど）からは
+http の音声は混在コンテンツとして読めない。どちらも公開 URL（KARUTA_MEDIA_URL）がなければ URL を返さない
+（呼び出し側は data URL に戻す）。
+"""
+import logging
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+MEDIA_PORT_ENV = "KARUTA_MEDIA_PORT"
+MEDIA_URL_ENV = "KARUTA_MEDIA_URL"
+DEFAULT_MEDIA_PORT = 8718
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+AUDIO_PATH = "/audio/"
+PROXY_HEADERS = ("x-forwarded-for", "x-forwarded-host", "x-forwarded-proto", "forwarded")
+
+logger = logging.getLogger(__name__)
+
+_KEY = re.compile(r"[0-9a-f]{64}")
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def _handler(cache):
+    class AudioHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self._send(body=True)
+
+        def do_HEAD(self):
+            self._send(body=False)
+
+        def _send(self, body: bool):
+            key = self.path.split("?", 1)[0].removeprefix(AUDIO_PATH)
+            audio = cache.get(key) if self.path.startswith(AUDIO_PATH) and _KEY.fullmatch(key) else None
+            if audio is None:
+                self.send_error(404)
+                return
+            etag = f'"{key}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", CACHE_CONTROL)
+                self.end_headers()
+                return
+            data, status = audio.data, 200
+            # <audio> のシーク（Safari は Range で取りに来る）
+            m = _RANGE.match(self.headers.get("Range", ""))
+            if m and (m.group(1) or m.group(2)):
+                if m.group(1):
+                    start = int(m.group(1))
+                    end = min(int(m.group(2)), len(data) - 1) if m.group(2) else len(data) - 1
+                else:
+                    start, end = max(len(data) - int(m.group(2)), 0), len(data) - 1
+                if start > end:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{len(data)}")
+                    self.end_headers()
+                    return
+                status = 206
+            else:
+                start, end = 0, len(data) - 1
+            self.send_response(status)
+            self.send_header("Content-Type", audio.mime)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", CACHE_CONTROL)
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+            self.end_headers()
+            if body:
+                self.wfile.write(data[start:end + 1])
+
+        def log_message(self, format, *args):   # アクセスログは出さない
+            pass
+
+    return AudioHandler
+
+
+class AudioServer:
+    """AudioCache の音声を配信する HTTP サーバー（デーモンスレッドで動かす）"""
+
+    def __init__(self, cache, host: str = "0.0.0.0", port: int = None):
+        port = int(os.environ.get(MEDIA_PORT_ENV, DEFAULT_MEDIA_PORT)) if port is None else port
+        self._server = ThreadingHTTPServer((host, port), _handler(cache))
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="karuta-media", daemon=True)
+        self._thread.start()
+        self._warned = set()
+
+    def url(self, key: str, headers=None, page_url: str = None):
+        """ページのリクエストヘッダーと URL から音声の URL を作る（作れなければ None）
+
+        環境変数 KARUTA_MEDIA_URL（リバースプロキシ越しの公開 URL）があればそれを使う。
+        なければ http://<Host のホスト名>:<ポート>。ただしプロキシ越しか、ページが https なら None
+        （ログは理由ごとに 1 回だけ）。ページのスキームは page_url、なければ Origin ヘッダーから読む。
+        """
+        headers = headers or {}
+        base = os.environ.get(MEDIA_URL_ENV)
+        if not base:
+            scheme = urlsplit(page_url or headers.get("Origin") or "").scheme
+            if any(name.lower() in PROXY_HEADERS for name in headers):
+                return self._no_url("リバースプロキシ越し")
+            if scheme == "https":
+                return self._no_url("https のページ")
+            base = f"http://{(headers.get('Host') or 'localhost').rsplit(':', 1)[0]}:{self.port}"
+        return f"{base.rstrip('/')}{AUDIO_PATH}{key}"
+
+    def _no_url(self, reason: str):
+        if reason not in self._warned:
+            self._warned.add(reason)
+            logger.warning("%sのため音声を data URL で送ります。URL で配信するには %s に公開 URL を設定してください",
+                           reason, MEDIA_URL_ENV)
+        return None
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
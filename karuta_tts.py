@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+"""カルタ読み上げの音声合成とディスクキャッシュ
+
+合成エンジン（バックエンド）は synthesize(text, lang, slow) -> Audio（バイト列と形式）を持つクラスで、
+環境変数 KARUTA_TTS_BACKEND で選ぶ（backend_from_config）。
+
+    gtts            gTTS（既定・要ネットワーク・mp3）
+    espeak          espeak-ng / espeak をサブプロセスで実行（オフライン・wav）
+    dir:<フォルダ>  録音済みの音声ファイル（<フォルダ>/<札のテキスト>.mp3 / .wav / .ogg）
+    stub            確認用（テキストの長さだけの無音の wav）
+
+音声は (エンジン, 言語, ゆっくり, テキスト) のハッシュをキーにしたファイルとしてディスクに保存し、
+セッション・プロセスをまたいで使い回す。同じプロセスでは直近の音声をメモリにも持つ。
+書き込みは一時ファイル → os.replace で行うので、同時に書いても読み手が途中のファイルを見ることはない。
+合計サイズが max_bytes を超えたら、最後に使った時刻（ファイルの mtime）が古いものから消す。
+その数え直しのついでに、書き込みの途中で落ちたプロセスが残した古い一時ファイルも消す。
+
+SynthesisPool は合成を優先度付きの待ち行列と数本のスレッドで行い（失敗したら間隔を空けて再試行）、
+結果をキャッシュに保存する。札の束を読み込んだときに warm で全札を読む順に（または次に読む数枚だけを）
+先に合成しておけば、読み上げ時に合成を待たない。get は合成が済んでいたか・何秒待ったかを数える。
+
+"""
+import hashlib
+import io
+import itertools
+import json
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from cachetools import LRUCache
+from tenacity import Retrying, retry_if_not_exception_type, stop_after_attempt, wait_exponential
+
+CACHE_DIR_ENV = "KARUTA_TTS_CACHE"
+BACKEND_ENV = "KARUTA_TTS_BACKEND"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "karuta_tts")
+DEFAULT_BACKEND = "gtts"
+# SynthesisPool の合成待ちの優先度（小さいほど先）
+PRIORITY_NOW = 0    # 読み上げで待っている札
+PRIORITY_NEXT = 1   # 次に読む数枚の先読み
+PRIORITY_DECK = 2   # セット全体の先行合成
+# 形式 → MIME タイプ（キャッシュのファイルの拡張子にも使う）
+AUDIO_MIME = {"mp3": "audio/mpeg", "wav": "audio/wav", "ogg": "audio/ogg"}
+TMP_SUFFIX = ".tmp"
+STALE_TMP_SECONDS = 3600   # これより古い一時ファイルは書き込み中ではなく、落ちたプロセスの残り
+
+
+class Audio:
+    """合成した音声（バイト列と形式）"""
+
+    __slots__ = ("data", "format")
+
+    def __init__(self, data: bytes, format: str):
+        self.data = data
+        self.format = format
+
+    @property
+    def mime(self) -> str:
+        return AUDIO_MIME[self.format]
+
+    def __len__(self):
+        return len(self.data)
+
+
+class MissingAudio(LookupError):
+    """その札の音声を作れない（再試行しても同じなので再試行しない）"""
+
+
+class GTTSBackend:
+    """gTTS（Google の読み上げ・要ネットワーク）"""
+
+    name = "gtts"
+
+    def synthesize(self, text: str, lang: str, slow: bool) -> Audio:
+        from gtts import gTTS
+
+        buf = io.BytesIO()
+        gTTS(text=text, lang=lang, slow=slow).write_to_fp(buf)
+        return Audio(buf.getvalue(), "mp3")
+
+
+class EspeakBackend:
+    """espeak-ng（なければ espeak）をサブプロセスで実行する。オフラインで数ミリ秒〜で合成できる"""
+
+    name = "espeak"
+
+    def __init__(self, command: str = None, speed: int = 160):
+        self.command = command or shutil.which("espeak-ng") or shutil.which("espeak")
+        if self.command is None:
+            raise RuntimeError("espeak-ng / espeak が見つかりません")
+        self.speed = speed
+
+    def synthesize(self, text: str, lang: str, slow: bool) -> Audio:
+        speed = self.speed * 2 // 3 if slow else self.speed
+        out = subprocess.run([self.command, "-v", lang, "-s", str(speed), "--stdout", text],
+                             capture_output=True, check=True, timeout=30)
+        return Audio(out.stdout, "wav")
+
+
+class AudioDirBackend:
+    """録音済みの音声ファイルを返す（<directory>/<札のテキスト>.mp3 / .wav / .ogg。言語・速度は見ない）"""
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+        if not os.path.isdir(self.directory):
+            raise RuntimeError(f"音声フォルダがありません: {self.directory}")
+        self.name = f"dir:{self.directory}"
+
+    def synthesize(self, text: str, lang: str, slow: bool) -> Audio:
+        stem = os.path.join(self.directory, text.replace(os.sep, "_"))
+        for fmt in AUDIO_MIME:
+            try:
+                with open(f"{stem}.{fmt}", "rb") as f:
+                    return Audio(f.read(), fmt)
+            except FileNotFoundError:
+                continue
+        raise MissingAudio(f"録音がありません: {text}")
+
+
+class StubBackend:
+    """確認用。テキストの長さに比例した無音の wav を返し、呼ばれた回数を数える（同じ入力なら同じバイト列）"""
+
+    name = "stub"
+
+    def __init__(self, frames_per_char: int = 400, rate: int = 8000):
+        self.frames_per_char = frames_per_char
+        self.rate = rate
+        self.calls = 0
+
+    def synthesize(self, text: str, lang: str, slow: bool) -> Audio:
+        self.calls += 1
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(self.rate)
+            w.writeframes(b"\0\0" * self.frames_per_char * len(text) * (2 if slow else 1))
+        return Audio(buf.getvalue(), "wav")
+
+
+def backend_from_config(spec: str = None):
+    """設定（既定は環境変数 KARUTA_TTS_BACKEND）からバックエンドを作る"""
+    spec = (spec or os.environ.get(BACKEND_ENV) or DEFAULT_BACKEND).strip()
+    if spec == "gtts":
+        return GTTSBackend()
+    if spec == "espeak":
+        return EspeakBackend()
+    if spec == "stub":
+        return StubBackend()
+    if spec.startswith("dir:"):
+        return AudioDirBackend(spec[len("dir:"):])
+    raise ValueError(f"未知の読み上げエンジンです: {spec}（gtts / espeak / dir:<フォルダ> / stub）")
+
+
+def audio_key(text: str, lang: str, slow: bool, engine: str) -> str:
+    """キャッシュのキー（sha256 の16進）"""
+    payload = json.dumps([engine, lang, bool(slow), text], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """音声のディスクキャッシュ（合計 max_bytes まで・最後に使った順に破棄）＋メモリの LRU
+
+    ファイルは directory/<キーの先頭2文字>/<キー>.<形式>。
+    最後に使った時刻はファイルの mtime（メモリから返したときも更新する）。
+    ディレクトリはほかのプロセスと共有するので、書き込みのたびの合計の見積もりは自分の分しか数えない。
+    そのため rescan_interval 秒ごとに（書き込みのついでに）ディスクを数え直す。
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = 256 * 2**20, memory_items: int = 128,
+                 rescan_interval: float = 30.0):
+        self.directory = directory or os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.rescan_interval = rescan_interval
+        self._memory = LRUCache(maxsize=memory_items)
+        self._lock = threading.Lock()
+        self._size = None   # ディスク上の合計サイズの見積もり（初回の書き込みで数える）
+        self._scanned = 0.0   # 最後にディスクを数え直した時刻（time.monotonic）
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key: str, fmt: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.{fmt}")
+
+    def get(self, key: str):
+        """キャッシュにあれば Audio、なければ None"""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self.memory_hits += 1
+        if audio is not None:
+            try:
+                os.utime(self._path(key, audio.format))   # ディスクでも最後に使ったことにする
+            except FileNotFoundError:   # 別のプロセスが破棄した（メモリの分はそのまま返す）
+                pass
+            return audio
+        for fmt in AUDIO_MIME:
+            path = self._path(key, fmt)
+            try:
+                with open(path, "rb") as f:
+                    audio = Audio(f.read(), fmt)
+                os.utime(path)   # 最後に使った時刻（破棄の順番に使う）
+                break
+            except FileNotFoundError:   # 未作成、または別のプロセスが破棄した
+                continue
+        else:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self._memory[key] = audio
+            self.disk_hits += 1
+        return audio
+
+    def put(self, key: str, audio: Audio):
+        path = self._path(key, audio.format)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=TMP_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(audio.data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self._memory[key] = audio
+            if self._size is not None:
+                self._size += len(audio)
+            over = (self._size is None or self._size > self.max_bytes
+                    or time.monotonic() - self._scanned >= self.rescan_interval)
+        if over:
+            self.evict()
+
+    def get_or_synthesize(self, backend, text: str, lang: str, slow: bool) -> Audio:
+        """キャッシュになければ backend で合成して保存する"""
+        key = audio_key(text, lang, slow, backend.name)
+        audio = self.get(key)
+        if audio is None:
+            audio = backend.synthesize(text, lang, slow)
+            self.put(key, audio)
+        return audio
+
+    def _files(self) -> tuple:
+        """([(mtime, サイズ, パス)], [古い一時ファイルのパス])（ほかのプロセスが消したファイルは飛ばす）"""
+        files, stale = [], []
+        stale_before = time.time() - STALE_TMP_SECONDS
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                is_tmp = name.endswith(TMP_SUFFIX)
+                if not is_tmp and name.rpartition(".")[2] not in AUDIO_MIME:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if not is_tmp:
+                    files.append((st.st_mtime, st.st_size, path))
+                elif st.st_mtime < stale_before:
+                    stale.append(path)
+        return files, stale
+
+    def evict(self):
+        """ディスク上の合計を数え直し、max_bytes を超えていれば古いものから消す（古い一時ファイルも消す）"""
+        files, stale = self._files()
+        for path in stale:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self._memory.pop(os.path.basename(path).partition(".")[0], None)
+        with self._lock:
+            self._size = total
+            self._scanned = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "hit_rate": hits / total if total else 0.0}
+
+
+class DeckWarmup:
+    """札の束の先行合成 1 件（progress は 0〜1）"""
+
+    __slots__ = ("futures",)
+
+    def __init__(self, futures: list):
+        self.futures = futures
+
+    @property
+    def total(self) -> int:
+        return len(self.futures)
+
+    @property
+    def completed(self) -> int:
+        return sum(f.done() for f in self.futures)
+
+    @property
+    def progress(self) -> float:
+        return self.completed / self.total if self.futures else 1.0
+
+    def done(self) -> bool:
+        return all(f.done() for f in self.futures)
+
+    def errors(self) -> list:
+        """再試行しても合成できなかった札の例外"""
+        return [f.exception() for f in self.futures if f.done() and f.exception() is not None]
+
+
+class SynthesisPool:
+    """音声の合成を max_workers 本のスレッドで行い、AudioCache に保存する
+
+    同じ音声の合成は同時に 1 回だけ行い、実行中のものを頼まれたらその Future を返す。
+    backend の失敗は attempts 回まで指数的に間隔を空けて再試行する（MissingAudio は再試行しない）。
+    合成待ちは (優先度, 頼まれた順) の順に処理する。まだ始まっていない札を同じか高い優先度でもう一度頼まれたら、
+    その時点の順番に並べ直す（シャッフルし直したセットを warm すると、新しい順に合成される）。
+    """
+
+    def __init__(self, cache: AudioCache, backend, max_workers: int = 4, attempts: int = 4,
+                 wait_max: float = 8.0):
+        self.cache = cache
+        self.backend = backend
+        self._queue = queue.PriorityQueue()   # (優先度, 順番, キー)。並べ直した古い項目は取り出したときに捨てる
+        self._jobs = {}                       # キー → まだ始まっていない合成の [(優先度, 順番), text, lang, slow]
+        self._seq = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._retry = Retrying(retry=retry_if_not_exception_type(MissingAudio), stop=stop_after_attempt(attempts),
+                               wait=wait_exponential(multiplier=0.5, max=wait_max), reraise=True)
+        self.ready = 0                       # get の時点で合成が済んでいた回数
+        self.waited = 0                      # 合成を待った回数
+        self._wait_times = deque(maxlen=256)  # 待った秒数（直近）
+        for i in range(max_workers):
+            threading.Thread(target=self._work, name=f"tts_{i}", daemon=True).start()
+
+    def submit(self, text: str, lang: str, slow: bool, priority: int = PRIORITY_DECK) -> Future:
+        """Audio を返す Future（キャッシュにあれば完了済みのもの）。priority は小さいほど先"""
+        key = audio_key(text, lang, slow, self.backend.name)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                self._enqueue(key, priority)
+                return future
+        audio = self.cache.get(key)
+        if audio is not None:
+            future = Future()
+            future.set_result(audio)
+            return future
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = Future()
+                self._jobs[key] = [None, text, lang, slow]
+            self._enqueue(key, priority)
+        return future
+
+    def _enqueue(self, key: str, priority: int):
+        """まだ始まっていない合成を今の順番で並べ直す（優先度は下げない）。_lock を持って呼ぶ"""
+        job = self._jobs.get(key)
+        if job is None or (job[0] is not None and job[0][0] < priority):
+            return
+        job[0] = (priority, next(self._seq))
+        self._queue.put((*job[0], key))
+
+    def _work(self):
+        while True:
+            priority, seq, key = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(key)
+                if job is None or job[0] != (priority, seq):   # 並べ直した古い項目
+                    continue
+                del self._jobs[key]
+                future = self._pending[key]
+            if future.set_running_or_notify_cancel():
+                try:
+                    audio = self._synthesize(key, *job[1:])
+                except Exception as e:
+                    self._forget(key)
+                    future.set_exception(e)
+                else:
+                    self._forget(key)   # 以降はキャッシュから返す
+                    future.set_result(audio)
+            else:
+                self._forget(key)
+
+    def _forget(self, key: str):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def _synthesize(self, key: str, text: str, lang: str, slow: bool) -> Audio:
+        audio = self._retry(self.backend.synthesize, text, lang, slow)
+        self.cache.put(key, audio)
+        return audio
+
+    def get(self, text: str, lang: str, slow: bool) -> Audio:
+        """音声（合成中・未合成なら最優先にして終わるまで待つ）"""
+        future = self.submit(text, lang, slow, PRIORITY_NOW)
+        if future.done():
+            with self._lock:
+                self.ready += 1
+            return future.result()
+        t0 = time.perf_counter()
+        try:
+            return future.result()
+        finally:
+            with self._lock:
+                self.waited += 1
+                self._wait_times.append(time.perf_counter() - t0)
+
+    def warm(self, texts, lang: str, slow: bool, priority: int = PRIORITY_DECK) -> DeckWarmup:
+        """texts の全札を texts の順に合成しておく（キャッシュにあるものはすぐ完了）"""
+        return DeckWarmup([self.submit(t, lang, slow, priority) for t in dict.fromkeys(texts)])
+
+    def stats(self) -> dict:
+        """先読みの当たり率（get の時点で済んでいた割合）と、待った時間（ミリ秒）"""
+        with self._lock:
+            total = self.ready + self.waited
+            waits = np.array(self._wait_times) * 1e3
+        return {"ready": self.ready, "waited": self.waited, "hit_rate": self.ready / total if total else 0.0,
+                "wait_p50_ms": float(np.median(waits)) if len(waits) else 0.0,
+                "wait_max_ms": float(waits.max()) if len(waits) else 0.0}
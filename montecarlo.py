@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""モンテカルロ・シミュレーション（投資利回り・土地/建物の変動率を確率的に）
+
+収入・教育費・ローンなどは決定的なまま、年ごとの率だけを (パス数 × 年齢) の
+配列で乱数生成し、engine の計算本体でまとめて評価する。
+"""
+import numpy as np
+import pandas as pd
+
+from engine import COLUMNS, MODE_RATE, SimulationResult, _kernel, resolve_params
+
+# 乱数で動かす率（パラメータ名 → 既定の年率ボラティリティ %）
+STOCHASTIC_RATES = {
+    "invest_return": 15.0,
+    "land_appreciation": 3.0,
+    "bldg_decline": 1.0,
+}
+DISTRIBUTIONS = ("normal", "lognormal", "bootstrap")
+PERCENTILES = (5, 25, 50, 75, 95)
+MC_FIELDS = ("fin_asset", "net_worth")
+
+
+def draw_rates(rng, mean_pct, vol_pct, shape, dist="normal", history=None, dtype=np.float64):
+    """年ごとの率（%）を shape の配列で生成する
+
+    normal    : 率そのものが正規分布
+    lognormal : 1 + 率 が対数正規分布（平均・標準偏差が mean_pct / vol_pct に一致）
+    bootstrap : history（過去の年率 %）から復元抽出。history が無い率は normal と同じ
+    """
+    if dist == "bootstrap":
+        if history is not None and len(history) > 0:
+            hist = np.asarray(history, dtype=dtype)
+            return hist[rng.integers(0, len(hist), size=shape)]
+        dist = "normal"
+    if vol_pct <= 0:
+        return np.full(shape, mean_pct, dtype=dtype)
+    z = rng.standard_normal(size=shape, dtype=dtype)
+    if dist == "normal":
+        return mean_pct + vol_pct * z
+    if dist == "lognormal":
+        m = 1 + mean_pct / 100.0
+        sigma2 = np.log1p((vol_pct / 100.0 / m) ** 2)
+        mu = np.log(m) - sigma2 / 2
+        return (np.exp(mu + np.sqrt(sigma2) * z) - 1) * 100.0
+    raise ValueError(f"未対応の分布です: {dist}")
+
+def simulate_mc(params: dict, n_paths: int = 10000, dist: str = "normal", vols=None,
+                history=None, seed=None, chunk_size: int = 2048, dtype=np.float64,
+                keep_paths: bool = False, progress=None) -> dict:
+    """パス数 × 年齢 の確率シミュレーションを行い、パーセンタイル帯などを返す
+
+    vols    : {率の名前: ボラティリティ %}（未指定は STOCHASTIC_RATES の既定値）
+    history : bootstrap 用の {率の名前: 過去の年率 % の配列}（無い率は正規分布）
+    seed    : 同じ seed なら chunk_size に関係なく同じ結果になる
+    dtype   : np.float32 で乱数・保存する配列のメモリを半分にする
+    progress: チャンクごとに計算済みの割合（0〜1）を渡して呼ぶ関数
+
+    戻り値の "bands" は {"fin_asset" / "net_worth": (len(PERCENTILES), 年齢) 配列}、
+    "prob_negative" は年齢ごとの金融資産 < 0 の確率、
+    "prob_ever_negative" は期間中に一度でも金融資産 < 0 になる確率。
+    keep_paths=True なら "paths" に全パスを (パス × 年齢) の SimulationResult で入れる。
+    """
+    if dist not in DISTRIBUTIONS:
+        raise ValueError(f"未対応の分布です: {dist}")
+    p = resolve_params(params)
+    p["by_rate"] = p["mode"] == MODE_RATE
+    ages = np.arange(int(p["current_age"]), int(p["target_age"]) + 1)
+    age = ages.astype(float)
+    vols = {**STOCHASTIC_RATES, **(vols or {})}
+    history = history or {}
+
+    # 率ごとに独立した乱数列を持たせ、チャンク分割に依存しない再現性を確保
+    streams = np.random.SeedSequence(seed).spawn(len(STOCHASTIC_RATES))
+    rngs = {key: np.random.default_rng(s) for key, s in zip(STOCHASTIC_RATES, streams)}
+
+    paths_out = {k: np.empty((n_paths, len(ages)), dtype=dtype) for k in MC_FIELDS}
+    for lo in range(0, n_paths, chunk_size):
+        hi = min(lo + chunk_size, n_paths)
+        shape = (hi - lo, len(ages))
+        rates = {key: draw_rates(rngs[key], p[key], vols[key], shape, dist, history.get(key), dtype)
+                 for key in STOCHASTIC_RATES}
+        res = _kernel(p, age, MC_FIELDS, paths=rates)
+        for k in MC_FIELDS:
+            paths_out[k][lo:hi] = res[k]
+        if progress is not None:
+            progress(hi / n_paths)
+
+    fin = paths_out["fin_asset"]
+    negative = fin < 0
+    result = {
+        "age": ages,
+        "n_paths": n_paths,
+        "bands": {k: np.percentile(v, PERCENTILES, axis=0) if n_paths else
+                  np.full((len(PERCENTILES), len(ages)), np.nan) for k, v in paths_out.items()},
+        "prob_negative": negative.mean(axis=0) if n_paths else np.zeros(len(ages)),
+        "prob_ever_negative": float(negative.any(axis=1).mean()) if n_paths else 0.0,
+    }
+    if keep_paths:
+        result["paths"] = SimulationResult({"age": ages, **paths_out})
+    return result
+
+def bands_to_frame(result: dict) -> pd.DataFrame:
+    """パーセンタイル帯をグラフ用のロング形式（年齢・系列・p5〜p95）に変換"""
+    frames = []
+    for key, band in result["bands"].items():
+        d = pd.DataFrame({f"p{q}": band[i] for i, q in enumerate(PERCENTILES)})
+        d.insert(0, "系列", COLUMNS[key][0])
+        d.insert(0, "年齢", result["age"])
+        frames.append(d)
+    return pd.concat(frames, ignore_index=True)
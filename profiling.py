@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""アプリの再実行ごとの区間計測（デバッグ用）
+
+    http://localhost:8717/?profile=1          # 区間ごとの時間
+    http://localhost:8717/?profile=cprofile   # さらに cProfile（直近の数回分を pstats で保存）
+    ASSET_PROFILE=1 ./run.sh                  # 環境変数でも有効にできる
+
+スクリプトの各段の終わりで Profiler.lap(名前) を呼ぶと、前の lap からの時間を time.perf_counter で
+その区間として記録し、finish() で 1 回分の結果を ProfileHistory に積む。
+最後の lap から finish までは「その他」になる。無効のときの lap はすぐに戻るだけ。
+st.rerun / st.stop やエラーで finish() の前に抜けた回の cProfile は、次に Profiler を作るときに止める
+（同じスレッドか、もう終わったスレッドで有効になったままのもの）。
+"""
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+ENV_VAR = "ASSET_PROFILE"
+QUERY_PARAM = "profile"
+OTHER_SPAN = "その他"
+TOTAL_SPAN = "合計"
+
+_ON = ("1", "true", "on", "yes")
+_CPROFILE = ("cprofile", "prof", "pstats")
+
+# finish() されていない cProfile（スレッド → Profiler）
+_unfinished = {}
+_unfinished_lock = threading.Lock()
+
+
+def profile_mode(value) -> tuple:
+    """クエリパラメータ / 環境変数の値 → (区間計測するか, cProfile も取るか)"""
+    value = str(value or "").strip().lower()
+    cprofile = value in _CPROFILE
+    return value in _ON or cprofile, cprofile
+
+def settings(query_value=None) -> tuple:
+    """クエリパラメータを優先し、なければ環境変数 ASSET_PROFILE を見る"""
+    return profile_mode(query_value if query_value is not None else os.environ.get(ENV_VAR))
+
+
+class RunProfile:
+    """1 回の再実行の結果（区間名 → 秒、合計秒、cProfile）"""
+
+    __slots__ = ("spans", "total", "profile")
+
+    def __init__(self, spans: dict, total: float, profile=None):
+        self.spans = spans
+        self.total = total
+        self.profile = profile
+
+
+class Profiler:
+    """1 回の再実行を区間ごとに測る（enabled=False なら何もしない）"""
+
+    def __init__(self, enabled: bool = False, cprofile: bool = False):
+        self.enabled = enabled
+        self._spans = {}
+        self._start = self._last = time.perf_counter() if enabled else 0.0
+        self._profile = None
+        if enabled and cprofile:
+            _stop_abandoned()
+            self._profile = cProfile.Profile()
+            try:
+                self._profile.enable()
+            except ValueError:   # 別のセッションが計測中（Python 3.12 以降は同時に 1 つだけ）
+                self._profile = None
+            else:
+                self._thread = threading.current_thread()
+                with _unfinished_lock:
+                    _unfinished[self._thread] = self
+
+    def lap(self, name: str):
+        """前回の lap（または開始）からここまでを区間 name として記録する"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self._spans[name] = self._spans.get(name, 0.0) + now - self._last
+        self._last = now
+
+    def finish(self):
+        """計測を終えて RunProfile を返す（無効なら None）"""
+        if not self.enabled:
+            return None
+        self._stop()
+        total = time.perf_counter() - self._start
+        spans = dict(self._spans)
+        spans[OTHER_SPAN] = max(total - sum(spans.values()), 0.0)
+        self.enabled = False
+        return RunProfile(spans, total, self._profile)
+
+    def _stop(self):
+        if self._profile is None:
+            return
+        self._profile.disable()
+        with _unfinished_lock:
+            if _unfinished.get(self._thread) is self:
+                del _unfinished[self._thread]
+
+
+def _stop_abandoned():
+    """途中で抜けて finish() されなかった cProfile を止める（このスレッドのものと、終わったスレッドのもの）"""
+    current = threading.current_thread()
+    with _unfinished_lock:
+        abandoned = [p for t, p in _unfinished.items() if t is current or not t.is_alive()]
+    for p in abandoned:
+        p._stop()
+
+
+class ProfileHistory:
+    """直近 maxlen 回の区間ごとの時間と、直近 keep_profiles 回の cProfile"""
+
+    def __init__(self, maxlen: int = 200, keep_profiles: int = 5):
+        self.runs = deque(maxlen=maxlen)
+        self.profiles = deque(maxlen=keep_profiles)
+
+    def add(self, run):
+        if run is None:
+            return
+        self.runs.append(run)
+        if run.profile is not None:
+            self.profiles.append(run.profile)
+
+    def breakdown(self) -> pd.DataFrame:
+        """直近 1 回の区間ごとの時間（ミリ秒）と割合"""
+        if not self.runs:
+            return pd.DataFrame(columns=["ミリ秒", "割合"])
+        run = self.runs[-1]
+        ms = pd.Series(run.spans, dtype=float) * 1e3
+        df = pd.DataFrame({"ミリ秒": ms, "割合": ms / (run.total * 1e3) if run.total else 0.0})
+        df.loc[TOTAL_SPAN] = (run.total * 1e3, 1.0)
+        df.index.name = "区間"
+        return df
+
+    def percentiles(self, q=(50, 90, 99)) -> pd.DataFrame:
+        """区間ごとの時間（ミリ秒）のパーセンタイル（その区間を通った回だけで集計）"""
+        if not self.runs:
+            return pd.DataFrame(columns=["回数", *(f"p{p}" for p in q)])
+        names = list(dict.fromkeys(n for run in self.runs for n in run.spans))
+        rows = {}
+        for name in names + [TOTAL_SPAN]:
+            ms = np.array([run.total if name == TOTAL_SPAN else run.spans[name]
+                           for run in self.runs if name == TOTAL_SPAN or name in run.spans]) * 1e3
+            rows[name] = [len(ms), *np.percentile(ms, q)]
+        df = pd.DataFrame.from_dict(rows, orient="index", columns=["回数", *(f"p{p}" for p in q)])
+        df.index.name = "区間"
+        return df
+
+    def _stats(self, stream=None):
+        profiles = list(self.profiles)
+        stats = pstats.Stats(profiles[0], stream=stream)
+        if len(profiles) > 1:
+            stats.add(*profiles[1:])
+        return stats
+
+    def pstats_text(self, limit: int = 40, sort: str = "cumulative") -> str:
+        """直近の cProfile をまとめた上位 limit 件（なければ空文字）"""
+        if not self.profiles:
+            return ""
+        buf = io.StringIO()
+        self._stats(buf).sort_stats(sort).print_stats(limit)
+        return buf.getvalue()
+
+    def pstats_bytes(self) -> bytes:
+        """直近の cProfile をまとめた .prof（pstats.Stats / snakeviz で読める形式）"""
+        return marshal.dumps(self._stats().stats) if self.profiles else b""
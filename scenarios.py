@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""複数シナリオの比較
+
+シナリオは「サイドバーの設定に上書きするパラメータ」の dict で表す。
+ScenarioCache はシナリオごとのパラメータのハッシュをキーに結果を保持し、
+ハッシュが変わったシナリオ（サイドバーを変えたときは全シナリオ）だけを
+engine.simulate_batch の 1 回の呼び出しでまとめて計算する。
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+
+from engine import COLUMNS, params_key, resolve_params, simulate_batch
+
+BASE_SCENARIO = "現在の設定"
+
+# 比較表の指標（表示名）
+SCENARIO_METRICS = ("最終総資産（万円）", "最終金融資産（万円）", "最低金融資産（万円）",
+                    "金融資産がマイナスになる年齢", "最終 自由に使える金額（万円/月）")
+
+
+def scenario_params(base: dict, overrides: dict) -> dict:
+    """サイドバーの設定にシナリオの上書きを重ねたパラメータ"""
+    p = resolve_params(base)
+    p.update({k: v for k, v in overrides.items() if v is not None})
+    return p
+
+
+class ScenarioCache:
+    """パラメータのハッシュ → 1 シナリオ分の結果（内部キー → 年齢ごとの配列）"""
+
+    def __init__(self, maxsize: int = 64):
+        self._results = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.computed = 0
+        self.reused = 0
+
+    def results(self, params_by_name: dict) -> dict:
+        """{シナリオ名: パラメータ} の結果を {シナリオ名: 結果} で返す（未計算のものだけを一括計算）"""
+        keys = {name: params_key(p) for name, p in params_by_name.items()}
+        with self._lock:
+            found = {name: self._results.get(key) for name, key in keys.items()}
+        missing = [name for name, res in found.items() if res is None]
+        # 同じパラメータのシナリオは 1 行だけ計算する
+        todo = {keys[name]: params_by_name[name] for name in missing}
+
+        if todo:
+            rows = list(todo.values())
+            table = {k: [p[k] for p in rows] for k in rows[0]}
+            res = simulate_batch(table)
+            computed = {}
+            for i, (key, p) in enumerate(todo.items()):
+                in_range = (res["age"] >= p["current_age"]) & (res["age"] <= p["target_age"])
+                computed[key] = {"age": res["age"][in_range],
+                                 **{k: res[k][i, in_range] for k in COLUMNS if k != "age"}}
+            with self._lock:
+                self._results.update(computed)
+                self.computed += len(todo)
+                self.reused += len(found) - len(missing)
+            for name in missing:
+                found[name] = computed[keys[name]]
+        else:
+            with self._lock:
+                self.reused += len(found)
+        return found
+
+
+def scenario_long(results: dict, key: str) -> pd.DataFrame:
+    """重ね描き用のロング形式（年齢・シナリオ・値）"""
+    return pd.DataFrame({
+        "年齢": np.concatenate([r["age"] for r in results.values()]),
+        "シナリオ": pd.Categorical(np.repeat(list(results), [len(r["age"]) for r in results.values()]),
+                               categories=list(results)),
+        "値": np.concatenate([r[key] for r in results.values()]),
+    })
+
+def metrics_frame(results: dict) -> pd.DataFrame:
+    """シナリオごとの主要指標と、先頭のシナリオとの差（丸めは表示側で行う）"""
+    rows = []
+    for r in results.values():
+        negative = r["fin_asset"] < 0
+        rows.append((r["net_worth"][-1], r["fin_asset"][-1], r["fin_asset"].min(),
+                     r["age"][negative.argmax()] if negative.any() else np.nan, r["free_month"][-1]))
+    df = pd.DataFrame(rows, index=pd.Index(list(results), name="シナリオ"), columns=list(SCENARIO_METRICS))
+    base = df.iloc[0] if len(df) else None
+    for col in ("最終総資産（万円）", "最終金融資産（万円）"):
+        df[f"{col.removesuffix('（万円）')} 差（万円）"] = df[col] - (base[col] if base is not None else np.nan)
+    return df
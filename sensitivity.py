@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""感度分析（トルネード図用）
+
+各パラメータを ±pct% 動かしたシナリオを 1 つの表にまとめ、engine.simulate_batch の
+1 回の呼び出しで最終総資産と最低金融資産への影響を求める。
+"""
+import numpy as np
+import pandas as pd
+
+from engine import (DEFAULT_PARAMS, INTEGER_PARAMS, PARAM_LABELS, PARAM_RANGES, _INACTIVE_KEYS,
+                    resolve_params, simulate_batch)
+
+# 期間そのものを変えるパラメータは対象外
+EXCLUDED_PARAMS = {"current_age", "target_age", "mode"}
+
+
+def sensitivity_params(params: dict) -> list:
+    """感度分析の対象パラメータ（非アクティブ側の貯蓄設定は除く）"""
+    p = resolve_params(params)
+    inactive = set(_INACTIVE_KEYS.get(p["mode"], ()))
+    return [k for k in DEFAULT_PARAMS if k not in EXCLUDED_PARAMS and k not in inactive]
+
+def perturbed_value(key: str, value: float, pct: float, sign: int) -> float:
+    """value を sign 方向に pct% 動かした値（PARAM_RANGES の範囲に収める）
+
+    value が 0 のときは入力範囲の幅の pct% を動かす。年齢・年数は整数に丸め、最低 1 動かす。
+    """
+    lo, hi = PARAM_RANGES[key]
+    if value == 0:   # 0 の何%も 0 なので、範囲の幅を基準にする
+        moved = sign * (hi - lo) * pct / 100.0
+    else:
+        moved = value * (1 + sign * pct / 100.0)
+    if key in INTEGER_PARAMS:
+        moved = value + sign * max(1, round(abs(moved - value)))
+    return float(min(max(moved, lo), hi))
+
+def tornado(params: dict, pct: float = 10.0, keys=None) -> pd.DataFrame:
+    """パラメータごとの -pct% / +pct% 時の指標と基準値との差を返す
+
+    列: パラメータ, 項目, 下側の値, 上側の値, 指標（最終総資産・最低金融資産）ごとの
+    下側/上側の差分と振れ幅。振れ幅（最終総資産）の大きい順に並べる。
+    """
+    p = resolve_params(params)
+    keys = sensitivity_params(p) if keys is None else list(keys)
+
+    # 行 0 が基準、以降は (パラメータ, -, +) の順
+    n = 1 + 2 * len(keys)
+    table = {k: np.full(n, v, dtype=object if k == "mode" else float) for k, v in p.items()}
+    lows, highs = [], []
+    for i, key in enumerate(keys):
+        lo = perturbed_value(key, float(p[key]), pct, -1)
+        hi = perturbed_value(key, float(p[key]), pct, +1)
+        table[key][1 + 2 * i] = lo
+        table[key][2 + 2 * i] = hi
+        lows.append(lo)
+        highs.append(hi)
+
+    res = simulate_batch(table, fields=["net_worth", "fin_asset"])
+    final_nw = res["net_worth"][:, -1]
+    min_fin = np.nanmin(res["fin_asset"], axis=1)
+
+    out = pd.DataFrame({
+        "パラメータ": keys,
+        "項目": [PARAM_LABELS[k] for k in keys],
+        "基準値": [p[k] for k in keys],
+        "下側の値": lows,
+        "上側の値": highs,
+    })
+    for name, metric in (("最終総資産", final_nw), ("最低金融資産", min_fin)):
+        d_lo = metric[1::2] - metric[0]
+        d_hi = metric[2::2] - metric[0]
+        out[f"{name} 下側の差"] = d_lo
+        out[f"{name} 上側の差"] = d_hi
+        out[f"{name} 振れ幅"] = np.abs(d_hi - d_lo)
+    out.attrs["base"] = {"最終総資産": float(final_nw[0]), "最低金融資産": float(min_fin[0])}
+    return out.sort_values("最終総資産 振れ幅", ascending=False, ignore_index=True)
+
+def tornado_long(df: pd.DataFrame, metric: str) -> pd.DataFrame:
+    """トルネード図用のロング形式（項目・方向・差分）"""
+    d = pd.concat([
+        pd.DataFrame({"項目": df["項目"], "方向": "下側", "差分（万円）": df[f"{metric} 下側の差"],
+                      "振れ幅": df[f"{metric} 振れ幅"]}),
+        pd.DataFrame({"項目": df["項目"], "方向": "上側", "差分（万円）": df[f"{metric} 上側の差"],
+                      "振れ幅": df[f"{metric} 振れ幅"]}),
+    ], ignore_index=True)
+    return d
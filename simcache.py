@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""シミュレーション結果のメモ化（パラメータのハッシュをキーにした LRU + TTL）"""
+import threading
+
+from cachetools import LRUCache, TTLCache
+
+from engine import aggregate_annual, earliest_effect_age, params_key, simulate_arrays, to_dataframe
+
+
+class SimulationCache:
+    """TTLCache（サイズ上限に達したら最も古く使われたものから破棄）にヒット/ミス数を付けたもの
+
+    Streamlit はセッションごとに別スレッドで動くため、参照・更新はロックで守る。
+    計算自体はロックの外で行い、同じキーが同時に計算された場合は後勝ちで保存する。
+    simulate の丸める前の結果は別に arrays_size 件まで保持し、直前のパラメータからの変更なら
+    影響が始まる年齢から続きだけを計算する（engine.earliest_effect_age）。
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 3600, arrays_size: int = 32):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._arrays = LRUCache(maxsize=arrays_size)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.resumed = 0
+
+    def get_or_compute(self, key: str, compute):
+        with self._lock:
+            try:
+                value = self._cache[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                return value
+        value = compute()
+        with self._lock:
+            self._cache[key] = value
+        return value
+
+    def simulate(self, params: dict, steps_per_year: int = 1, previous: dict = None):
+        """engine.simulate の結果（DataFrame）をキャッシュ経由で返す。戻り値は変更しないこと
+
+        previous に直前に計算したパラメータを渡すと、その結果が残っていれば途中から計算する。
+        """
+        key = self._key(params, steps_per_year)
+        return self.get_or_compute(key, lambda: self._compute(key, params, steps_per_year, previous))
+
+    def arrays(self, params: dict, steps_per_year: int = 1):
+        """丸める前の結果（SimulationResult、月次は月次のまま）。simulate で計算済みならそれを返す"""
+        key = self._key(params, steps_per_year)
+        with self._lock:
+            arrays = self._arrays.get(key)
+        if arrays is None:
+            arrays = simulate_arrays(params, steps_per_year)
+            with self._lock:
+                self._arrays[key] = arrays
+        return arrays
+
+    @staticmethod
+    def _key(params: dict, steps_per_year: int) -> str:
+        return params_key(params) if steps_per_year == 1 else params_key(params, steps_per_year=steps_per_year)
+
+    def _compute(self, key: str, params: dict, steps_per_year: int, previous):
+        resume = None
+        if previous is not None:
+            age = earliest_effect_age(previous, params)
+            with self._lock:
+                prev = self._arrays.get(self._key(previous, steps_per_year))
+            if prev is not None and age is not None:
+                resume = (prev, age)
+        arrays = simulate_arrays(params, steps_per_year, resume=resume)
+        with self._lock:
+            self._arrays[key] = arrays
+            self.resumed += resume is not None
+        if steps_per_year > 1:
+            arrays = aggregate_annual(arrays, steps_per_year)
+        return to_dataframe(arrays)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize,
+                "resumed": self.resumed,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._arrays.clear()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""目標逆算（ゴールシーク）
+
+自由変数を 1 つの値 x として動かし、目標を満たす最小（または最大）の x を
+「粗いグリッドをまとめて計算 → 境界の区間を細かいグリッドで絞り込む」で求める。
+各段のグリッドは engine.simulate_batch の 1 回の呼び出しで評価する。
+"""
+import numpy as np
+
+from engine import resolve_params, simulate_batch
+
+# 自由変数の候補（表示名 → (動かすパラメータ, 探索下限, 探索上限, 最大化するか)）
+# 複数のパラメータを持つものは、すべて同じ値 x にそろえて動かす
+SOLVER_VARIABLES = {
+    "貯蓄額（購入前・購入後・ピーク時を同額、万円/年）":
+        (("save_amt_pre", "save_amt_post", "save_amt_peak"), 0.0, 2000.0, False),
+    "貯蓄率（購入前・購入後・ピーク時を同率、%）":
+        (("save_rate_pre", "save_rate_post", "save_rate_peak"), 0.0, 90.0, False),
+    "購入前の貯蓄額（万円/年）": (("save_amt_pre",), 0.0, 2000.0, False),
+    "購入後の貯蓄額（万円/年）": (("save_amt_post",), 0.0, 2000.0, False),
+    "住宅 購入価格（万円）": (("house_price",), 0.0, 30000.0, True),
+    "頭金（万円）": (("down_payment",), 0.0, 10000.0, False),
+}
+
+
+def evaluate_goals(params: dict, keys, xs, min_net_worth=None, fin_nonnegative=False,
+                   min_free_month=None):
+    """xs の各値を keys に入れたシナリオをまとめて計算し、(目標を満たすか, 最終総資産) を返す"""
+    p = resolve_params(params)
+    table = {k: [v] * len(xs) for k, v in p.items()}
+    for key in keys:
+        table[key] = np.asarray(xs, dtype=float)
+    fields = ["net_worth"]
+    if fin_nonnegative:
+        fields.append("fin_asset")
+    if min_free_month is not None:
+        fields.append("free_month")
+    res = simulate_batch(table, fields=fields)
+
+    final_net_worth = res["net_worth"][:, -1]
+    ok = np.ones(len(xs), dtype=bool)
+    if min_net_worth is not None:
+        ok &= final_net_worth >= min_net_worth
+    if fin_nonnegative:
+        ok &= np.nanmin(res["fin_asset"], axis=1) >= 0
+    if min_free_month is not None:
+        ok &= np.nanmin(res["free_month"], axis=1) >= min_free_month
+    return ok, final_net_worth
+
+def goal_seek(params: dict, keys, lo: float, hi: float, maximize: bool = False,
+              grid: int = 64, tol: float = 0.1, max_rounds: int = 6, **goals):
+    """目標（goals は evaluate_goals のキーワード）を満たす最小/最大の x を探す
+
+    戻り値は {"value": x, "net_worth": そのときの最終総資産, "evaluations": 計算したシナリオ数}。
+    探索範囲内に目標を満たす x が無ければ value は None。
+    非単調な場合も、グリッド上で最も端の解から境界を絞り込む。
+    """
+    evaluations = 0
+    best = None
+    for _ in range(max_rounds):
+        xs = np.linspace(lo, hi, grid)
+        ok, net_worth = evaluate_goals(params, keys, xs, **goals)
+        evaluations += len(xs)
+        idx = np.flatnonzero(ok)
+        if idx.size == 0:
+            break
+        i = idx[-1] if maximize else idx[0]
+        best = (xs[i], net_worth[i])
+        # 解と、その外側で目標を満たさない隣の点の間を次の探索区間にする
+        j = i + 1 if maximize else i - 1
+        if not 0 <= j < grid or xs[1] - xs[0] <= tol:
+            break
+        lo, hi = sorted((xs[i], xs[j]))
+    if best is None:
+        return {"value": None, "net_worth": None, "evaluations": evaluations}
+    return {"value": float(best[0]), "net_worth": float(best[1]), "evaluations": evaluations}
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""2 パラメータのグリッド掃引（ヒートマップ用）
+
+x × y の全セルを engine.simulate_batch の 1 回の呼び出しで計算する。
+GridCache はセル単位で結果を保持し、範囲を動かしたときは未計算のセルだけを計算する。
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+
+from engine import PARAM_LABELS, params_key, resolve_params, simulate_batch
+
+# ヒートマップに出せる指標（内部名 → 表示名）
+SWEEP_METRICS = {
+    "final_net_worth": "最終総資産（万円）",
+    "first_negative_age": "金融資産が初めてマイナスになる年齢",
+}
+
+
+def evaluate_cells(params: dict, x_key: str, xs, y_key: str, ys) -> dict:
+    """(xs[i], ys[i]) の組をまとめて計算し、指標ごとの 1 次元配列を返す"""
+    p = resolve_params(params)
+    n = len(xs)
+    table = {k: [v] * n for k, v in p.items()}
+    table[x_key] = np.asarray(xs, dtype=float)
+    table[y_key] = np.asarray(ys, dtype=float)
+    res = simulate_batch(table, fields=["net_worth", "fin_asset"])
+    negative = res["fin_asset"] < 0
+    first_neg = np.where(negative.any(axis=1), res["age"][negative.argmax(axis=1)], np.nan)
+    return {
+        "final_net_worth": res["net_worth"][:, -1] if n else np.empty(0),
+        "first_negative_age": first_neg if n else np.empty(0),
+    }
+
+def grid_frame(x_key: str, xs, y_key: str, ys, values: dict) -> pd.DataFrame:
+    """グリッドの計算結果を Altair 用のロング形式にする"""
+    d = pd.DataFrame({PARAM_LABELS[x_key]: xs, PARAM_LABELS[y_key]: ys})
+    for metric, label in SWEEP_METRICS.items():
+        d[label] = values[metric]
+    return d
+
+
+class GridCache:
+    """(基準パラメータ, x 軸, y 軸) ごとにセルの計算結果を保持する
+
+    基準パラメータの組み合わせは LRU で maxsize 個まで、1 組あたりのセルも LRU で max_cells 個まで。
+    """
+
+    def __init__(self, maxsize: int = 16, max_cells: int = 200_000):
+        self._grids = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.max_cells = max_cells
+        self.computed_cells = 0
+        self.reused_cells = 0
+
+    def sweep(self, params: dict, x_key: str, x_values, y_key: str, y_values) -> pd.DataFrame:
+        """x_values × y_values の全セルの指標を返す（未計算のセルだけを一括計算）"""
+        if x_key == y_key:
+            raise ValueError("x 軸と y 軸には別のパラメータを指定してください")
+        # 軸のパラメータ自体は基準から外してキーにする（範囲を動かしてもセルを再利用する）
+        base = {k: v for k, v in params.items() if k not in (x_key, y_key)}
+        key = (params_key(base), x_key, y_key)
+        X, Y = np.meshgrid(np.asarray(x_values, dtype=float), np.asarray(y_values, dtype=float))
+        xs, ys = X.ravel(), Y.ravel()
+        cells = list(zip(xs.round(9).tolist(), ys.round(9).tolist()))
+
+        with self._lock:
+            grid = self._grids.get(key)
+            if grid is None:
+                grid = LRUCache(maxsize=self.max_cells)
+                self._grids[key] = grid
+            # 見つかった値はここで取り出しておく（新しいセルの追加で破棄されても使えるように）
+            found = [grid.get(c) for c in cells]
+        missing = [i for i, row in enumerate(found) if row is None]
+
+        if missing:
+            idx = np.asarray(missing)
+            new = evaluate_cells(base, x_key, xs[idx], y_key, ys[idx])
+            rows = zip(new["final_net_worth"].tolist(), new["first_negative_age"].tolist())
+            with self._lock:
+                for i, row in zip(missing, rows):
+                    grid[cells[i]] = found[i] = row
+                self.computed_cells += len(missing)
+                self.reused_cells += len(cells) - len(missing)
+        else:
+            with self._lock:
+                self.reused_cells += len(cells)
+
+        stacked = np.array(found, dtype=float).reshape(len(cells), 2)
+        values = dict(zip(SWEEP_METRICS, stacked.T))
+        return grid_frame(x_key, xs, y_key, ys, values)
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""グラフのスペックのキャッシュ（python -m pytest tests）"""
+from charts import series_spec
+
+
+def test_series_spec_returns_independent_copies():
+    spec = series_spec("資産の推移", "資産項目", "金額（万円）")
+    spec["encoding"]["x"]["title"] = "書き換え"
+    spec["params"].clear()
+    fresh = series_spec("資産の推移", "資産項目", "金額（万円）")
+    assert fresh["encoding"]["x"]["title"] == "年齢"
+    assert fresh["params"]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""cli の出力先の重なりの検出（python -m pytest tests）"""
+import pytest
+
+import cli
+
+
+def _write(path, text="{}"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("names", [("a/x.json", "b/x.json"), ("x.json", "x.csv")])
+def test_colliding_outputs_fail_before_writing(tmp_path, capsys, names):
+    files = [_write(tmp_path / name) for name in names]
+    out_dir = tmp_path / "out"
+    with pytest.raises(SystemExit) as exc:
+        cli.main([*files, "-o", str(out_dir), "-f", "parquet", "-j", "1"])
+    assert exc.value.code == 2
+    assert not out_dir.exists()
+    err = capsys.readouterr().err
+    assert all(path in err for path in files)
+
+
+def test_distinct_outputs(tmp_path):
+    files = [_write(tmp_path / "a" / "x.json"), _write(tmp_path / "b" / "y.toml", "")]
+    out_dir = tmp_path / "out"
+    assert cli.main([*files, "-o", str(out_dir), "-j", "1"]) == 0
+    assert sorted(p.name for p in out_dir.iterdir()) == ["x.csv", "y.csv"]
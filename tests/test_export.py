@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""write_batch_parquet の書き出しとメタデータ（python -m pytest tests）"""
+import pandas as pd
+import pyarrow.parquet as pq
+
+from engine import COLUMNS
+from export import SCENARIO_FIELD, read_params, write_batch_parquet
+
+
+def test_header_only_table_writes_empty_file(tmp_path):
+    path = tmp_path / "empty.parquet"
+    rows = write_batch_parquet(path, pd.DataFrame(columns=["house_price", "invest_return"]), ["net_worth"])
+    assert rows == 0
+    table = pq.read_table(path)
+    assert table.num_rows == 0
+    assert table.column_names == [SCENARIO_FIELD, COLUMNS["age"][0], COLUMNS["net_worth"][0]]
+    meta = read_params(table.schema)
+    assert meta["steps_per_year"] == 1
+    assert "scenarios" not in meta
+
+
+def test_metadata_has_varying_params_and_steps(tmp_path):
+    path = tmp_path / "batch.parquet"
+    table = pd.DataFrame({"house_price": [3000.0, 4000.0], "invest_return": [3.0, 3.0]})
+    rows = write_batch_parquet(path, table, ["net_worth"])
+    assert rows == pq.read_metadata(path).num_rows > 0
+    meta = read_params(pq.read_schema(path))
+    assert meta["steps_per_year"] == 1
+    assert meta["params"]["invest_return"] == 3.0
+    assert meta["scenarios"] == {"house_price": [3000.0, 4000.0]}
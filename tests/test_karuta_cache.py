@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""AudioCache の書き込み・破棄・数え直し（python -m pytest tests）"""
+import os
+import time
+
+import pytest
+
+import karuta_tts
+from karuta_tts import STALE_TMP_SECONDS, AudioCache, StubBackend, audio_key
+
+TEXTS = ["札A", "札B", "札C", "札D", "札E"]   # 同じ長さ（スタブの音声は同じサイズ）
+
+
+@pytest.fixture
+def backend():
+    return StubBackend(frames_per_char=10)
+
+@pytest.fixture
+def entry_size():
+    return len(StubBackend(frames_per_char=10).synthesize(TEXTS[0], "ja", False))
+
+
+def _path(cache, text):
+    return cache._path(audio_key(text, "ja", False, StubBackend.name), "wav")
+
+def _age(path, seconds):
+    """ファイルの mtime を seconds 秒前にする"""
+    t = time.time() - seconds
+    os.utime(path, (t, t))
+
+def _disk_files(directory):
+    return sorted(name for _, _, names in os.walk(directory) for name in names)
+
+def _disk_bytes(directory):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(directory) for name in names)
+
+
+def test_evicts_least_recently_used(tmp_path, backend, entry_size):
+    cache = AudioCache(str(tmp_path), max_bytes=2 * entry_size)
+    a, b, c = TEXTS[:3]
+    cache.get_or_synthesize(backend, a, "ja", False)
+    cache.get_or_synthesize(backend, b, "ja", False)
+    _age(_path(cache, a), 300)
+    _age(_path(cache, b), 200)
+    cache.get_or_synthesize(backend, a, "ja", False)   # メモリから返す（a が最後に使ったものになる）
+    cache.get_or_synthesize(backend, c, "ja", False)
+    assert os.path.exists(_path(cache, a))
+    assert not os.path.exists(_path(cache, b))
+    assert os.path.exists(_path(cache, c))
+    assert cache.get(audio_key(b, "ja", False, StubBackend.name)) is None   # メモリからも消える
+    assert backend.calls == 3
+
+
+def test_memory_hit_refreshes_mtime(tmp_path, backend):
+    cache = AudioCache(str(tmp_path))
+    cache.get_or_synthesize(backend, TEXTS[0], "ja", False)
+    path = _path(cache, TEXTS[0])
+    _age(path, 3600)
+    cache.get(audio_key(TEXTS[0], "ja", False, StubBackend.name))
+    assert cache.memory_hits == 1
+    assert time.time() - os.path.getmtime(path) < 60
+
+
+def test_put_is_atomic(tmp_path, backend, monkeypatch):
+    cache = AudioCache(str(tmp_path))
+    audio = cache.get_or_synthesize(backend, TEXTS[0], "ja", False)
+    with open(_path(cache, TEXTS[0]), "rb") as f:
+        assert f.read() == audio.data
+    assert _disk_files(tmp_path) == [os.path.basename(_path(cache, TEXTS[0]))]   # 一時ファイルは残らない
+
+    def fail(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(karuta_tts.os, "replace", fail)
+    with pytest.raises(OSError):
+        cache.get_or_synthesize(backend, TEXTS[1], "ja", False)
+    assert not os.path.exists(_path(cache, TEXTS[1]))
+    assert _disk_files(tmp_path) == [os.path.basename(_path(cache, TEXTS[0]))]
+
+
+def test_rescan_counts_other_writers(tmp_path, backend, entry_size, monkeypatch):
+    max_bytes = 3 * entry_size
+    mine = AudioCache(str(tmp_path), max_bytes=max_bytes, rescan_interval=30.0)
+    other = AudioCache(str(tmp_path), max_bytes=max_bytes, rescan_interval=30.0)   # 別のプロセスの代わり
+    mine.get_or_synthesize(backend, TEXTS[0], "ja", False)
+    for text in TEXTS[1:4]:
+        other.get_or_synthesize(backend, text, "ja", False)
+    # 自分の見積もりは自分の書いた分だけなので、数え直すまでは合計の上限を超えたまま
+    mine.get_or_synthesize(backend, TEXTS[4], "ja", False)
+    assert _disk_bytes(tmp_path) > max_bytes
+
+    now = time.monotonic()
+    monkeypatch.setattr(karuta_tts.time, "monotonic", lambda: now + 31.0)
+    mine.get_or_synthesize(backend, "札F", "ja", False)
+    assert _disk_bytes(tmp_path) <= max_bytes
+
+
+def test_evict_removes_stale_tmp_files(tmp_path, backend):
+    cache = AudioCache(str(tmp_path))
+    cache.get_or_synthesize(backend, TEXTS[0], "ja", False)
+    folder = os.path.dirname(_path(cache, TEXTS[0]))
+    stale, fresh = os.path.join(folder, "crashed.tmp"), os.path.join(folder, "writing.tmp")
+    for path in (stale, fresh):
+        with open(path, "wb") as f:
+            f.write(b"partial")
+    _age(stale, STALE_TMP_SECONDS + 60)
+    cache.evict()
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)   # 書き込み中かもしれないので残す
+    assert os.path.exists(_path(cache, TEXTS[0]))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""AudioServer の音声の URL と配信（python -m pytest tests）"""
+import logging
+import urllib.request
+
+import pytest
+
+from karuta_media import CACHE_CONTROL, MEDIA_URL_ENV, AudioServer
+from karuta_tts import AudioCache, StubBackend, audio_key
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.delenv(MEDIA_URL_ENV, raising=False)
+    server = AudioServer(AudioCache(str(tmp_path)), host="127.0.0.1", port=0)
+    yield server
+    server.close()
+
+
+def test_direct_url_is_http_on_media_port(server):
+    url = server.url("ab" * 32, {"Host": "example.com:8501", "Origin": "http://example.com:8501"},
+                     "http://example.com:8501/")
+    assert url == f"http://example.com:{server.port}/audio/{'ab' * 32}"
+
+
+def test_proxied_request_falls_back_to_data_url(server, caplog):
+    headers = {"Host": "karuta.example.com", "X-Forwarded-Proto": "https", "X-Forwarded-For": "203.0.113.1"}
+    with caplog.at_level(logging.WARNING, logger="karuta_media"):
+        assert server.url("ab" * 32, headers) is None
+        assert server.url("cd" * 32, headers) is None
+    assert len(caplog.records) == 1
+    assert MEDIA_URL_ENV in caplog.records[0].getMessage()
+
+
+@pytest.mark.parametrize("headers, page_url", [
+    ({"Host": "karuta.example.com:8501"}, "https://karuta.example.com:8501/"),
+    ({"Host": "karuta.example.com:8501", "Origin": "https://karuta.example.com:8501"}, None),
+])
+def test_https_page_falls_back_to_data_url(server, headers, page_url):
+    assert server.url("ab" * 32, headers, page_url) is None
+
+
+def test_https_page_uses_public_url(server, monkeypatch):
+    monkeypatch.setenv(MEDIA_URL_ENV, "https://media.example.com")
+    url = server.url("ab" * 32, {"Host": "karuta.example.com:8501"}, "https://karuta.example.com:8501/")
+    assert url == f"https://media.example.com/audio/{'ab' * 32}"
+
+
+def test_proxied_request_uses_public_url(server, monkeypatch):
+    monkeypatch.setenv(MEDIA_URL_ENV, "https://karuta.example.com/media/")
+    headers = {"Host": "karuta.example.com", "X-Forwarded-Proto": "https"}
+    assert server.url("ab" * 32, headers) == f"https://karuta.example.com/media/audio/{'ab' * 32}"
+
+
+def test_serves_cached_audio(server, tmp_path):
+    cache = AudioCache(str(tmp_path))
+    key = audio_key("札", "ja", False, StubBackend.name)
+    audio = cache.get_or_synthesize(StubBackend(), "札", "ja", False)
+    with urllib.request.urlopen(server.url(key, {"Host": "127.0.0.1"})) as resp:
+        assert resp.read() == audio.data
+        assert resp.headers["Cache-Control"] == CACHE_CONTROL
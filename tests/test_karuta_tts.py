@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""SynthesisPool の合成の順番（python -m pytest tests）"""
+import threading
+
+from karuta_tts import PRIORITY_NEXT, AudioCache, StubBackend, SynthesisPool
+
+
+class GatedBackend(StubBackend):
+    """gate が開くまで合成を止め（止まったら started を立てる）、合成した順を記録する"""
+
+    name = "gated"
+
+    def __init__(self):
+        super().__init__(frames_per_char=1)
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.order = []
+
+    def synthesize(self, text, lang, slow):
+        self.started.set()
+        assert self.gate.wait(5)
+        self.order.append(text)
+        return super().synthesize(text, lang, slow)
+
+
+def _pool(tmp_path):
+    backend = GatedBackend()
+    return SynthesisPool(AudioCache(str(tmp_path)), backend, max_workers=1), backend
+
+def _warm_deck(pool, backend, deck):
+    """deck を warm し、1 本だけのスレッドが先頭の札で止まるまで待つ（残りは待ち行列）"""
+    warmup = pool.warm(deck, "ja", False)
+    assert backend.started.wait(5)
+    return warmup
+
+
+def test_prefetch_finishes_before_rest_of_deck(tmp_path):
+    pool, backend = _pool(tmp_path)
+    deck = [f"札{i}" for i in range(20)]
+    warmup = _warm_deck(pool, backend, deck)
+    nxt = pool.warm([deck[-1]], "ja", False, PRIORITY_NEXT)
+    backend.gate.set()
+    nxt.futures[0].result(timeout=5)
+    for f in warmup.futures:
+        f.result(timeout=5)
+    assert backend.order == [deck[0], deck[-1], *deck[1:-1]]
+
+
+def test_get_runs_before_prefetch(tmp_path):
+    pool, backend = _pool(tmp_path)
+    deck = [f"札{i}" for i in range(10)]
+    warmup = _warm_deck(pool, backend, deck)
+    pool.warm(["次1", "次2"], "ja", False, PRIORITY_NEXT)
+    threading.Timer(0.05, backend.gate.set).start()
+    pool.get("今", "ja", False)
+    for f in warmup.futures:
+        f.result(timeout=5)
+    assert backend.order == [deck[0], "今", "次1", "次2", *deck[1:]]
+
+
+def test_rewarm_follows_new_order(tmp_path):
+    pool, backend = _pool(tmp_path)
+    deck = [f"札{i}" for i in range(10)]
+    _warm_deck(pool, backend, deck)
+    warmup = pool.warm(deck[::-1], "ja", False)   # シャッフルし直し
+    backend.gate.set()
+    for f in warmup.futures:
+        f.result(timeout=5)
+    assert backend.order == [deck[0], *deck[:0:-1]]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Profiler の cProfile の後始末（python -m pytest tests）"""
+import sys
+import threading
+
+import profiling
+from profiling import Profiler
+
+
+def _aborted_run():
+    """st.rerun などで finish() の前に抜けた回"""
+    try:
+        Profiler(True, True)
+        raise RuntimeError
+    except RuntimeError:
+        pass
+
+
+def test_rerun_stops_abandoned_cprofile():
+    result = {}
+
+    def script_thread():   # Streamlit は同じスクリプトスレッドで続けて再実行する
+        _aborted_run()
+        result["abandoned"] = dict(profiling._unfinished)
+        result["run"] = Profiler(True, True).finish()
+        result["after"] = (sys.getprofile(), dict(profiling._unfinished))
+
+    t = threading.Thread(target=script_thread)
+    t.start()
+    t.join()
+    assert list(result["abandoned"]) == [t]
+    assert result["run"].profile is not None
+    assert result["after"] == (None, {})
+
+
+def test_ended_thread_cprofile_is_stopped():
+    t = threading.Thread(target=_aborted_run)
+    t.start()
+    t.join()
+    assert t in profiling._unfinished
+    Profiler(True, True).finish()
+    assert profiling._unfinished == {}
+    assert sys.getprofile() is None
+
+
+def test_finish_stops_cprofile():
+    profiler = Profiler(True, True)
+    profiler.lap("区間")
+    run = profiler.finish()
+    assert sys.getprofile() is None
+    assert set(run.spans) == {"区間", "その他"}
+    assert profiler.finish() is None
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""感度分析の動かし方（python -m pytest tests）"""
+from engine import PARAM_RANGES
+from sensitivity import perturbed_value, tornado
+
+
+def test_zero_moves_by_range_width():
+    lo, hi = PARAM_RANGES["land_appreciation"]
+    step = (hi - lo) * 0.1
+    assert perturbed_value("land_appreciation", 0.0, 10.0, -1) == -step
+    assert perturbed_value("land_appreciation", 0.0, 10.0, +1) == step
+
+
+def test_clipped_to_range():
+    assert perturbed_value("raise_rate", 9.5, 10.0, +1) == PARAM_RANGES["raise_rate"][1]
+    assert perturbed_value("house_age", 26.0, 50.0, -1) == PARAM_RANGES["house_age"][0]
+    assert perturbed_value("mortgage_rate", 1.0, 10.0, -1) == 0.9
+
+
+def test_tornado_moves_zero_valued_params():
+    row = tornado({"land_appreciation": 0.0}, keys=["land_appreciation"]).iloc[0]
+    assert row["下側の値"] < 0 < row["上側の値"]
+    assert row["最終総資産 振れ幅"] > 0